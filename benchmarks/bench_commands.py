@@ -0,0 +1,143 @@
+"""Drive cog commands end to end against the stub API with fake Discord objects.
+
+For each scenario reports wall time of the first (cold) and later (warm) runs,
+API requests and Discord REST calls per run, and peak traced memory of one run.
+
+Usage: python benchmarks/bench_commands.py [--iterations 5] [--latency 0.005]
+       [--discord-latency 0.0] [--scenario mypicks] [--event-stream]
+Requires Red-DiscordBot and aiohttp.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from harness import BenchEnv, invoke
+from stub_api import Faults, StubData
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+@scenario("idleuser register")
+async def register(env, i):
+    member = env.member(10000 + i, registered=False)
+    await invoke(env.cog("IdleUser"), "register", env.ctx(member, "!register"))
+
+
+@scenario("idleuser login")
+async def login(env, i):
+    await invoke(env.cog("IdleUser"), "login", env.ctx(env.member(1), "!login"))
+
+
+@scenario("pickem mypicks (50 prompts)")
+async def mypicks(env, i):
+    await invoke(env.cog("Pickem"), "mypicks", env.ctx(env.member(1), "!mypicks"))
+
+
+@scenario("pickem pickem-stats")
+async def pickem_stats(env, i):
+    await invoke(env.cog("Pickem"), "pickem-stats", env.ctx(env.member(2), "!pickem-stats"))
+
+
+@scenario("watchwrestling leaderboard")
+async def leaderboard(env, i):
+    await invoke(env.cog("Matches"), "leaderboard", env.ctx(env.member(3), "!leaderboard"))
+
+
+@scenario("watchwrestling stats")
+async def stats(env, i):
+    await invoke(env.cog("Matches"), "stats", env.ctx(env.member(3), "!stats"))
+
+
+@scenario("watchwrestling bet (confirmed)")
+async def bet(env, i):
+    superstar = env.data.matches[max(env.data.matches)]["team_list"][0]["members"].split(" & ")[0]
+    # each run raises the previous bet, since bets can only be increased
+    await invoke(env.cog("Matches"), "bet", env.ctx(env.member(4), "!bet"), str(100 * (i + 1)),
+                 superstar_name=superstar)
+
+
+@scenario("watchwrestling multibet (4 matches)")
+async def multibet(env, i):
+    open_matches = [match for match in env.data.matches.values() if match["bet_open"]][:4]
+    pairs = " ".join(
+        "{}:{}".format(100 * (i + 1), match["team_list"][1]["members"].split(" & ")[1]) for match in open_matches
+    )
+    await invoke(env.cog("Matches"), "multibet", env.ctx(env.member(5), "!multibet"), bets=pairs)
+
+
+@scenario("watchwrestling bets")
+async def bets(env, i):
+    await invoke(env.cog("Matches"), "bets", env.ctx(env.member(4), "!bets"))
+
+
+@scenario("userlist 30 concurrent joins")
+async def userlist_join(env, i):
+    userlist = env.cog("UserList")
+    owner = env.member(1)
+    await invoke(userlist, "userlist-create", env.ctx(owner, "!userlist-create"), "Queue", "Join up", 30, "blue")
+    await asyncio.gather(
+        *(
+            invoke(userlist, "userlist-join", env.ctx(env.member(100 + n), "!userlist-join"), comment="entry {}".format(n))
+            for n in range(30)
+        )
+    )
+
+
+@scenario("easyembed")
+async def easyembed(env, i):
+    await invoke(env.cog("EasyEmbed"), "easyembed", env.ctx(env.member(1), "!easyembed"), "Title", "Body", "Footer",
+                 "blue")
+
+
+async def measure(env, func, iterations):
+    timings = []
+    api_before, discord_before = env.api_requests(), env.discord_requests()
+    for i in range(iterations):
+        started = time.perf_counter()
+        await func(env, i)
+        timings.append(time.perf_counter() - started)
+    api_calls = (env.api_requests() - api_before) / iterations
+    discord_calls = (env.discord_requests() - discord_before) / iterations
+    tracemalloc.start()
+    await func(env, iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, api_calls, discord_calls, peak
+
+
+async def run(args):
+    data = StubData(users=300, prompts=50, picks_per_prompt=300, matches=30)
+    faults = Faults(latency=args.latency)
+    async with BenchEnv(data, faults, discord_latency=args.discord_latency, event_stream=args.event_stream) as env:
+        print("{:<34} {:>9} {:>9} {:>8} {:>9} {:>10}".format(
+            "scenario", "cold ms", "warm ms", "api/run", "disc/run", "peak KiB"))
+        for name, func in SCENARIOS.items():
+            if args.scenario and args.scenario not in name:
+                continue
+            timings, api_calls, discord_calls, peak = await measure(env, func, args.iterations)
+            warm = timings[1:] or timings
+            print("{:<34} {:9.1f} {:9.1f} {:8.1f} {:9.1f} {:10.1f}".format(
+                name, timings[0] * 1000, sum(warm) / len(warm) * 1000, api_calls, discord_calls, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub API latency in seconds")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="fake Discord REST latency in seconds")
+    parser.add_argument("--scenario", help="only run scenarios whose name contains this")
+    parser.add_argument("--event-stream", action="store_true", help="subscribe the cogs to the stub's event stream")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare building embeds with set_author/set_footer calls against quickembed templates.
+
+Usage: python benchmarks/bench_quickembed.py [embeds]
+Requires discord.py.
+"""
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pickem.utils import quickembed  # noqa: E402
+
+
+def filler_embed(color_value, desc, footer, user):
+    # the per-call construction quickembed used before templates
+    embed = discord.Embed(color=color_value)
+    if user:
+        if user.discord.bot:
+            embed.set_author(name=desc, icon_url=user.discord.display_avatar)
+        elif user.is_registered:
+            embed.set_author(
+                name="{0.discord.display_name} ({0.username})".format(user),
+                icon_url=user.discord.display_avatar,
+                url=user.url,
+            )
+        else:
+            embed.set_author(name=user.discord, icon_url=user.discord.display_avatar)
+            embed.set_footer(text="User not registered.")
+        embed.description = desc
+        if footer:
+            embed.set_footer(text=footer)
+    else:
+        embed.set_author(name="Notification")
+    embed.description = desc
+    return embed
+
+
+def make_user():
+    member = SimpleNamespace(
+        bot=False,
+        display_name="Display Name",
+        display_avatar="https://cdn.discordapp.com/avatars/1/abc.png",
+    )
+    return SimpleNamespace(
+        discord=member,
+        username="username",
+        is_registered=True,
+        url="https://idleuser.com/projects/matches/user?user_id=1",
+    )
+
+
+def main():
+    embeds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    user = make_user()
+
+    def with_filler():
+        for i in range(embeds):
+            filler_embed(quickembed.color["green"], "Pick Added", "footer", user)
+
+    def with_template():
+        for i in range(embeds):
+            quickembed.success("Pick Added", footer="footer", user=user)
+
+    print("{} embeds".format(embeds))
+    for name, func in [("set_author/set_footer", with_filler), ("quickembed template", with_template)]:
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print("{:<24} {:8.2f} ms  {:6.2f} us/embed".format(name, best * 1000, best / embeds * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure how long each cog takes to import and to load, as Red would load it.
+
+Import time is the median of fresh interpreters importing the cog package after
+the modules Red itself has already imported. Load time is the median of the
+package's `setup(bot)` call, which is what holds up Red's `[p]load` and startup.
+Ready time is until the cog's deferred startup work, if it has any, is done.
+
+Usage: python benchmarks/bench_startup.py [--iterations 10] [--cog pickem]
+Requires Red-DiscordBot and aiohttp.
+"""
+import argparse
+import asyncio
+import importlib
+import statistics
+import subprocess
+import sys
+import time
+
+from harness import ROOT, BenchEnv
+
+PACKAGES = {
+    "easyembed": "EasyEmbed",
+    "idleuser": "IdleUser",
+    "pickem": "Pickem",
+    "userlist": "UserList",
+    "watchwrestling": "Matches",
+}
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+import aiohttp, discord, redbot.core.bot, redbot.core.commands, redbot.core.data_manager
+started = time.perf_counter()
+import {package}
+print(time.perf_counter() - started)
+"""
+
+
+def import_time(package, iterations):
+    timings = []
+    for _ in range(iterations):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(root=str(ROOT), package=package)],
+            capture_output=True, text=True, check=True,
+        )
+        timings.append(float(result.stdout.strip()))
+    return statistics.median(timings)
+
+
+async def load_times(env, package, cog_name, iterations):
+    module = importlib.import_module(package)
+    loads, readies = [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await module.setup(env.bot)
+        loads.append(time.perf_counter() - started)
+        warm_up_task = getattr(env.cog(cog_name), "warm_up_task", None)
+        if warm_up_task is not None:
+            await warm_up_task
+        readies.append(time.perf_counter() - started)
+        await env.bot.remove_cog(cog_name)
+    return statistics.median(loads), statistics.median(readies)
+
+
+async def run(args):
+    packages = [package for package in PACKAGES if not args.cog or args.cog in package]
+    async with BenchEnv(cogs=()) as env:
+        print("{:<16} {:>10} {:>10} {:>10}".format("cog", "import ms", "load ms", "ready ms"))
+        for package in packages:
+            imported = import_time(package, args.iterations)
+            load, ready = await load_times(env, package, PACKAGES[package], args.iterations)
+            print("{:<16} {:10.2f} {:10.2f} {:10.2f}".format(package, imported * 1000, load * 1000, ready * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--cog", help="only measure packages whose name contains this")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare Prompt expiry parsing with strptime against utils.timestamps.
+
+Usage: python benchmarks/bench_timestamps.py [prompts] [distinct timestamps]
+"""
+import importlib.util
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def load_timestamps_module():
+    # load the module by path so the cog package (and discord) is not imported
+    spec = importlib.util.spec_from_file_location("timestamps", ROOT / "pickem" / "utils" / "timestamps.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_expirations(prompts, distinct):
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    pool = [(start + timedelta(minutes=15 * i)).strftime("%Y-%m-%d %H:%M:%S") for i in range(distinct)]
+    return [random.choice(pool) for _ in range(prompts)]
+
+
+def main():
+    prompts = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    timestamps = load_timestamps_module()
+    expirations = make_expirations(prompts, distinct)
+
+    def with_strptime():
+        for value in expirations:
+            int(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp())
+
+    def with_timestamp_epoch_cold():
+        timestamps.parse_timestamp.cache_clear()
+        timestamps.timestamp_epoch.cache_clear()
+        for value in expirations:
+            timestamps.timestamp_epoch(value)
+
+    def with_timestamp_epoch_warm():
+        for value in expirations:
+            timestamps.timestamp_epoch(value)
+
+    print("{} prompts, {} distinct expirations".format(prompts, distinct))
+    for name, func in [
+        ("strptime", with_strptime),
+        ("timestamp_epoch (cold memo)", with_timestamp_epoch_cold),
+        ("timestamp_epoch (warm memo)", with_timestamp_epoch_warm),
+    ]:
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print("{:<30} {:8.2f} ms  {:6.2f} us/prompt".format(name, best * 1000, best / prompts * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Fake Discord objects and a local environment for driving the cogs' commands.
+
+Commands run against the stub API (stub_api.py) with a temporary Red data folder.
+Every Discord REST call the fake objects make goes through `FakeHTTP.request`,
+which counts it, so the cogs' Discord timing sees it too.
+"""
+import asyncio
+import itertools
+import sys
+import tempfile
+from collections import Counter, deque
+from pathlib import Path
+
+import discord
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_api import DISCORD_ID_BASE, Faults, StubData, make_app, serve  # noqa: E402
+
+snowflakes = itertools.count(900000000000000000)
+
+
+class FakeHTTP:
+    """Stands in for the bot's HTTP client; counts REST calls by name."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def request(self, name, *args, **kwargs):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeMember:
+    def __init__(self, bot, member_id, name, is_bot=False):
+        self.bot_client = bot
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.discriminator = "0"
+        self.bot = is_bot
+        self.display_avatar = "https://cdn.discordapp.com/embed/avatars/{}.png".format(member_id % 5)
+        self.mention = "<@{}>".format(member_id)
+        self.dm_channel = None
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def send(self, content=None, **kwargs):
+        if self.dm_channel is None:
+            self.dm_channel = FakeChannel(self.bot_client, None, "dm-{}".format(self.name))
+        return await self.dm_channel.send(content, **kwargs)
+
+
+class FakeReaction:
+    def __init__(self, message, emoji, count=1):
+        self.message = message
+        self.emoji = emoji
+        self.count = count
+
+    def __str__(self):
+        return str(self.emoji)
+
+
+class FakeMessage:
+    def __init__(self, bot, channel, author, content=None, embed=None, embeds=None):
+        self.bot = bot
+        self.id = next(snowflakes)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds or ([embed] if embed else []))
+        self.reactions = []
+        # who the bot was answering when it sent this, for scripted reactions
+        self.requested_by = None
+        self.jump_url = "https://discord.com/channels/{}/{}/{}".format(
+            channel.guild.id if channel.guild else "@me", channel.id, self.id
+        )
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await self.bot.http.request("edit_message")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def add_reaction(self, emoji):
+        await self.bot.http.request("add_reaction")
+        for reaction in self.reactions:
+            if str(reaction.emoji) == str(emoji):
+                reaction.count += 1
+                break
+        else:
+            self.reactions.append(FakeReaction(self, emoji))
+        if self.author == self.bot.user:
+            self.bot.reaction_messages.append(self)
+
+    async def remove_reaction(self, emoji, member):
+        await self.bot.http.request("remove_reaction")
+
+    async def clear_reactions(self):
+        await self.bot.http.request("clear_reactions")
+        self.reactions = []
+
+    async def clear_reaction(self, emoji):
+        await self.bot.http.request("clear_reaction")
+
+    async def delete(self, *, delay=None):
+        await self.bot.http.request("delete_message")
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name="Benchmark Guild"):
+        self.id = guild_id
+        self.name = name
+
+
+class FakeChannel:
+    def __init__(self, bot, guild, name="general"):
+        self.bot = bot
+        self.id = next(snowflakes)
+        self.guild = guild
+        self.name = name
+        self.mention = "<#{}>".format(self.id)
+        self.messages = {}
+
+    async def send(self, content=None, *, embed=None, delete_after=None, **kwargs):
+        await self.bot.http.request("send_message")
+        message = FakeMessage(self.bot, self, self.bot.user, content=content, embed=embed)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.bot.http.request("fetch_message")
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            raise discord.NotFound(FakeResponse(404), "Unknown Message")
+
+    async def history(self, limit=100, before=None, oldest_first=False):
+        await self.bot.http.request("channel_history")
+        messages = sorted(self.messages.values(), key=lambda message: message.id, reverse=not oldest_first)
+        for message in messages[:limit]:
+            if before is None or message.id < before.id:
+                yield message
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.reason = "Fake"
+
+
+class FakeCommand:
+    def __init__(self, qualified_name):
+        self.qualified_name = qualified_name
+
+
+class FakeContext:
+    def __init__(self, bot, author, channel, content=""):
+        self.bot = bot
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.prefix = "!"
+        self.message = FakeMessage(bot, channel, author, content=content)
+        self.command = None
+        self.cog = None
+        self.command_failed = False
+
+    async def send(self, content=None, **kwargs):
+        message = await self.channel.send(content, **kwargs)
+        message.requested_by = self.author
+        return message
+
+    async def maybe_send_embed(self, message):
+        return await self.send(embed=discord.Embed(description=message))
+
+
+class FakeBot:
+    """Enough of a Red bot for the cogs: shared API tokens, wait_for, cog loading.
+
+    `wait_for("reaction_add")` is answered by `reaction_script`: the first emoji in
+    it that passes the check, reacted on a recent bot message by whoever the bot was
+    answering. With no match it times out at once instead of waiting.
+    """
+
+    def __init__(self, api_url, discord_latency=0.0, reaction_delay=0.0):
+        self.api_tokens = {"api_url": api_url, "auth_token": "benchmark"}
+        self.http = FakeHTTP(discord_latency)
+        self.user = FakeMember(self, next(snowflakes), "IdleBot", is_bot=True)
+        self.guilds = []
+        self.cogs = {}
+        self.reaction_script = ["✅"]
+        self.reaction_delay = reaction_delay
+        self.reaction_messages = deque(maxlen=256)
+
+    async def get_shared_api_tokens(self, service_name):
+        return dict(self.api_tokens)
+
+    async def wait_until_red_ready(self):
+        return
+
+    async def add_cog(self, cog):
+        self.cogs[cog.qualified_name] = cog
+        await discord.utils.maybe_coroutine(cog.cog_load)
+
+    async def remove_cog(self, name):
+        cog = self.cogs.pop(name)
+        await discord.utils.maybe_coroutine(cog.cog_unload)
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        if event == "reaction_add":
+            for message in reversed(self.reaction_messages):
+                for emoji in self.reaction_script:
+                    args = (FakeReaction(message, emoji), message.requested_by)
+                    if check is None or check(*args):
+                        if self.reaction_delay:
+                            await asyncio.sleep(self.reaction_delay)
+                        return args
+        raise asyncio.TimeoutError()
+
+
+async def invoke(cog, command_name, ctx, *args, **kwargs):
+    """Run a cog command's callback with the cog's invoke hooks, as Red would after parsing."""
+    command = cog.get_commands()
+    command = next(command for command in command if command.name == command_name)
+    ctx.command = FakeCommand(command.qualified_name)
+    ctx.cog = cog
+    await cog.cog_before_invoke(ctx)
+    try:
+        await command.callback(cog, ctx, *args, **kwargs)
+    except Exception:
+        ctx.command_failed = True
+        raise
+    finally:
+        await cog.cog_after_invoke(ctx)
+
+
+def use_temporary_red_data(path):
+    """Point Red's data manager at `path` with the JSON driver, as redbot-setup would."""
+    from redbot.core import data_manager
+
+    data_manager.basic_config = dict(
+        data_manager.basic_config_default, DATA_PATH=str(path), STORAGE_TYPE="JSON", STORAGE_DETAILS={}
+    )
+
+
+class BenchEnv:
+    """Stub API, fake bot and loaded cogs. Use as `async with BenchEnv(...) as env:`."""
+
+    def __init__(self, data: StubData = None, faults: Faults = None, discord_latency=0.0, reaction_delay=0.0,
+                 cogs=("IdleUser", "Pickem", "Matches", "UserList", "EasyEmbed"), upsert=True, event_stream=False):
+        self.data = data or StubData()
+        self.faults = faults
+        self.discord_latency = discord_latency
+        self.reaction_delay = reaction_delay
+        self.cog_names = cogs
+        self.upsert = upsert
+        self.event_stream = event_stream
+        self.guild = FakeGuild(next(snowflakes))
+        self.members = {}
+
+    async def __aenter__(self):
+        self.tempdir = tempfile.TemporaryDirectory(prefix="idleuser-bench-")
+        use_temporary_red_data(self.tempdir.name)
+        self.app = make_app(self.data, self.faults, upsert=self.upsert)
+        self.runner = await serve(self.app, port=0)
+        host, port = self.runner.addresses[0][:2]
+        self.bot = FakeBot("http://{}:{}/".format(host, port), self.discord_latency, self.reaction_delay)
+        if self.event_stream:
+            self.bot.api_tokens["event_stream"] = "events"
+        self.bot.guilds.append(self.guild)
+        self.channel = FakeChannel(self.bot, self.guild)
+        for cog in self.load_cogs():
+            await self.bot.add_cog(cog)
+        # cold command timings should not include the cogs' deferred startup work
+        await asyncio.gather(
+            *(cog.warm_up_task for cog in self.bot.cogs.values() if getattr(cog, "warm_up_task", None))
+        )
+        if self.event_stream:
+            await self.wait_for_event_streams()
+        return self
+
+    async def wait_for_event_streams(self, timeout=5.0):
+        """Wait until every cog with an event stream has connected to the stub's."""
+        streams = [cog.event_stream for cog in self.bot.cogs.values() if hasattr(cog, "event_stream")]
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not all(stream.connected for stream in streams):
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError("Event streams did not connect to the stub API.")
+            await asyncio.sleep(0.01)
+
+    async def __aexit__(self, *exc_info):
+        for name in list(self.bot.cogs):
+            await self.bot.remove_cog(name)
+        await self.runner.cleanup()
+        self.tempdir.cleanup()
+
+    def load_cogs(self):
+        from easyembed.easyembed import EasyEmbed
+        from idleuser.idleuser import IdleUser
+        from pickem.pickem import Pickem
+        from userlist.userlist import UserList
+        from watchwrestling.matches import Matches
+
+        classes = {"IdleUser": IdleUser, "Pickem": Pickem, "Matches": Matches, "UserList": UserList,
+                   "EasyEmbed": EasyEmbed}
+        return [classes[name](self.bot) for name in self.cog_names]
+
+    def cog(self, name):
+        return self.bot.cogs[name]
+
+    def member(self, user_id, registered=True):
+        """A guild member; registered members map to stub user `user_id`."""
+        key = (user_id, registered)
+        if key not in self.members:
+            member_id = DISCORD_ID_BASE + user_id if registered else next(snowflakes)
+            self.members[key] = FakeMember(self.bot, member_id, "member{}".format(user_id))
+        return self.members[key]
+
+    def ctx(self, member, content=""):
+        return FakeContext(self.bot, member, self.channel, content)
+
+    def api_requests(self):
+        return sum(self.app["requests"].values())
+
+    def discord_requests(self):
+        return sum(self.bot.http.calls.values())
@@ -0,0 +1,192 @@
+"""Soak `!bet` with a simulated PPV betting rush against the stub API.
+
+N users each place, then raise, bets on M open matches within a time window,
+confirming through the fake gateway. Reports throughput, tail latency, API call
+amplification and event loop lag, and appends the results as one JSON line to a
+results file so runs can be compared across versions.
+
+Usage: python benchmarks/soak_betting.py [--users 100] [--matches 8] [--bets-per-user 4]
+       [--window 10] [--latency 0.02] [--event-stream] [--results benchmarks/results/soak_betting.jsonl]
+Requires Red-DiscordBot and aiohttp.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from harness import ROOT, BenchEnv, invoke
+from stub_api import Faults, StubData
+
+# compared against the previous run with the same parameters
+COMPARED = ("throughput_per_s", "latency_ms.p95", "latency_ms.p99", "api_per_bet", "loop_lag_ms.p99")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class LagSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.monotonic() - expected))
+
+
+def first_open_match(data, superstar_name):
+    # the cog bets on the first open match naming the superstar
+    for match in data.matches.values():
+        if match["bet_open"] and match["match_type_id"] != 0 and superstar_name.lower() in match["contestants"].lower():
+            return match["id"]
+
+
+async def simulate_user(env, user_id, plan, window, rng, outcomes):
+    matches = env.cog("Matches")
+    member = env.member(user_id)
+    starts = sorted(rng.uniform(0, window) for _ in plan)
+    began = time.monotonic()
+    amounts = Counter()
+    for start, superstar_name in zip(starts, plan):
+        await asyncio.sleep(max(0.0, start - (time.monotonic() - began)))
+        match_id = first_open_match(env.data, superstar_name)
+        amounts[match_id] += 100
+        started = time.perf_counter()
+        try:
+            await invoke(matches, "bet", env.ctx(member, "!bet"), str(amounts[match_id]), superstar_name=superstar_name)
+            outcome = "ok"
+        except Exception as e:
+            outcome = type(getattr(e, "original", e)).__name__
+        outcomes.append((outcome, time.perf_counter() - started))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    data = StubData(users=args.users, matches=args.matches * 2, seed=args.seed)
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.seed)
+    async with BenchEnv(data, faults, discord_latency=args.discord_latency, reaction_delay=args.reaction_delay,
+                        cogs=("Matches",), event_stream=args.event_stream) as env:
+        open_names = [
+            team["members"].split(" & ")[0]
+            for match in data.matches.values()
+            if match["bet_open"]
+            for team in match["team_list"]
+        ]
+        sampler = LagSampler()
+        sampler_task = asyncio.create_task(sampler.run())
+        outcomes = []
+        started = time.monotonic()
+        await asyncio.gather(
+            *(
+                simulate_user(env, user_id, [rng.choice(open_names) for _ in range(args.bets_per_user)],
+                              args.window, rng, outcomes)
+                for user_id in range(1, args.users + 1)
+            )
+        )
+        duration = time.monotonic() - started
+        sampler_task.cancel()
+
+        latencies = [latency for _, latency in outcomes]
+        bets = len(outcomes)
+        api_requests = env.api_requests()
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "params": {
+                key: getattr(args, key)
+                for key in ("users", "matches", "bets_per_user", "window", "latency", "jitter", "error_rate",
+                            "rate_limit_rate", "discord_latency", "reaction_delay", "event_stream", "seed")
+            },
+            "bets": bets,
+            "outcomes": dict(Counter(outcome for outcome, _ in outcomes)),
+            "duration_s": round(duration, 3),
+            "throughput_per_s": round(bets / duration, 2),
+            "latency_ms": {
+                name: round(percentile(latencies, q) * 1000, 1)
+                for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+            },
+            "api_requests": api_requests,
+            "api_per_bet": round(api_requests / max(bets, 1), 2),
+            "api_by_route": {"{} {}".format(*key): count for key, count in sorted(env.app["requests"].items())},
+            "discord_requests": env.discord_requests(),
+            "discord_per_bet": round(env.discord_requests() / max(bets, 1), 2),
+            "loop_lag_ms": {
+                name: round(percentile(sampler.lags, q) * 1000, 2)
+                for name, q in (("p50", 0.5), ("p99", 0.99), ("max", 1.0))
+            },
+        }
+
+
+def lookup(result, dotted):
+    for key in dotted.split("."):
+        result = result[key]
+    return result
+
+
+def previous_result(path, params):
+    previous = None
+    if path.exists():
+        for line in path.read_text().splitlines():
+            if line.strip():
+                result = json.loads(line)
+                if result["params"] == params:
+                    previous = result
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--matches", type=int, default=8, help="open matches on the card")
+    parser.add_argument("--bets-per-user", type=int, default=4)
+    parser.add_argument("--window", type=float, default=10.0, help="seconds the bets are spread over")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="fake Discord REST latency in seconds")
+    parser.add_argument("--reaction-delay", type=float, default=0.0, help="seconds before a user confirms")
+    parser.add_argument("--event-stream", action="store_true", help="subscribe the cog to the stub's event stream")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--results", type=Path, default=ROOT / "benchmarks" / "results" / "soak_betting.jsonl")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    previous = previous_result(args.results, result["params"])
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with args.results.open("a") as fp:
+        fp.write(json.dumps(result) + "\n")
+
+    print("{} bets in {}s ({}/s), outcomes {}".format(
+        result["bets"], result["duration_s"], result["throughput_per_s"], result["outcomes"]))
+    print("latency ms {}  loop lag ms {}".format(result["latency_ms"], result["loop_lag_ms"]))
+    print("api/bet {}  discord/bet {}".format(result["api_per_bet"], result["discord_per_bet"]))
+    if previous:
+        print("compared with {} ({}):".format(previous["revision"], previous["timestamp"]))
+        for key in COMPARED:
+            print("  {:<20} {:>10} -> {:<10}".format(key, lookup(previous, key), lookup(result, key)))
+    print("results appended to {}".format(args.results))
+
+
+if __name__ == "__main__":
+    main()
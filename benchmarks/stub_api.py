@@ -0,0 +1,768 @@
+"""Local stand-in for api.idleuser.com serving seeded data for load and benchmark runs.
+
+Implements the users/*, pickem/* and watchwrestling/* routes the cogs call, with
+injectable latency, server errors and 429s, and a server-sent events stream at
+/events that publishes the changes the write routes make. Point the cogs at it with:
+
+    [p]set api idleuser api_url http://127.0.0.1:8080/ event_stream events
+
+Usage: python benchmarks/stub_api.py [--port 8080] [--users 200] [--prompts 50]
+       [--matches 30] [--latency 0.02] [--error-rate 0.01] [--rate-limit-rate 0.01]
+Requires aiohttp. `make_app()` builds the same server for use in-process.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import secrets
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# discord ids of seeded users are DISCORD_ID_BASE + user id
+DISCORD_ID_BASE = 100000000000000000
+SEASON = 7
+STARTING_POINTS = 10000
+
+
+def timestamp(dt):
+    return dt.strftime(TIME_FORMAT)
+
+
+def none_or_int(value):
+    return None if value in (None, "", "None", "null") else int(value)
+
+
+class NotFound(Exception):
+    pass
+
+
+class Invalid(Exception):
+    def __init__(self, status, description):
+        super().__init__(description)
+        self.status = status
+
+
+class StubData:
+    """Seeded users, pickems, matches and superstars, mutated by the write routes."""
+
+    def __init__(self, users=200, prompts=50, matches=30, superstars=100, picks_per_prompt=20, seed=1):
+        self.rng = random.Random(seed)
+        self.prompts_per_group = prompts
+        self.picks_per_prompt = picks_per_prompt
+        self.now = datetime.now().replace(microsecond=0)
+        self.users = {}
+        self.users_by_discord_id = {}
+        for user_id in range(1, users + 1):
+            self.add_user("user{}".format(user_id), DISCORD_ID_BASE + user_id, user_id)
+        # pickem prompts are seeded per group the first time the group is used
+        self.seeded_groups = set()
+        self.prompts = {}
+        self.choices = {}
+        self.picks = {}
+        self.superstars = {}
+        for superstar_id in range(1, superstars + 1):
+            self.superstars[superstar_id] = self.make_superstar(superstar_id)
+        self.events = [
+            {
+                "id": event_id,
+                "name": "Event {}".format(event_id),
+                "date_time": timestamp(self.now + timedelta(days=7 * event_id)),
+            }
+            for event_id in range(1, 6)
+        ]
+        self.matches = {}
+        for match_id in range(1, matches + 1):
+            self.matches[match_id] = self.make_match(match_id, completed=match_id <= matches // 2)
+        # (user_id, match_id) -> bet
+        self.bets = {}
+        self.points = {user_id: STARTING_POINTS for user_id in self.users}
+        self.ratings = {}
+
+    def add_user(self, username, discord_id=None, user_id=None):
+        user_id = user_id or max(self.users, default=0) + 1
+        user = {
+            "id": user_id,
+            "username": username,
+            "last_login": timestamp(self.now),
+            "date_created": "2020-01-01 00:00:00",
+            "discord_id": str(discord_id) if discord_id else None,
+        }
+        self.users[user_id] = user
+        if discord_id:
+            self.users_by_discord_id[str(discord_id)] = user
+        if hasattr(self, "points"):
+            self.points[user_id] = STARTING_POINTS
+        return user
+
+    def user(self, user_id):
+        try:
+            return self.users[int(user_id)]
+        except (KeyError, ValueError):
+            raise NotFound("User not found.")
+
+    # pickem
+
+    def seed_group(self, group_id):
+        if group_id is None or group_id in self.seeded_groups:
+            return
+        self.seeded_groups.add(group_id)
+        user_ids = list(self.users)
+        for _ in range(self.prompts_per_group):
+            prompt = self.add_prompt(
+                self.rng.choice(user_ids),
+                group_id,
+                "Seeded pickem {}?".format(len(self.prompts) + 1),
+                ["Option {}".format(i + 1) for i in range(self.rng.randint(2, 5))],
+            )
+            for user_id in self.rng.sample(user_ids, min(self.picks_per_prompt, len(user_ids))):
+                self.set_pick(user_id, prompt["id"], self.rng.choice(self.prompt_choices(prompt["id"]))["id"])
+
+    def add_prompt(self, user_id, group_id, subject, choice_subjects):
+        prompt_id = len(self.prompts) + 1
+        now = timestamp(self.now)
+        prompt = {
+            "id": prompt_id,
+            "user_id": user_id,
+            "group_id": group_id,
+            "subject": subject,
+            "open": 1,
+            "choice_result": None,
+            "picks": 0,
+            "expires_at": timestamp(self.now + timedelta(days=1)),
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.prompts[prompt_id] = prompt
+        for choice_subject in choice_subjects:
+            choice_id = len(self.choices) + 1
+            self.choices[choice_id] = {
+                "id": choice_id,
+                "prompt_id": prompt_id,
+                "subject": choice_subject,
+                "picks": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+        return prompt
+
+    def prompt_choices(self, prompt_id):
+        return [choice for choice in self.choices.values() if choice["prompt_id"] == prompt_id]
+
+    def prompt_detail(self, prompt_id):
+        try:
+            prompt = self.prompts[int(prompt_id)]
+        except (KeyError, ValueError):
+            raise NotFound("Pickem not found.")
+        return {"prompt": prompt, "choices": self.prompt_choices(prompt["id"])}
+
+    def find_prompts(self, group_id=None, prompt_open=None, user_id=None):
+        self.seed_group(group_id)
+        return [
+            self.prompt_detail(prompt["id"])
+            for prompt in self.prompts.values()
+            if (group_id is None or prompt["group_id"] == group_id)
+            and (prompt_open is None or prompt["open"] == prompt_open)
+            and (user_id is None or prompt["user_id"] == user_id)
+        ]
+
+    def set_pick(self, user_id, prompt_id, choice_id):
+        prompt = self.prompt_detail(prompt_id)["prompt"]
+        if not prompt["open"]:
+            raise Invalid(422, "Pickem is closed.")
+        if choice_id not in self.choices or self.choices[choice_id]["prompt_id"] != prompt["id"]:
+            raise Invalid(422, "Choice is not part of this pickem.")
+        key = (user_id, prompt["id"])
+        existing = self.picks.get(key)
+        now = timestamp(self.now)
+        if existing:
+            self.choices[existing["choice_id"]]["picks"] -= 1
+            existing.update(choice_id=choice_id, updated_at=now)
+        else:
+            self.picks[key] = {
+                "prompt_id": prompt["id"],
+                "choice_id": choice_id,
+                "user_id": user_id,
+                "username": self.users.get(user_id, {}).get("username"),
+                "created_at": now,
+                "updated_at": now,
+            }
+            prompt["picks"] += 1
+        self.choices[choice_id]["picks"] += 1
+        return self.picks[key]
+
+    def pickem_stats(self, group_id=None, user_id=None):
+        stats = {}
+
+        def entry(stats_user_id):
+            if stats_user_id not in stats:
+                stats[stats_user_id] = {
+                    "user_id": stats_user_id,
+                    "username": self.users.get(stats_user_id, {}).get("username"),
+                    "picks_made": 0,
+                    "picks_correct": 0,
+                    "picks_wrong": 0,
+                    "picks_correct_others": 0,
+                    "prompts_created": 0,
+                    "prompts_created_today": 0,
+                }
+            return stats[stats_user_id]
+
+        self.seed_group(group_id)
+        for prompt in self.prompts.values():
+            if group_id is not None and prompt["group_id"] != group_id:
+                continue
+            entry(prompt["user_id"])["prompts_created"] += 1
+            if prompt["created_at"][:10] == timestamp(self.now)[:10]:
+                entry(prompt["user_id"])["prompts_created_today"] += 1
+        for pick in self.picks.values():
+            prompt = self.prompts[pick["prompt_id"]]
+            if group_id is not None and prompt["group_id"] != group_id:
+                continue
+            data = entry(pick["user_id"])
+            data["picks_made"] += 1
+            if prompt["choice_result"] is None:
+                continue
+            if pick["choice_id"] == prompt["choice_result"]:
+                data["picks_correct"] += 1
+                if pick["user_id"] != prompt["user_id"]:
+                    data["picks_correct_others"] += 1
+            else:
+                data["picks_wrong"] += 1
+        if user_id is not None:
+            self.user(user_id)
+            return entry(user_id)
+        return list(stats.values())
+
+    # watchwrestling
+
+    def make_superstar(self, superstar_id):
+        return {
+            "id": superstar_id,
+            "name": "Superstar {}".format(superstar_id),
+            "brand_id": superstar_id % 3 + 1,
+            "height": "6' {}\"".format(superstar_id % 12),
+            "weight": "{} lbs".format(180 + superstar_id % 120),
+            "hometown": "Hometown {}".format(superstar_id),
+            "dob": "19{:02d}-01-15".format(60 + superstar_id % 35),
+            "signature_move": "Move {0}A;Move {0}B".format(superstar_id),
+            "page_url": "https://example.com/superstars/{}".format(superstar_id),
+            "image_url": "",
+            "bio": "Seeded superstar {}.".format(superstar_id),
+            "twitter_id": "",
+            "twitter_username": "",
+            "last_updated": timestamp(self.now),
+        }
+
+    def make_match(self, match_id, completed):
+        superstar_ids = self.rng.sample(list(self.superstars), 4)
+        team_list = [
+            {"team": 1, "bet_multiplier": 1.5, "members": " & ".join(self.superstars[i]["name"] for i in superstar_ids[:2])},
+            {"team": 2, "bet_multiplier": 2.0, "members": " & ".join(self.superstars[i]["name"] for i in superstar_ids[2:])},
+        ]
+        event = self.events[match_id % len(self.events)]
+        rating = round(self.rng.uniform(1, 5), 3) if completed else None
+        return {
+            "id": match_id,
+            "event_id": event["id"],
+            "title_id": 0,
+            "match_type_id": 1,
+            "match_note": "",
+            "team_won": 1 if completed else 0,
+            "winner_note": "",
+            "bet_open": 0 if completed else 1,
+            "info_last_updated_by_id": 1,
+            "info_last_updated": timestamp(self.now),
+            "completed": 1 if completed else 0,
+            "pot_valid": 1,
+            "contestants": ", ".join(team["members"] for team in team_list),
+            "contestants_won": team_list[0]["members"] if completed else "",
+            "contestants_lost": team_list[1]["members"] if completed else "",
+            "bet_multiplier": 1.5 if completed else 0,
+            "base_pot": 1000,
+            "total_pot": 1500 if completed else 1000,
+            "base_winner_pot": 0,
+            "base_loser_pot": 0,
+            "user_bet_cnt": 0,
+            "user_bet_winner_cnt": 0,
+            "user_bet_loser_cnt": 0,
+            "user_rating_avg": rating,
+            "user_rating_cnt": 1 if completed else 0,
+            "calc_last_updated": timestamp(self.now),
+            "event": event["name"],
+            "date": event["date_time"][:10],
+            "title": "",
+            "match_type": "Tag Team",
+            "last_updated_by_username": "user1",
+            "team_list": team_list,
+        }
+
+    def match(self, match_id):
+        try:
+            return self.matches[int(match_id)]
+        except (KeyError, ValueError):
+            raise NotFound("Match not found.")
+
+    def place_bet(self, user_id, match_id, team_id, points, increase):
+        self.user(user_id)
+        match = self.match(match_id)
+        if not match["bet_open"]:
+            raise Invalid(422, "Betting is closed for this match.")
+        if team_id not in [team["team"] for team in match["team_list"]]:
+            raise Invalid(422, "Invalid team.")
+        key = (user_id, match["id"])
+        existing = self.bets.get(key)
+        if increase:
+            if existing is None:
+                raise NotFound("Bet not found.")
+            if points <= existing["points"]:
+                raise Invalid(422, "Bets can only be increased.")
+            cost = points - existing["points"]
+        else:
+            if existing is not None:
+                raise Invalid(409, "Bet already placed.")
+            cost = points
+        if cost <= 0 or cost > self.points[user_id]:
+            raise Invalid(422, "Not enough available points.")
+        self.points[user_id] -= cost
+        if existing is None:
+            match["user_bet_cnt"] += 1
+        match["base_pot"] += cost
+        match["total_pot"] += cost
+        match["calc_last_updated"] = timestamp(datetime.now())
+        self.bets[key] = {"user_id": user_id, "match_id": match["id"], "team": team_id, "points": points}
+        return self.bets[key]
+
+    def current_bets(self, user_id):
+        bets = []
+        for (bet_user_id, match_id), bet in self.bets.items():
+            match = self.matches[match_id]
+            if bet_user_id != user_id or match["completed"]:
+                continue
+            team = next(team for team in match["team_list"] if team["team"] == bet["team"])
+            pct = bet["points"] / max(match["base_pot"], 1)
+            bets.append(
+                {
+                    "match_id": match_id,
+                    "bet_amount": bet["points"],
+                    "bet_on": team["members"],
+                    "potential_cut_points": int(pct * match["total_pot"]),
+                    "potential_cut_pct": pct,
+                }
+            )
+        return bets
+
+    def user_stats(self, user_id, season_id):
+        self.user(user_id)
+        wins = sum(1 for (bet_user_id, _), bet in self.bets.items() if bet_user_id == user_id and bet["team"] == 1)
+        return {
+            "user_id": user_id,
+            "username": self.users[user_id]["username"],
+            "season": season_id,
+            "wins": wins,
+            "losses": 0,
+            "total_points": STARTING_POINTS,
+            "available_points": self.points[user_id],
+        }
+
+    def leaderboard(self, season_id):
+        stats = [self.user_stats(user_id, season_id) for user_id in self.users]
+        return sorted(stats, key=lambda data: (-data["available_points"], data["user_id"]))
+
+
+class EventHub:
+    """Fans published events out to the connected /events subscribers."""
+
+    def __init__(self, heartbeat=15.0):
+        self.heartbeat = heartbeat
+        # (topics or None for all, queue of encoded messages)
+        self.subscribers = []
+        self.published = Counter()
+
+    def publish(self, event, data):
+        self.published[event] += 1
+        message = "event: {}\ndata: {}\n\n".format(event, json.dumps(data)).encode()
+        for topics, queue in self.subscribers:
+            if topics is None or event.split(".")[0] in topics:
+                queue.put_nowait(message)
+
+    async def close(self, app=None):
+        for _, queue in self.subscribers:
+            queue.put_nowait(None)
+
+
+def ok(data):
+    return web.json_response({"data": data})
+
+
+def error(status, description):
+    return web.json_response({"error": {"description": description}}, status=status)
+
+
+def routes(data: StubData, events: EventHub, upsert=True):
+    r = web.RouteTableDef()
+
+    async def payload(request):
+        try:
+            return await request.json()
+        except ValueError:
+            raise Invalid(400, "Invalid JSON body.")
+
+    @r.get("/events")
+    async def event_stream(request):
+        topics = request.query.get("topics")
+        subscriber = (set(topics.split(",")) if topics else None, asyncio.Queue())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        events.subscribers.append(subscriber)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber[1].get(), events.heartbeat)
+                except asyncio.TimeoutError:
+                    message = b": heartbeat\n\n"
+                if message is None:
+                    break
+                try:
+                    await response.write(message)
+                except ConnectionResetError:
+                    # the subscriber went away with events still queued
+                    break
+        finally:
+            events.subscribers.remove(subscriber)
+        return response
+
+    # users
+
+    @r.get("/users/{user_id:\\d+}")
+    async def user_by_id(request):
+        return ok(data.user(request.match_info["user_id"]))
+
+    @r.get("/users/username/{username}")
+    async def user_by_username(request):
+        for user in data.users.values():
+            if user["username"] == request.match_info["username"]:
+                return ok(user)
+        raise NotFound("User not found.")
+
+    @r.get("/users/discord/{discord_id}")
+    async def user_by_discord_id(request):
+        user = data.users_by_discord_id.get(request.match_info["discord_id"])
+        if user is None:
+            raise NotFound("Discord account is not registered.")
+        return ok(user)
+
+    @r.post("/users/login/token")
+    @r.post("/users/secret/token")
+    async def user_token(request):
+        data.user((await payload(request))["user_id"])
+        return ok(secrets.token_urlsafe(16))
+
+    @r.post("/users/register")
+    async def user_register(request):
+        body = await payload(request)
+        if body.get("discord_id") and body["discord_id"] in data.users_by_discord_id:
+            raise Invalid(409, "Discord account is already registered.")
+        return ok(data.add_user(body["username"], body.get("discord_id")))
+
+    # pickem
+
+    @r.get("/pickem/prompts")
+    async def pickem_prompts(request):
+        query = request.query
+        prompts = data.find_prompts(
+            none_or_int(query.get("group_id")), none_or_int(query.get("open")), none_or_int(query.get("user_id"))
+        )
+        limit = none_or_int(query.get("limit"))
+        if limit is not None:
+            offset = none_or_int(query.get("offset")) or 0
+            prompts = prompts[offset:offset + limit]
+        if not prompts:
+            raise NotFound("No pickems found.")
+        return ok(prompts)
+
+    @r.get("/pickem/prompts/{prompt_id:\\d+}")
+    async def pickem_prompt(request):
+        return ok(data.prompt_detail(request.match_info["prompt_id"]))
+
+    @r.post("/pickem/prompt")
+    async def pickem_prompt_create(request):
+        body = await payload(request)
+        data.user(body["user_id"])
+        prompt = data.add_prompt(body["user_id"], int(body["group_id"]), body["subject"], body["choices"])
+        events.publish("pickem.prompt", data.prompt_detail(prompt["id"]))
+        return ok(data.prompt_detail(prompt["id"]))
+
+    @r.patch("/pickem/prompt")
+    async def pickem_prompt_update(request):
+        body = await payload(request)
+        prompt = data.prompt_detail(body["prompt_id"])["prompt"]
+        if prompt["user_id"] != body["user_id"]:
+            raise Invalid(403, "Only the creator can close this pickem.")
+        prompt.update(open=int(body["open"]), choice_result=body["choice_result"], updated_at=timestamp(datetime.now()))
+        events.publish("pickem.prompt", data.prompt_detail(prompt["id"]))
+        return ok(data.prompt_detail(prompt["id"]))
+
+    @r.get("/pickem/picks")
+    async def pickem_picks(request):
+        prompt_id = none_or_int(request.query.get("prompt_id"))
+        choice_id = none_or_int(request.query.get("choice_id"))
+        user_id = none_or_int(request.query.get("user_id"))
+        picks = [
+            pick
+            for pick in data.picks.values()
+            if (prompt_id is None or pick["prompt_id"] == prompt_id)
+            and (choice_id is None or pick["choice_id"] == choice_id)
+            and (user_id is None or pick["user_id"] == user_id)
+        ]
+        if not picks:
+            raise NotFound("No picks found.")
+        return ok(picks)
+
+    @r.route("*", "/pickem/pick")
+    async def pickem_pick(request):
+        allowed = ["POST", "PATCH", "OPTIONS"] + (["PUT"] if upsert else [])
+        if request.method == "OPTIONS":
+            return web.Response(headers={"Allow": ", ".join(allowed)})
+        if request.method not in allowed:
+            raise Invalid(405, "Method not allowed.")
+        body = await payload(request)
+        data.user(body["user_id"])
+        existing = data.picks.get((body["user_id"], int(body["prompt_id"])))
+        if request.method == "POST" and existing:
+            raise Invalid(409, "Pick already made.")
+        if request.method == "PATCH" and not existing:
+            raise NotFound("Pick not found.")
+        previous_choice_id = existing["choice_id"] if existing else None
+        pick = data.set_pick(body["user_id"], int(body["prompt_id"]), int(body["choice_id"]))
+        events.publish("pickem.pick", {"pick": pick, "previous_choice_id": previous_choice_id})
+        return ok(pick)
+
+    @r.get("/pickem/stats")
+    async def pickem_stats(request):
+        return ok(data.pickem_stats(group_id=none_or_int(request.query.get("group_id"))))
+
+    @r.get("/pickem/stats/{user_id:\\d+}")
+    async def pickem_user_stats(request):
+        return ok(data.pickem_stats(user_id=int(request.match_info["user_id"])))
+
+    # watchwrestling
+
+    @r.get("/watchwrestling/stats/user/{user_id:\\d+}/season/{season_id:\\d+}")
+    async def user_stats(request):
+        return ok(data.user_stats(int(request.match_info["user_id"]), int(request.match_info["season_id"])))
+
+    @r.get("/watchwrestling/stats/leaderboard/season/{season_id:\\d+}")
+    async def leaderboard(request):
+        return ok(data.leaderboard(int(request.match_info["season_id"])))
+
+    @r.get("/watchwrestling/bets/match/{match_id:\\d+}/user/{user_id:\\d+}")
+    async def bet_by_id(request):
+        bet = data.bets.get((int(request.match_info["user_id"]), int(request.match_info["match_id"])))
+        if bet is None:
+            raise NotFound("Bet not found.")
+        return ok(bet)
+
+    @r.get("/watchwrestling/bets/user/{user_id:\\d+}/current/detail")
+    async def current_bets(request):
+        bets = data.current_bets(int(request.match_info["user_id"]))
+        if not bets:
+            raise NotFound("No current bets found.")
+        return ok(bets)
+
+    @r.get("/watchwrestling/matches/betopen/detail")
+    async def openbet_matches(request):
+        matches = [match for match in data.matches.values() if match["bet_open"]]
+        if not matches:
+            raise NotFound("No open bet matches.")
+        return ok(matches)
+
+    @r.get("/watchwrestling/matches/current/detail")
+    async def current_match(request):
+        matches = [match for match in data.matches.values() if not match["completed"]]
+        if not matches:
+            raise NotFound("No current match.")
+        return ok(matches[0])
+
+    @r.get("/watchwrestling/matches/recent/detail")
+    async def recent_match(request):
+        matches = [match for match in data.matches.values() if match["completed"]]
+        if not matches:
+            raise NotFound("No recent match.")
+        return ok(matches[-1])
+
+    @r.get("/watchwrestling/matches/{match_id:\\d+}/detail")
+    async def match_by_id(request):
+        return ok(data.match(request.match_info["match_id"]))
+
+    @r.get("/watchwrestling/superstars/search/{keyword}")
+    async def superstar_search(request):
+        keyword = request.match_info["keyword"].lower()
+        found = [superstar for superstar in data.superstars.values() if keyword in superstar["name"].lower()]
+        if not found:
+            raise NotFound("No superstars found.")
+        return ok(found[:10])
+
+    @r.get("/watchwrestling/superstars/{superstar_id:\\d+}")
+    async def superstar_by_id(request):
+        superstar = data.superstars.get(int(request.match_info["superstar_id"]))
+        if superstar is None:
+            raise NotFound("Superstar not found.")
+        return ok(superstar)
+
+    @r.get("/watchwrestling/events/future")
+    async def future_events(request):
+        return ok(data.events)
+
+    @r.post("/watchwrestling/rate")
+    async def rate(request):
+        body = await payload(request)
+        data.user(body["user_id"])
+        match = data.match(body["match_id"])
+        data.ratings[(body["user_id"], match["id"])] = float(body["rating"])
+        ratings = [rating for (_, match_id), rating in data.ratings.items() if match_id == match["id"]]
+        match.update(user_rating_avg=sum(ratings) / len(ratings), user_rating_cnt=len(ratings))
+        events.publish("watchwrestling.match", {"match": match})
+        return ok(True)
+
+    @r.post("/watchwrestling/bet")
+    @r.patch("/watchwrestling/bet")
+    async def bet(request):
+        body = await payload(request)
+        bet = data.place_bet(
+            body["user_id"], body["match_id"], int(body["team"]), int(body["points"]), increase=request.method == "PATCH"
+        )
+        match = data.match(bet["match_id"])
+        bet_on = next(team["members"] for team in match["team_list"] if team["team"] == bet["team"])
+        events.publish("watchwrestling.bet", {"bet": bet, "bet_on": bet_on})
+        events.publish("watchwrestling.match", {"match": match})
+        # the leaderboard is ranked by available points, which the bet just spent
+        events.publish("watchwrestling.leaderboard", {"season_id": SEASON})
+        return ok(bet)
+
+    return r
+
+
+class Faults:
+    """Latency and failures applied to every request before it is handled."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=1, lost_response_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # mutations applied whose connection is then dropped before answering
+        self.lost_response_rate = lost_response_rate
+        self.rng = random.Random(seed)
+
+
+def make_app(data: StubData = None, faults: Faults = None, upsert=True, compress=False):
+    """Build the stub application.
+
+    `app["requests"]` counts requests by method and route, and `app["events"]`
+    publishes to /events subscribers, e.g. after changing `app["data"]` directly.
+    Mutations sent with an `Idempotency-Key` header are applied once; repeats get
+    the first answer and are counted by method and route in `app["replayed"]`.
+    """
+    data = data or StubData()
+    faults = faults or Faults()
+    events = EventHub()
+
+    @web.middleware
+    async def middleware(request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else request.path
+        request.app["requests"][(request.method, route)] += 1
+        delay = faults.latency + faults.rng.uniform(0, faults.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = faults.rng.random()
+        if roll < faults.rate_limit_rate:
+            response = error(429, "Too many requests.")
+            response.headers["Retry-After"] = "1"
+            return response
+        if roll < faults.rate_limit_rate + faults.error_rate:
+            return error(500, "Injected server error.")
+        key = request.headers.get("Idempotency-Key") if request.method != "GET" else None
+        if key is not None and key in request.app["idempotent"]:
+            # a retried mutation gets the original answer instead of being applied again
+            request.app["replayed"][(request.method, route)] += 1
+            status, body = request.app["idempotent"][key]
+            return web.Response(status=status, body=body, content_type="application/json")
+        try:
+            response = await handler(request)
+        except NotFound as e:
+            response = error(404, str(e))
+        except Invalid as e:
+            response = error(e.status, str(e))
+        except (KeyError, TypeError, ValueError) as e:
+            response = error(400, "Bad request: {}".format(e))
+        if key is not None:
+            request.app["idempotent"][key] = (response.status, response.body)
+        if request.method != "GET" and faults.lost_response_rate and faults.rng.random() < faults.lost_response_rate:
+            # the change is made but the client never hears back
+            request.transport.close()
+            return response
+        if request.method == "GET" and response.status == 200 and isinstance(response, web.Response):
+            etag = '"{}"'.format(hashlib.sha1(response.body).hexdigest())
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+        if compress:
+            response.enable_compression()
+        return response
+
+    app = web.Application(middlewares=[middleware])
+    app["data"] = data
+    app["requests"] = Counter()
+    app["started"] = time.monotonic()
+    app["events"] = events
+    # Idempotency-Key -> (status, body) of the first answer
+    app["idempotent"] = {}
+    app["replayed"] = Counter()
+    app.on_shutdown.append(events.close)
+    app.add_routes(routes(data, events, upsert=upsert))
+    return app
+
+
+async def serve(app, host="127.0.0.1", port=8080):
+    """Start the app in the running loop and return its runner; call `runner.cleanup()` to stop."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--prompts", type=int, default=50, help="open pickems seeded per guild")
+    parser.add_argument("--picks-per-prompt", type=int, default=20)
+    parser.add_argument("--matches", type=int, default=30)
+    parser.add_argument("--superstars", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0,
+                        help="fraction of mutations applied but never answered")
+    parser.add_argument("--no-upsert", action="store_true", help="do not advertise PUT on pickem/pick")
+    parser.add_argument("--compress", action="store_true", help="compress responses")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    data = StubData(args.users, args.prompts, args.matches, args.superstars, args.picks_per_prompt, args.seed)
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.seed, args.lost_response_rate)
+    app = make_app(data, faults, upsert=not args.no_upsert, compress=args.compress)
+    print("Serving stub API on http://{}:{}/".format(args.host, args.port))
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,13 @@ from pathlib import Path
 
 from .easyembed import EasyEmbed
 
-with open(Path(__file__).parent / "info.json") as fp:
-    __red_end_user_data_statement__ = json.load(fp)["end_user_data_statement"]
+
+def __getattr__(name):
+    # info.json is only read when Red asks for the statement, not on every load
+    if name == "__red_end_user_data_statement__":
+        with open(Path(__file__).parent / "info.json") as fp:
+            return json.load(fp)["end_user_data_statement"]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 async def setup(bot):
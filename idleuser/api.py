@@ -1,4 +1,10 @@
+import asyncio
+import json
 import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from importlib.util import find_spec
 import random
 import string
 
@@ -14,52 +20,244 @@ from .errors import (
     ConflictError,
     ValidationError,
 )
+from .utils.journal import MutationJournal, idempotency_key
+from .utils.metrics import Metrics
+
+# aiohttp decodes brotli responses when one of these is installed
+if find_spec("brotlicffi") or find_spec("brotli"):
+    ACCEPT_ENCODING = "br, gzip, deflate"
+else:
+    ACCEPT_ENCODING = "gzip, deflate"
 
 API_URL = "https://api.idleuser.com/"
 WEB_URL = "https://idleuser.com/"
+# raw GET response bodies kept with their ETag/Last-Modified for conditional requests
+CONDITIONAL_CACHE_SIZE = 256
+# unanswered mutations in the journal are replayed on load if they are newer than this
+JOURNAL_REPLAY_MAX_AGE = 3600
+# answers that show the API handled a mutation and turned it down
+REJECTED_ERRORS = (
+    BadRequest,
+    Unauthenticated,
+    InsufficientPrivileges,
+    ResourceNotFound,
+    MethodNotAllowed,
+    ConflictError,
+    ValidationError,
+)
+# payload fields naming what each mutation changes; a newer mutation of the same target supersedes older ones
+MUTATION_TARGETS = {
+    ("POST", "users/register"): ("discord_id",),
+}
 
 log = logging.getLogger("red.idleuser-cogs.idleuser")
 
 
+def close_when_opened(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+async def open_off_loop(opener, *args, **kwargs):
+    """Call a blocking `opener` in a worker thread.
+
+    If the caller is cancelled meanwhile, whatever the thread goes on to open is closed.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(opener, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(close_when_opened)
+        raise
+
+
+def decode_cached_body(body):
+    try:
+        return json.loads(body)
+    except UnicodeDecodeError:
+        return json.loads(body.decode("latin-1"))
+
+
 class IdleUserAPI:
     def __init__(self, bot):
         self.bot = bot
+        # (route, params) -> (etag, last_modified, data)
+        self.conditional_cache = OrderedDict()
+        self.metrics = Metrics()
+        self.journal = None
+        self.journal_replay_task = None
 
     async def stored_auth_token(self):
         auth = await self.bot.get_shared_api_tokens("idleuser")
         return auth
 
+    async def get_api_url(self):
+        """Base URL of the API, overridable with the `api_url` shared API token."""
+        auth = await self.stored_auth_token()
+        api_url = auth.get("api_url") or API_URL
+        return api_url if api_url.endswith("/") else api_url + "/"
+
     async def get_headers(self):
         auth = await self.stored_auth_token()
         auth_token = auth.get("auth_token", "")
-        headers = {"Authorization": "Bearer {}".format(auth_token)}
+        headers = {
+            "Authorization": "Bearer {}".format(auth_token),
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
         return headers
 
     async def get_idleusercom_response(self, route, params={}):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(API_URL + route, params=params) as resp:
-                return await self.handle_response(resp)
+        api_url = await self.get_api_url()
+        cache_key = (api_url, route, tuple(sorted(params.items())))
+        cached = self.conditional_cache.get(cache_key)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        with self.metrics.time_route("GET", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.get(api_url + route, params=params) as resp:
+                    if resp.status == 304 and cached is not None:
+                        self.conditional_cache.move_to_end(cache_key)
+                        # decode the stored body again so callers never share the cached objects
+                        return decode_cached_body(cached[2])["data"]
+                    data = await self.handle_response(resp, sample)
+                    self.store_conditional_response(cache_key, resp, await resp.read())
+                    return data
+
+    def store_conditional_response(self, cache_key, response, body):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.conditional_cache.pop(cache_key, None)
+            return
+        self.conditional_cache[cache_key] = (etag, last_modified, body)
+        self.conditional_cache.move_to_end(cache_key)
+        while len(self.conditional_cache) > CONDITIONAL_CACHE_SIZE:
+            self.conditional_cache.popitem(last=False)
 
-    async def post_idleusercom_response(self, route, payload={}):
+    async def post_idleusercom_response(self, route, payload={}, idempotency_key=None):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("POST", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.post(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
 
-    async def patch_idleusercom_response(self, route, payload={}):
+    async def patch_idleusercom_response(self, route, payload={}, idempotency_key=None):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.patch(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("PATCH", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.patch(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
+
+    def mutation_sender(self, method):
+        return getattr(self, "{}_idleusercom_response".format(method.lower()))
+
+    def mutation_target(self, method, route, payload):
+        fields = MUTATION_TARGETS.get((method, route))
+        if fields is None:
+            return None
+        return "{} {}".format(route, json.dumps([payload.get(field) for field in fields]))
+
+    async def send_journaled(self, method, route, payload={}):
+        """Send a mutation with an idempotency key, recording it in the journal while it is unanswered.
+
+        Only a mutation whose answer was lost in transit stays pending. One the API
+        answered with an error was reported as failed, so it is never replayed.
+        """
+        send = self.mutation_sender(method)
+        if self.journal is None:
+            data = await send(route, payload, idempotency_key=idempotency_key())
+        else:
+            key = self.journal.begin(method, route, payload, self.mutation_target(method, route, payload))
+            try:
+                data = await send(route, payload, idempotency_key=key)
+            except REJECTED_ERRORS:
+                self.journal.finish(key, "rejected")
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # may or may not have been applied, so it is left pending for replay
+                raise
+            except Exception:
+                self.journal.finish(key, "failed")
+                raise
+            self.journal.finish(key)
+        self.after_mutation(method, route, payload)
+        return data
+
+    def after_mutation(self, method, route, payload, replayed=False):
+        """Update local state for a mutation the API accepted, just sent or `replayed` from the journal."""
+
+    async def open_journal(self, path):
+        """Open the mutation journal and replay what it has pending in the background."""
+        # creating the schema and compacting are disk-bound, so they run off the event loop
+        try:
+            self.journal = await open_off_loop(MutationJournal, path)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Unable to open mutation journal {}, sending without it: {}".format(path, e))
+            return
+        # taken now so mutations sent after loading are not mistaken for lost ones
+        pending = self.journal.pending()
+        if pending:
+            self.journal_replay_task = asyncio.create_task(self.replay_journal(pending))
 
-    async def handle_response(self, response):
+    def close_journal(self):
+        if self.journal_replay_task is not None:
+            self.journal_replay_task.cancel()
+            self.journal_replay_task = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    async def replay_journal(self, pending):
+        """Resend mutations whose answer was lost, with their original idempotency keys."""
+        for key, method, route, payload, recorded_at in pending:
+            age = time.time() - recorded_at
+            if age > JOURNAL_REPLAY_MAX_AGE:
+                log.warning("Not replaying {} {} from {:.0f}s ago".format(method, route, age))
+                self.journal.finish(key, "expired")
+                continue
+            try:
+                await self.mutation_sender(method)(route, payload, idempotency_key=key)
+            except ConflictError:
+                # applied before the answer was lost
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+            except REJECTED_ERRORS as e:
+                log.info("Replayed {} {} was rejected: {}".format(method, route, e))
+                self.journal.finish(key, "rejected")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning("Unable to replay {} {}, leaving it for the next load: {}".format(method, route, e))
+            except Exception as e:
+                log.warning("Replayed {} {} failed: {}".format(method, route, e))
+                self.journal.finish(key, "failed")
+            else:
+                log.info("Replayed {} {}".format(method, route))
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+
+    async def handle_response(self, response, sample=None):
         try:
+            # read first so decode time is measured apart from the transfer
+            body = await response.read()
+            started = time.perf_counter()
             data = await response.json()
         except UnicodeDecodeError:
             data = await response.json(encoding="latin-1")
         except Exception:
             raise Exception("Error decoding response.")
+        if sample is not None:
+            sample.bytes = len(body)
+            sample.decode_seconds = time.perf_counter() - started
         if response.status == 200:
             return data["data"]
         else:
@@ -120,6 +318,6 @@ class IdleUserAPI:
             "discord_id": discord_id,
             "chatango_id": chatango_id,
         }
-        return await self.post_idleusercom_response(
-            route="users/register", payload=payload
+        return await self.send_journaled(
+            "POST", route="users/register", payload=payload
         )
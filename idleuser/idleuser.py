@@ -1,18 +1,114 @@
+import asyncio
 import logging
+import os
+from collections import defaultdict
 
-from redbot.core import commands
+from redbot.core import commands, checks
+from redbot.core.data_manager import cog_data_path
 
 from .api import IdleUserAPI, WEB_URL
 from .entities import User
 from .errors import ResourceNotFound
+from .loopmonitor import LoopMonitor
 from .utils import quickembed
+from .utils.metrics import DiscordTimer, Metrics, prometheus_text
 
 log = logging.getLogger("red.idleuser-cogs.idleuser")
 
+METRICS_DUMP_SECONDS = 60
+# cogs from this repo that do not call the API; their command latency and failures are timed from listeners here
+LISTENER_TIMED_COGS = ("UserList", "EasyEmbed")
+
+
+def log_warm_up_failure(task):
+    # commands only wait for the warm-up, so nothing else would see it fail
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Startup work failed", exc_info=task.exception())
+
 
 class IdleUser(IdleUserAPI, commands.Cog):
     def __init__(self, bot):
-        self.bot = bot
+        super().__init__(bot)
+        self.discord_timer = DiscordTimer(bot.http)
+        # cog name -> Metrics for LISTENER_TIMED_COGS
+        self.listener_metrics = defaultdict(lambda: Metrics(call_timing=False))
+        self.metrics_dump_task = None
+        self.warm_up_task = None
+        self.loop_monitor = None
+
+    async def cog_load(self):
+        self.discord_timer.install()
+        # the journal is opened in the background so it does not hold up loading the cog
+        self.warm_up_task = asyncio.create_task(self.open_journal(cog_data_path(self) / "journal.sqlite3"))
+        self.warm_up_task.add_done_callback(log_warm_up_failure)
+        self.metrics_dump_task = asyncio.create_task(self.dump_metrics_periodically())
+
+    async def cog_unload(self):
+        self.discord_timer.uninstall()
+        if self.warm_up_task:
+            self.warm_up_task.cancel()
+        self.close_journal()
+        if self.metrics_dump_task:
+            self.metrics_dump_task.cancel()
+        if self.loop_monitor:
+            self.loop_monitor.stop()
+
+    async def cog_before_invoke(self, ctx):
+        self.metrics.command_started(ctx)
+        if self.warm_up_task and not self.warm_up_task.done():
+            # a command right after loading waits for the journal instead of skipping it
+            await asyncio.wait({self.warm_up_task})
+
+    async def cog_after_invoke(self, ctx):
+        self.metrics.command_finished(ctx)
+
+    async def red_delete_data_for_user(self, *, requester, user_id):
+        if self.warm_up_task and not self.warm_up_task.done():
+            await asyncio.wait({self.warm_up_task})
+        if self.journal is not None:
+            self.journal.forget(lambda payload: str(payload.get("discord_id")) == str(user_id))
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        if ctx.cog is not None and ctx.cog.qualified_name in LISTENER_TIMED_COGS:
+            self.listener_metrics[ctx.cog.qualified_name].command_started(ctx)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        if ctx.cog is not None and ctx.cog.qualified_name in LISTENER_TIMED_COGS:
+            self.listener_metrics[ctx.cog.qualified_name].command_finished(ctx)
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        await self.on_command_completion(ctx)
+
+    def collect_metrics(self):
+        """Metrics of every loaded cog that keeps them, by cog name."""
+        metrics_by_cog = dict(self.listener_metrics)
+        for name, cog in self.bot.cogs.items():
+            metrics = getattr(cog, "metrics", None)
+            if metrics is not None and hasattr(metrics, "routes"):
+                metrics_by_cog[name] = metrics
+        return metrics_by_cog
+
+    def metrics_file_path(self):
+        return cog_data_path(self) / "metrics.prom"
+
+    def dump_metrics(self):
+        path = self.metrics_file_path()
+        # written aside and renamed so a scraper never reads a partial file
+        temp_path = path.with_suffix(".prom.tmp")
+        temp_path.write_text(prometheus_text(self.collect_metrics()))
+        os.replace(temp_path, path)
+        return path
+
+    async def dump_metrics_periodically(self):
+        while True:
+            await asyncio.sleep(METRICS_DUMP_SECONDS)
+            try:
+                self.dump_metrics()
+            except OSError as e:
+                log.warning("Unable to write metrics file: {}".format(e))
 
     async def grab_user(self, ctx, registration_required_message=False) -> User:
         try:
@@ -81,3 +177,111 @@ class IdleUser(IdleUserAPI, commands.Cog):
             await self.dm_user_reset_link(user)
             embed = quickembed.success(desc="Password reset link DMed", user=user)
             await ctx.send(embed=embed)
+
+    @commands.command(name="idleuser-metrics")
+    @checks.is_owner()
+    async def metrics_report(self, ctx, reset: bool = False):
+        """Show API route and command latency for the idleuser cogs.
+
+        Also writes the full metrics in Prometheus text format to the cog's data folder.
+        Pass `True` to reset the counters after reporting.
+        """
+        metrics_by_cog = self.collect_metrics()
+        route_rows = []
+        command_rows = []
+        for cog, metrics in metrics_by_cog.items():
+            for (method, route), stats in metrics.routes.items():
+                route_rows.append((cog, method, route, stats))
+            for command, stats in metrics.commands.items():
+                command_rows.append((cog, command, stats, metrics.call_timing))
+        route_rows.sort(key=lambda item: item[3].latency.sum, reverse=True)
+        command_rows.sort(key=lambda item: item[2].latency.sum, reverse=True)
+
+        desc = "**API routes** (by total time)\n"
+        for cog, method, route, stats in route_rows[:10]:
+            desc += "`{} {}` {}x p50≤{}s p95≤{}s {}KB decode {:.2f}s{}\n".format(
+                method,
+                route,
+                stats.latency.count,
+                stats.latency.quantile(0.5),
+                stats.latency.quantile(0.95),
+                stats.bytes // 1024,
+                stats.decode_seconds,
+                " errors: {}".format(dict(stats.errors)) if stats.errors else "",
+            )
+        if not route_rows:
+            desc += "No requests yet.\n"
+        desc += "\n**Commands** (by total time)\n"
+        for cog, command, stats, call_timing in command_rows[:10]:
+            count = stats.latency.count
+            desc += "`{}` {}x p50≤{}s p95≤{}s{}{}\n".format(
+                command,
+                count,
+                stats.latency.quantile(0.5),
+                stats.latency.quantile(0.95),
+                " avg api {:.2f}s discord {:.2f}s".format(
+                    stats.api_seconds / count, stats.discord_seconds / count
+                ) if call_timing else "",
+                " failed: {}".format(stats.failures) if stats.failures else "",
+            )
+        if not command_rows:
+            desc += "No commands yet.\n"
+        try:
+            path = self.dump_metrics()
+            footer = "Written to {}".format(path)
+        except OSError as e:
+            footer = "Unable to write metrics file: {}".format(e)
+        if reset:
+            for metrics in metrics_by_cog.values():
+                metrics.reset()
+            footer += " | Counters reset"
+        embed = quickembed.info(desc=desc[:4096], footer=footer)
+        embed.set_author(name="IdleUser Metrics")
+        await ctx.send(embed=embed)
+
+    @commands.command(name="idleuser-loopmonitor")
+    @checks.is_owner()
+    async def loop_monitor_toggle(self, ctx, enabled: bool, threshold_ms: int = 100):
+        """Turn the event loop lag monitor on or off.
+
+        While on, code from the idleuser cogs that blocks the event loop for longer than
+        `threshold_ms` is recorded with the command or task it ran for.
+        View the results with `[p]idleuser-slow`.
+        """
+        if self.loop_monitor:
+            self.loop_monitor.stop()
+            self.loop_monitor = None
+        if enabled:
+            self.loop_monitor = LoopMonitor(threshold=threshold_ms / 1000)
+            self.loop_monitor.start()
+            desc = "Loop monitor on. Reporting stalls over {}ms.".format(threshold_ms)
+        else:
+            desc = "Loop monitor off."
+        await ctx.send(embed=quickembed.success(desc=desc))
+
+    @commands.command(name="idleuser-slow")
+    @checks.is_owner()
+    async def loop_monitor_report(self, ctx):
+        """Show event loop lag and the most recent stalls caused by the idleuser cogs."""
+        monitor = self.loop_monitor
+        if not monitor or not monitor.running:
+            embed = quickembed.error(desc="Loop monitor is off. Use `[p]idleuser-loopmonitor True`.")
+            await ctx.send(embed=embed)
+            return
+        lags, offenders, other_stalls = monitor.snapshot()
+        desc = "Loop lag over the last minute: p50 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms\n".format(
+            monitor.lag_percentile(0.5, lags) * 1000,
+            monitor.lag_percentile(0.99, lags) * 1000,
+            max(lags, default=0.0) * 1000,
+        )
+        desc += "Stalls from other code: {}\n\n".format(other_stalls)
+        if offenders:
+            for offender in reversed(offenders):
+                desc += "<t:{}:T> **{:.0f}ms** {}\n`{}`\n".format(
+                    int(offender.when), offender.duration * 1000, offender.source, offender.location
+                )
+        else:
+            desc += "No stalls over {:.0f}ms recorded.".format(monitor.threshold * 1000)
+        embed = quickembed.info(desc=desc[:4096])
+        embed.set_author(name="IdleUser Loop Monitor")
+        await ctx.send(embed=embed)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("red.idleuser-cogs.idleuser")
+
+# top-level packages of this repo's cogs; stalls are only reported when one of them is on the stack
+COG_PACKAGES = {"idleuser", "pickem", "watchwrestling", "userlist", "easyembed"}
+
+
+class SlowCallback:
+    __slots__ = ("when", "duration", "source", "location")
+
+    def __init__(self, when, duration, source, location):
+        self.when = when
+        self.duration = duration
+        # command or task the stalled code was running for
+        self.source = source
+        # innermost cog frame, "module:line in function"
+        self.location = location
+
+
+class LoopMonitor:
+    """Samples event loop lag and reports stalls caused by code from these cogs.
+
+    A heartbeat task records how late each of its wakeups is. A watchdog thread
+    notices when the heartbeat stops, samples the loop thread's stack while it is
+    still blocked, and once the loop recovers records how long it was blocked.
+    Both threads write the history, so it is only read through snapshots.
+    """
+
+    def __init__(self, threshold=0.1, interval=0.1, history=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.offenders = deque(maxlen=history)
+        # lag of the most recent heartbeats, one minute at the default interval
+        self.lags = deque(maxlen=600)
+        self.other_stalls = 0
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.beat_task = None
+        self.watchdog = None
+        self.stopped = threading.Event()
+        # guards offenders, lags and other_stalls between the loop and watchdog threads
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.beat_task is not None and not self.beat_task.done()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.beat_task = asyncio.create_task(self.beat())
+        self.watchdog = threading.Thread(target=self.watch, name="idleuser-loopmonitor", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.beat_task is not None:
+            self.beat_task.cancel()
+            self.beat_task = None
+
+    async def beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self.lock:
+                self.lags.append(max(0.0, now - expected))
+            self.heartbeat = now
+
+    def watch(self):
+        stalled_beat = None
+        sample = None
+        while not self.stopped.wait(self.interval):
+            beat = self.heartbeat
+            if beat == stalled_beat:
+                continue
+            if stalled_beat is not None:
+                # the loop recovered, the stall lasted until this heartbeat
+                duration = beat - stalled_beat - self.interval
+                with self.lock:
+                    if sample is None:
+                        self.other_stalls += 1
+                    else:
+                        self.offenders.append(SlowCallback(time.time() - duration, duration, *sample))
+                        log.debug("Event loop blocked {:.3f}s by {} at {}".format(duration, *sample))
+                stalled_beat = None
+            if time.monotonic() - beat - self.interval >= self.threshold:
+                stalled_beat = beat
+                sample = self.sample_stack()
+
+    def sample_stack(self):
+        """Attribute the loop thread's current stack to a cog command or task, if it is in one."""
+        frame = sys._current_frames().get(self.loop_thread_id)
+        location = None
+        source = None
+        outermost = None
+        while frame is not None:
+            if frame.f_globals.get("__name__", "").split(".")[0] in COG_PACKAGES:
+                code = frame.f_code
+                name = getattr(code, "co_qualname", code.co_name)
+                if location is None:
+                    location = "{}:{} in {}".format(frame.f_globals["__name__"], frame.f_lineno, name)
+                ctx = frame.f_locals.get("ctx")
+                if source is None and getattr(ctx, "command", None) is not None:
+                    source = "command {}".format(ctx.command.qualified_name)
+                outermost = name
+            frame = frame.f_back
+        if location is None:
+            return None
+        return source or "task {}".format(outermost), location
+
+    def snapshot(self):
+        """Copies of the recorded lags and offenders, and the count of other stalls."""
+        with self.lock:
+            return list(self.lags), list(self.offenders), self.other_stalls
+
+    def lag_percentile(self, q, lags=None):
+        if lags is None:
+            lags = self.snapshot()[0]
+        if not lags:
+            return 0.0
+        lags = sorted(lags)
+        return lags[min(len(lags) - 1, int(q * len(lags)))]
@@ -0,0 +1,129 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+log = logging.getLogger("red.idleuser-cogs.idleuser")
+
+# answered mutations are kept this long for inspection, then compacted away
+RETENTION_SECONDS = 86400
+
+
+def idempotency_key():
+    return uuid.uuid4().hex
+
+
+class MutationJournal:
+    """Append-only SQLite log of the mutating requests sent to the API.
+
+    Each request gets an idempotency key and a `pending` row before it is sent,
+    then a `done` or `rejected` row once the API answers. A request whose answer
+    was lost to a timeout, dropped connection or restart stays pending, and can
+    be resent with the same key for the API to apply at most once. Once a newer
+    mutation of the same `target` is answered, older pending ones are superseded
+    and never resent.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # opened in a worker thread, then only used from the event loop
+        self.db = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+        try:
+            # each append is its own transaction; WAL keeps them cheap and durable across a crash
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, state TEXT NOT NULL, "
+                "method TEXT, route TEXT, payload TEXT, recorded_at REAL NOT NULL, target TEXT)"
+            )
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(journal)")}
+            if "target" not in columns:
+                # journals written before targets were recorded
+                self.db.execute("ALTER TABLE journal ADD COLUMN target TEXT")
+            self.db.execute("CREATE INDEX IF NOT EXISTS journal_key ON journal (key)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS journal_target ON journal (target)")
+            self.compact()
+            self.supersede_stale()
+        except sqlite3.Error:
+            # e.g. not a database; the caller carries on without it
+            self.db.close()
+            raise
+
+    def close(self):
+        self.db.close()
+
+    def append(self, key, state, method=None, route=None, payload=None, target=None):
+        try:
+            self.db.execute(
+                "INSERT INTO journal (key, state, method, route, payload, recorded_at, target) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, state, method, route, payload, time.time(), target),
+            )
+        except sqlite3.Error as e:
+            # the request itself still goes ahead, it just cannot be replayed
+            log.warning("Unable to write mutation journal: {}".format(e))
+
+    def begin(self, method, route, payload, target=None):
+        key = idempotency_key()
+        self.append(key, "pending", method, route, json.dumps(payload), target)
+        return key
+
+    def finish(self, key, state="done"):
+        """Record the answer to `key`, superseding older unanswered mutations of its target."""
+        self.append(key, state)
+        try:
+            self.db.execute(
+                "INSERT INTO journal (key, state, recorded_at) "
+                "SELECT older.key, 'superseded', ? FROM journal AS older JOIN journal AS newer "
+                "ON newer.key = ? AND newer.state = 'pending' AND older.target = newer.target "
+                "AND older.seq < newer.seq "
+                "WHERE older.state = 'pending' AND NOT EXISTS "
+                "(SELECT 1 FROM journal AS answer WHERE answer.key = older.key AND answer.state != 'pending')",
+                (time.time(), key),
+            )
+        except sqlite3.Error as e:
+            log.warning("Unable to write mutation journal: {}".format(e))
+
+    def supersede_stale(self):
+        """Supersede unanswered mutations that have a newer unanswered one of the same target."""
+        self.db.execute(
+            "INSERT INTO journal (key, state, recorded_at) "
+            "SELECT sent.key, 'superseded', ? FROM journal AS sent "
+            "WHERE sent.state = 'pending' AND sent.target IS NOT NULL AND NOT EXISTS "
+            "(SELECT 1 FROM journal AS answer WHERE answer.key = sent.key AND answer.state != 'pending') "
+            "AND EXISTS (SELECT 1 FROM journal AS newer WHERE newer.state = 'pending' "
+            "AND newer.target = sent.target AND newer.seq > sent.seq)",
+            (time.time(),),
+        )
+
+    def pending(self):
+        """Unanswered mutations, oldest first, as `(key, method, route, payload, recorded_at)`."""
+        rows = self.db.execute(
+            "SELECT key, method, route, payload, recorded_at FROM journal AS sent "
+            "WHERE state = 'pending' AND NOT EXISTS "
+            "(SELECT 1 FROM journal AS answer WHERE answer.key = sent.key AND answer.state != 'pending') "
+            "ORDER BY seq"
+        ).fetchall()
+        return [
+            (key, method, route, json.loads(payload), recorded_at)
+            for key, method, route, payload, recorded_at in rows
+        ]
+
+    def forget(self, predicate):
+        """Delete every row of the mutations whose payload matches `predicate`."""
+        try:
+            rows = self.db.execute("SELECT key, payload FROM journal WHERE payload IS NOT NULL").fetchall()
+            keys = [(key,) for key, payload in rows if predicate(json.loads(payload))]
+            self.db.executemany("DELETE FROM journal WHERE key = ?", keys)
+        except sqlite3.Error as e:
+            log.warning("Unable to delete from mutation journal: {}".format(e))
+
+    def compact(self):
+        """Drop every row of the mutations answered before the retention period."""
+        self.db.execute(
+            "DELETE FROM journal WHERE key IN "
+            "(SELECT key FROM journal WHERE state != 'pending' AND recorded_at < ?)",
+            (time.time() - RETENTION_SECONDS,),
+        )
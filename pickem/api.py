@@ -1,4 +1,11 @@
+import asyncio
+import json
 import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from importlib.util import find_spec
+from urllib.parse import urljoin
 
 import aiohttp
 
@@ -12,52 +19,361 @@ from .errors import (
     ConflictError,
     ValidationError,
 )
+from .utils.cache import cached, DiskCache
+from .utils.events import EventStream
+from .utils.journal import MutationJournal, idempotency_key
+from .utils.metrics import Metrics
+from .utils.timestamps import DEFAULT_API_TIMEZONE_NAME, set_api_timezone
+
+# aiohttp decodes brotli responses when one of these is installed
+if find_spec("brotlicffi") or find_spec("brotli"):
+    ACCEPT_ENCODING = "br, gzip, deflate"
+else:
+    ACCEPT_ENCODING = "gzip, deflate"
 
 API_URL = "https://api.idleuser.com/"
 WEB_URL = "https://idleuser.com/"
+# raw GET response bodies kept with their ETag/Last-Modified for conditional requests
+CONDITIONAL_CACHE_SIZE = 256
+# picks remembered for choosing between POST and PATCH, least recently seen dropped first
+KNOWN_PICKS_SIZE = 4096
+# seconds before checking again for pick upserts after the check could not reach the API
+PICK_UPSERT_RECHECK_SECONDS = 300
+# seconds slow-changing results are also kept on disk, so a reloaded cog starts warm
+USER_PERSIST = 86400
+CLOSED_PROMPT_PERSIST = 30 * 86400
+# unanswered mutations in the journal are replayed on load if they are newer than this
+JOURNAL_REPLAY_MAX_AGE = 3600
+# answers that show the API handled a mutation and turned it down
+REJECTED_ERRORS = (
+    BadRequest,
+    Unauthenticated,
+    InsufficientPrivileges,
+    ResourceNotFound,
+    MethodNotAllowed,
+    ConflictError,
+    ValidationError,
+)
+# payload fields naming what each mutation changes; a newer mutation of the same target supersedes older ones
+MUTATION_TARGETS = {
+    ("POST", "pickem/prompt"): ("user_id", "group_id", "subject"),
+    ("PATCH", "pickem/prompt"): ("prompt_id",),
+    ("POST", "pickem/pick"): ("user_id", "prompt_id"),
+    ("PATCH", "pickem/pick"): ("user_id", "prompt_id"),
+    ("PUT", "pickem/pick"): ("user_id", "prompt_id"),
+}
 
 log = logging.getLogger("red.idleuser-cogs.pickem")
 
 
+def close_when_opened(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+async def open_off_loop(opener, *args, **kwargs):
+    """Call a blocking `opener` in a worker thread.
+
+    If the caller is cancelled meanwhile, whatever the thread goes on to open is closed.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(opener, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(close_when_opened)
+        raise
+
+
+def decode_cached_body(body):
+    try:
+        return json.loads(body)
+    except UnicodeDecodeError:
+        return json.loads(body.decode("latin-1"))
+
+
 class IdleUserAPI:
     def __init__(self, bot):
         self.bot = bot
+        # (route, params) -> (etag, last_modified, data)
+        self.conditional_cache = OrderedDict()
+        self.metrics = Metrics()
+        self.disk_cache = None
+        self.journal = None
+        self.journal_replay_task = None
+        # (user_id, prompt_id) -> choice_id of picks known to exist on the backend
+        self.known_picks = OrderedDict()
+        self.pick_upsert_supported = None
+        self.pick_upsert_recheck_at = None
+        self.event_stream = EventStream(self.get_event_stream_request, self.on_api_event, params={"topics": "pickem"})
 
     async def stored_auth_token(self):
         auth = await self.bot.get_shared_api_tokens("idleuser")
         return auth
 
+    async def get_api_url(self):
+        """Base URL of the API, overridable with the `api_url` shared API token."""
+        auth = await self.stored_auth_token()
+        api_url = auth.get("api_url") or API_URL
+        return api_url if api_url.endswith("/") else api_url + "/"
+
+    async def update_api_timezone(self):
+        """Time zone of API timestamps, overridable with the `timezone` shared API token."""
+        auth = await self.stored_auth_token()
+        name = auth.get("timezone") or DEFAULT_API_TIMEZONE_NAME
+        if not set_api_timezone(name):
+            log.warning("Time zone {} unavailable. API timestamps will use local time.".format(name))
+
+    async def get_event_stream_request(self):
+        """URL and headers of the API's event stream, routed by the `event_stream` shared API token."""
+        auth = await self.stored_auth_token()
+        route = auth.get("event_stream")
+        if not route:
+            return None
+        return urljoin(await self.get_api_url(), route), await self.get_headers()
+
+    async def update_event_stream(self):
+        """Subscribe to the API's event stream if it is configured, otherwise rely on polling alone."""
+        auth = await self.stored_auth_token()
+        if auth.get("event_stream"):
+            self.event_stream.start()
+        else:
+            self.event_stream.stop()
+
+    def on_api_event(self, event, data):
+        """Apply a pickem or pick change pushed by the API to the local caches."""
+        if event == "pickem.pick":
+            pick = data["pick"]
+            self.remember_known_pick(pick["user_id"], pick["prompt_id"], pick["choice_id"])
+            self.invalidate_cached("get_pickem_stats_by_id", pick["user_id"])
+            self.invalidate_cached("get_pickem_prompt_by_id", pick["prompt_id"])
+        elif event == "pickem.prompt":
+            prompt = data["prompt"]
+            type(self).get_pickem_prompt_by_id.prime(self, data, prompt["id"])
+            if prompt["open"]:
+                self.invalidate_cached("get_pickem_stats_by_id", prompt["user_id"])
+            else:
+                self.forget_known_picks(prompt["id"])
+                self.invalidate_all_cached("get_pickem_stats_by_id")
+
     async def get_headers(self):
         auth = await self.stored_auth_token()
         auth_token = auth.get("auth_token", "")
-        headers = {"Authorization": "Bearer {}".format(auth_token)}
+        headers = {
+            "Authorization": "Bearer {}".format(auth_token),
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
         return headers
 
     async def get_idleusercom_response(self, route, params={}):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(API_URL + route, params=params) as resp:
-                return await self.handle_response(resp)
+        api_url = await self.get_api_url()
+        cache_key = (api_url, route, tuple(sorted(params.items())))
+        cached = self.conditional_cache.get(cache_key)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        with self.metrics.time_route("GET", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.get(api_url + route, params=params) as resp:
+                    if resp.status == 304 and cached is not None:
+                        self.conditional_cache.move_to_end(cache_key)
+                        # decode the stored body again so callers never share the cached objects
+                        return decode_cached_body(cached[2])["data"]
+                    data = await self.handle_response(resp, sample)
+                    self.store_conditional_response(cache_key, resp, await resp.read())
+                    return data
+
+    def store_conditional_response(self, cache_key, response, body):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.conditional_cache.pop(cache_key, None)
+            return
+        self.conditional_cache[cache_key] = (etag, last_modified, body)
+        self.conditional_cache.move_to_end(cache_key)
+        while len(self.conditional_cache) > CONDITIONAL_CACHE_SIZE:
+            self.conditional_cache.popitem(last=False)
+
+    async def post_idleusercom_response(self, route, payload={}, idempotency_key=None):
+        headers = await self.get_headers()
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("POST", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.post(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
 
-    async def post_idleusercom_response(self, route, payload={}):
+    async def patch_idleusercom_response(self, route, payload={}, idempotency_key=None):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("PATCH", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.patch(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
 
-    async def patch_idleusercom_response(self, route, payload={}):
+    async def put_idleusercom_response(self, route, payload={}, idempotency_key=None):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.patch(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("PUT", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.put(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
+
+    async def options_idleusercom_response(self, route):
+        headers = await self.get_headers()
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("OPTIONS", route):
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.options(api_url + route) as resp:
+                    return [method.strip().upper() for method in resp.headers.get("Allow", "").split(",")]
+
+    def mutation_sender(self, method):
+        return getattr(self, "{}_idleusercom_response".format(method.lower()))
+
+    def mutation_target(self, method, route, payload):
+        fields = MUTATION_TARGETS.get((method, route))
+        if fields is None:
+            return None
+        return "{} {}".format(route, json.dumps([payload.get(field) for field in fields]))
 
-    async def handle_response(self, response):
+    async def send_journaled(self, method, route, payload={}):
+        """Send a mutation with an idempotency key, recording it in the journal while it is unanswered.
+
+        Only a mutation whose answer was lost in transit stays pending. One the API
+        answered with an error was reported as failed, so it is never replayed.
+        """
+        send = self.mutation_sender(method)
+        if self.journal is None:
+            data = await send(route, payload, idempotency_key=idempotency_key())
+        else:
+            key = self.journal.begin(method, route, payload, self.mutation_target(method, route, payload))
+            try:
+                data = await send(route, payload, idempotency_key=key)
+            except REJECTED_ERRORS:
+                self.journal.finish(key, "rejected")
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # may or may not have been applied, so it is left pending for replay
+                raise
+            except Exception:
+                self.journal.finish(key, "failed")
+                raise
+            self.journal.finish(key)
+        self.after_mutation(method, route, payload)
+        return data
+
+    def after_mutation(self, method, route, payload, replayed=False):
+        """Update local state for a mutation the API accepted, just sent or `replayed` from the journal."""
+        if route == "pickem/prompt":
+            if method == "POST":
+                self.invalidate_cached("get_pickem_stats_by_id", payload["user_id"])
+                return
+            self.invalidate_cached("get_pickem_prompt_by_id", payload["prompt_id"])
+            if not payload["open"]:
+                self.forget_known_picks(payload["prompt_id"])
+            # closing a prompt changes the stats of everyone who picked on it
+            self.invalidate_all_cached("get_pickem_stats_by_id")
+        elif route == "pickem/pick":
+            self.remember_known_pick(payload["user_id"], payload["prompt_id"], payload["choice_id"])
+            self.invalidate_cached("get_pickem_prompt_by_id", payload["prompt_id"])
+            self.invalidate_cached("get_pickem_stats_by_id", payload["user_id"])
+
+    async def delete_user_data(self, discord_id):
+        """Remove a Discord user's cached account and journaled mutations."""
+        try:
+            user_id = (await self.get_user_by_discord_id(discord_id))["id"]
+        except (IdleUserAPIError, aiohttp.ClientError, asyncio.TimeoutError):
+            user_id = None
+        self.invalidate_cached("get_user_by_discord_id", discord_id)
+        if user_id is not None and self.journal is not None:
+            self.journal.forget(lambda payload: str(payload.get("user_id")) == str(user_id))
+
+    async def open_disk_cache(self, path):
+        # scoped to the API base so results from another backend are not served after a switch
+        scope = await self.get_api_url()
+        try:
+            self.disk_cache = await open_off_loop(DiskCache, path, scope=scope)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Unable to open disk cache {}, caching in memory only: {}".format(path, e))
+
+    async def update_disk_cache_scope(self):
+        if self.disk_cache is not None:
+            self.disk_cache.set_scope(await self.get_api_url())
+
+    def close_disk_cache(self):
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+            self.disk_cache = None
+
+    async def open_journal(self, path):
+        """Open the mutation journal and replay what it has pending in the background."""
+        # creating the schema and compacting are disk-bound, so they run off the event loop
         try:
+            self.journal = await open_off_loop(MutationJournal, path)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Unable to open mutation journal {}, sending without it: {}".format(path, e))
+            return
+        # taken now so mutations sent after loading are not mistaken for lost ones
+        pending = self.journal.pending()
+        if pending:
+            self.journal_replay_task = asyncio.create_task(self.replay_journal(pending))
+
+    def close_journal(self):
+        if self.journal_replay_task is not None:
+            self.journal_replay_task.cancel()
+            self.journal_replay_task = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    async def replay_journal(self, pending):
+        """Resend mutations whose answer was lost, with their original idempotency keys."""
+        for key, method, route, payload, recorded_at in pending:
+            age = time.time() - recorded_at
+            if age > JOURNAL_REPLAY_MAX_AGE:
+                log.warning("Not replaying {} {} from {:.0f}s ago".format(method, route, age))
+                self.journal.finish(key, "expired")
+                continue
+            try:
+                await self.mutation_sender(method)(route, payload, idempotency_key=key)
+            except ConflictError:
+                # applied before the answer was lost
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+            except REJECTED_ERRORS as e:
+                log.info("Replayed {} {} was rejected: {}".format(method, route, e))
+                self.journal.finish(key, "rejected")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning("Unable to replay {} {}, leaving it for the next load: {}".format(method, route, e))
+            except Exception as e:
+                log.warning("Replayed {} {} failed: {}".format(method, route, e))
+                self.journal.finish(key, "failed")
+            else:
+                log.info("Replayed {} {}".format(method, route))
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+
+    async def handle_response(self, response, sample=None):
+        try:
+            # read first so decode time is measured apart from the transfer
+            body = await response.read()
+            started = time.perf_counter()
             data = await response.json()
         except UnicodeDecodeError:
             data = await response.json(encoding="latin-1")
         except Exception:
             raise Exception("Error decoding response.")
+        if sample is not None:
+            sample.bytes = len(body)
+            sample.decode_seconds = time.perf_counter() - started
         if response.status == 200:
             return data["data"]
         else:
@@ -80,6 +396,12 @@ class IdleUserAPI:
                 log.error(data)
                 raise IdleUserAPIError("{} - {}".format(response.status, error_msg))
 
+    def invalidate_cached(self, method_name, *args, **kwargs):
+        getattr(type(self), method_name).invalidate(self, *args, **kwargs)
+
+    def invalidate_all_cached(self, method_name):
+        getattr(type(self), method_name).invalidate_all(self)
+
     async def get_user_by_id(self, user_id):
         return await self.get_idleusercom_response(route="users/{}".format(user_id))
 
@@ -88,31 +410,63 @@ class IdleUserAPI:
             route="users/username/{}".format(username)
         )
 
+    @cached(ttl=600, maxsize=1024, stale_ttl=3000, persist=USER_PERSIST)
     async def get_user_by_discord_id(self, discord_id):
         return await self.get_idleusercom_response(
             route="users/discord/{}".format(discord_id)
         )
 
-    async def get_pickem_prompts(self, group_id, prompt_open=None, user_id=None):
-        return await self.get_idleusercom_response(
-            route="pickem/prompts?group_id={}&open={}&user_id={}".format(group_id, prompt_open, user_id)
-        )
+    async def get_pickem_prompts(self, group_id, prompt_open=None, user_id=None, limit=None, offset=None):
+        route = "pickem/prompts?group_id={}&open={}&user_id={}".format(group_id, prompt_open, user_id)
+        if limit is not None:
+            route += "&limit={}&offset={}".format(limit, offset or 0)
+        return await self.get_idleusercom_response(route=route)
+
+    async def iter_pickem_prompt_pages(self, group_id, prompt_open=None, user_id=None, page_size=10):
+        """Yield prompts a page at a time using limit/offset."""
+        offset = 0
+        previous_ids = None
+        while True:
+            try:
+                prompts = await self.get_pickem_prompts(group_id, prompt_open, user_id, limit=page_size, offset=offset)
+            except ResourceNotFound:
+                return
+            if len(prompts) > page_size:
+                # the backend ignored limit/offset and returned everything
+                for i in range(0, len(prompts), page_size):
+                    yield prompts[i:i + page_size]
+                return
+            ids = [prompt["prompt"]["id"] if "prompt" in prompt else prompt["id"] for prompt in prompts]
+            if ids == previous_ids:
+                # the backend ignored offset and returned the same page again
+                return
+            yield prompts
+            if len(prompts) < page_size:
+                return
+            previous_ids = ids
+            offset += page_size
 
+    # open prompts are only held briefly, their pick counts change; closed ones are final
+    @cached(ttl=5, maxsize=256, persist=CLOSED_PROMPT_PERSIST, persist_if=lambda data: not data["prompt"]["open"])
     async def get_pickem_prompt_by_id(self, prompt_id):
         return await self.get_idleusercom_response(
             route="pickem/prompts/{}".format(prompt_id)
         )
 
     async def get_pickem_picks(self, prompt_id=None, choice_id=None, user_id=None):
-        return await self.get_idleusercom_response(
+        picks = await self.get_idleusercom_response(
             route="pickem/picks?prompt_id={}&choice_id={}&user_id={}".format(prompt_id, choice_id, user_id)
         )
+        for pick in picks:
+            self.remember_known_pick(pick["user_id"], pick["prompt_id"], pick["choice_id"])
+        return picks
 
-    async def get_pickem_stats(self):
+    async def get_pickem_stats(self, group_id=None):
         return await self.get_idleusercom_response(
-            route="pickem/stats"
+            route="pickem/stats?group_id={}".format(group_id)
         )
 
+    @cached(ttl=60, maxsize=256, stale_ttl=240, negative_ttl=60)
     async def get_pickem_stats_by_id(self, user_id):
         return await self.get_idleusercom_response(
             route="pickem/stats/{}".format(user_id)
@@ -125,8 +479,8 @@ class IdleUserAPI:
             "subject": subject,
             "choices": choices,
         }
-        return await self.post_idleusercom_response(
-            route="pickem/prompt", payload=payload
+        return await self.send_journaled(
+            "POST", route="pickem/prompt", payload=payload
         )
 
     async def patch_pickem_prompt(self, user_id, prompt_id, prompt_open, choice_result):
@@ -136,8 +490,8 @@ class IdleUserAPI:
             "open": prompt_open,
             "choice_result": choice_result,
         }
-        return await self.patch_idleusercom_response(
-            route="pickem/prompt", payload=payload
+        return await self.send_journaled(
+            "PATCH", route="pickem/prompt", payload=payload
         )
 
     async def post_pickem_pick(self, user_id, prompt_id, choice_id):
@@ -146,8 +500,8 @@ class IdleUserAPI:
             "prompt_id": prompt_id,
             "choice_id": choice_id,
         }
-        return await self.post_idleusercom_response(
-            route="pickem/pick", payload=payload
+        return await self.send_journaled(
+            "POST", route="pickem/pick", payload=payload
         )
 
     async def patch_pickem_pick(self, user_id, prompt_id, choice_id):
@@ -156,6 +510,74 @@ class IdleUserAPI:
             "prompt_id": prompt_id,
             "choice_id": choice_id,
         }
-        return await self.patch_idleusercom_response(
-            route="pickem/pick", payload=payload
+        return await self.send_journaled(
+            "PATCH", route="pickem/pick", payload=payload
         )
+
+    async def put_pickem_pick(self, user_id, prompt_id, choice_id):
+        payload = {
+            "user_id": user_id,
+            "prompt_id": prompt_id,
+            "choice_id": choice_id,
+        }
+        return await self.send_journaled(
+            "PUT", route="pickem/pick", payload=payload
+        )
+
+    async def pickem_pick_upsert_available(self):
+        """Check once whether the backend advertises PUT (upsert) on `pickem/pick`."""
+        recheck = self.pick_upsert_recheck_at is not None and time.monotonic() >= self.pick_upsert_recheck_at
+        if self.pick_upsert_supported is None or recheck:
+            try:
+                allowed_methods = await self.options_idleusercom_response(route="pickem/pick")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # assumed unsupported for a while rather than checked again on every pick
+                self.pick_upsert_supported = False
+                self.pick_upsert_recheck_at = time.monotonic() + PICK_UPSERT_RECHECK_SECONDS
+                return False
+            self.pick_upsert_supported = "PUT" in allowed_methods
+            self.pick_upsert_recheck_at = None
+        return self.pick_upsert_supported
+
+    async def submit_pickem_pick(self, user_id, prompt_id, choice_id):
+        """Add or update a pick using a single request where possible.
+
+        Returns True if an existing pick was updated, False if one was added, or
+        None if an upsert may have replaced a pick this client had not seen.
+        """
+        key = (user_id, prompt_id)
+        updated = key in self.known_picks
+        if await self.pickem_pick_upsert_available():
+            await self.put_pickem_pick(user_id, prompt_id, choice_id)
+            if not updated:
+                updated = None
+        elif updated:
+            try:
+                await self.patch_pickem_pick(user_id, prompt_id, choice_id)
+            except ResourceNotFound:
+                await self.post_pickem_pick(user_id, prompt_id, choice_id)
+                updated = False
+        else:
+            try:
+                await self.post_pickem_pick(user_id, prompt_id, choice_id)
+            except ConflictError:
+                # pick was made somewhere this client has not seen
+                await self.patch_pickem_pick(user_id, prompt_id, choice_id)
+                updated = True
+        return updated
+
+    def remember_known_pick(self, user_id, prompt_id, choice_id):
+        key = (user_id, prompt_id)
+        self.known_picks[key] = choice_id
+        self.known_picks.move_to_end(key)
+        if len(self.known_picks) > KNOWN_PICKS_SIZE:
+            self.known_picks.popitem(last=False)
+
+    def forget_known_picks(self, prompt_id):
+        for key in [key for key in self.known_picks if key[1] == prompt_id]:
+            del self.known_picks[key]
+
+    def prune_known_picks(self, open_prompt_ids):
+        """Drop known picks on prompts that are no longer open."""
+        for key in [key for key in self.known_picks if key[1] not in open_prompt_ids]:
+            del self.known_picks[key]
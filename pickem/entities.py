@@ -1,7 +1,6 @@
-from datetime import datetime
-
 from .api import WEB_URL
 from .utils import quickembed
+from .utils.timestamps import timestamp_epoch
 
 
 class User:
@@ -24,7 +23,7 @@ class User:
             }
         )
 
-    def stats_embed(self, data):
+    def stats_embed(self, data, rank=None, ranked=None):
         embed = quickembed.general(desc="Pickem Stats", user=self)
         embed.add_field(name="Picks", value=data["picks_made"], inline=True)
         combined_picks_closed = data["picks_correct"] + data["picks_wrong"]
@@ -35,6 +34,8 @@ class User:
             ),
             inline=True,
         )
+        if rank:
+            embed.add_field(name="Rank", value="#{} of {}".format(rank, ranked), inline=True)
         embed.add_field(name="Pickems Created", value=data["prompts_created"], inline=False)
         if self.date_created:
             embed.set_footer(
@@ -42,8 +43,10 @@ class User:
             )
         return embed
 
-    def stats_full_embed(self, data):
+    def stats_full_embed(self, data, rank=None, ranked=None):
         embed = quickembed.general(desc="Pickem Stats", user=self)
+        if rank:
+            embed.add_field(name="Rank", value="#{} of {}".format(rank, ranked), inline=False)
         embed.add_field(name="Picks", value=data["picks_made"], inline=True)
         embed.add_field(name="Correct", value=data["picks_correct"], inline=True)
         embed.add_field(name="Wrong", value=data["picks_wrong"], inline=True)
@@ -96,15 +99,14 @@ class Prompt:
             self.expires_at = data["expires_at"]
             self.created_at = data["created_at"]
             self.updated_at = data["updated_at"]
-        self.expires_at_epoch = int(datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S").timestamp())
+        self.expires_at_epoch = timestamp_epoch(self.expires_at)
         self.choices = []
         if 'choices' in data:
             for choice_data in data["choices"]:
                 self.choices.append(Choice(choice_data))
-        self.page_prompt_embed = None
         self.user = None
 
-    def info_embed(self, caller: User = None, custom_title: str = None, red=False):
+    def info_embed(self, caller: User = None, custom_title: str = None, red=False, tally=None):
         if red:
             embed = quickembed.error(
                 desc="**{}**".format(self.subject),
@@ -124,7 +126,11 @@ class Prompt:
                 url=caller.url,
             )
         for i, choice in enumerate(self.choices):
-            embed.add_field(name="{} {}".format(Choice.choice_emojis[i], choice.subject), value="", inline=False)
+            if tally is not None:
+                value = "`{:.0f}%` ({})".format(tally.percent(choice.id), tally.count(choice.id))
+            else:
+                value = ""
+            embed.add_field(name="{} {}".format(Choice.choice_emojis[i], choice.subject), value=value, inline=False)
 
         embed.add_field(name=" ", value="expires: <t:{}:R>".format(self.expires_at_epoch), inline=False)
         return embed
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+import discord
+
+from .entities import Prompt, Choice
+from .tally import PromptTally
+from .utils import quickembed
+
+log = logging.getLogger("red.idleuser-cogs.pickem")
+
+
+class ThrottledMessage(ABC):
+    """A bot message that is re-rendered at most once every `interval` seconds.
+
+    Call `touch()` whenever the content changes. Changes made while an update is
+    pending or in flight are folded into the next update.
+    """
+
+    def __init__(self, channel, message: discord.Message = None, interval=5.0):
+        self.channel = channel
+        self.message = message
+        self.interval = interval
+        self.dirty = False
+        self.last_flush = 0.0
+        self.flush_task = None
+
+    @abstractmethod
+    def render(self) -> discord.Embed:
+        """Build the embed for the message's current content."""
+
+    def touch(self):
+        self.dirty = True
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        while self.dirty:
+            delay = self.last_flush + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.dirty = False
+            self.last_flush = time.monotonic()
+            embed = self.render()
+            try:
+                if self.message is None:
+                    self.message = await self.channel.send(embed=embed)
+                else:
+                    await self.message.edit(embed=embed)
+            except discord.NotFound:
+                self.message = None
+            except discord.HTTPException as e:
+                log.warning("Unable to update message: {}".format(e))
+
+    def close(self):
+        """Drop any pending update."""
+        self.dirty = False
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+
+
+class LivePromptMessage(ThrottledMessage):
+    """The pick message of an active prompt, kept in sync with its tally."""
+
+    def __init__(self, message: discord.Message, prompt: Prompt, tally: PromptTally, caller, custom_title,
+                 interval=5.0):
+        super().__init__(message.channel, message=message, interval=interval)
+        self.prompt = prompt
+        self.tally = tally
+        self.caller = caller
+        self.custom_title = custom_title
+
+    def render(self):
+        return self.prompt.info_embed(caller=self.caller, custom_title=self.custom_title, tally=self.tally)
+
+
+class PickFeed(ThrottledMessage):
+    """One live "recent picks" message per prompt, used instead of one message per pick."""
+
+    def __init__(self, channel, prompt: Prompt, tally: PromptTally, size=5, interval=5.0):
+        super().__init__(channel, interval=interval)
+        self.prompt = prompt
+        self.tally = tally
+        self.recent = deque(maxlen=size)
+
+    def add(self, user, choice: Choice, updated=False):
+        self.recent.appendleft((user.username, choice.subject, updated))
+        self.touch()
+
+    def render(self):
+        embed = quickembed.success(desc="**{}**".format(self.prompt.subject))
+        embed.set_author(name="Recent Picks")
+        for i, choice in enumerate(self.prompt.choices):
+            embed.add_field(
+                name="{} {}".format(Choice.choice_emojis[i], choice.subject),
+                value="`{:.0f}%` ({})".format(self.tally.percent(choice.id), self.tally.count(choice.id)),
+                inline=True,
+            )
+        embed.add_field(
+            name="Latest",
+            value="\n".join(
+                "{} {} **{}**".format(username, "changed to" if updated else "picked", choice_subject)
+                for username, choice_subject, updated in self.recent
+            ),
+            inline=False,
+        )
+        embed.set_footer(text="You are allowed update existing picks. [pickem {}]".format(self.prompt.id))
+        return embed
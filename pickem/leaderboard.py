@@ -0,0 +1,71 @@
+import time
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """Pickem stats for a guild kept sorted by rank.
+
+    Ranks are ordered by correct picks, then fewest wrong picks. A user's rank
+    is found with a binary search, and closing a prompt only re-sorts the users
+    who picked on it.
+    """
+
+    def __init__(self, stats_list):
+        # user_id -> stats data, copied since update() changes them and the API may hand back cached dicts
+        self.entries = {}
+        self.keys = []
+        self.refreshed_at = time.monotonic()
+        for data in stats_list:
+            data = dict(data)
+            self.entries[data["user_id"]] = data
+            self.keys.append(self.rank_key(data))
+        self.keys.sort()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def rank_key(data):
+        return -int(data["picks_correct"]), int(data["picks_wrong"]), data["user_id"]
+
+    def age(self):
+        return time.monotonic() - self.refreshed_at
+
+    def rank(self, user_id):
+        data = self.entries.get(user_id)
+        if data is None:
+            return None
+        return bisect_left(self.keys, self.rank_key(data)) + 1
+
+    def page(self, page_i, per_page=10):
+        keys = self.keys[page_i * per_page:(page_i + 1) * per_page]
+        return [self.entries[key[2]] for key in keys]
+
+    def page_count(self, per_page=10):
+        return max(1, -(-len(self.keys) // per_page))
+
+    def update(self, user_id, username=None, **increments):
+        data = self.entries.get(user_id)
+        if data is None:
+            data = {
+                "user_id": user_id,
+                "username": username,
+                "picks_made": 0,
+                "picks_correct": 0,
+                "picks_wrong": 0,
+                "picks_correct_others": 0,
+            }
+            self.entries[user_id] = data
+        else:
+            del self.keys[bisect_left(self.keys, self.rank_key(data))]
+        for field, increment in increments.items():
+            data[field] = int(data.get(field) or 0) + increment
+        insort(self.keys, self.rank_key(data))
+
+    def apply_closed_prompt(self, prompt_user_id, choice_result, picks):
+        for pick in picks:
+            correct = pick["choice_id"] == choice_result
+            increments = {"picks_correct": 1} if correct else {"picks_wrong": 1}
+            if correct and pick["user_id"] != prompt_user_id:
+                increments["picks_correct_others"] = 1
+            self.update(pick["user_id"], username=pick.get("username"), **increments)
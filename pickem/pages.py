@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+import discord
+
+from .entities import Prompt
+
+
+class PromptPages:
+    """Prompts pulled lazily from an async page source, one prompt per page.
+
+    Only the pages needed to reach the requested prompt are fetched, and page
+    embeds are rendered when shown with the most recent few kept.
+    """
+
+    def __init__(self, source, render, include=None, cache_size=5):
+        # async iterator yielding lists of prompt data
+        self.source = source
+        # render(prompt, page_i, pages) -> discord.Embed
+        self.render = render
+        self.include = include
+        self.cache_size = cache_size
+        self.prompts = []
+        self.exhausted = False
+        self.embeds = OrderedDict()
+
+    def __len__(self):
+        return len(self.prompts)
+
+    async def fetch_more(self):
+        try:
+            prompts_data = await self.source.__anext__()
+        except StopAsyncIteration:
+            self.exhausted = True
+            return
+        for prompt_data in prompts_data:
+            prompt = Prompt(prompt_data)
+            if self.include is None or self.include(prompt):
+                self.prompts.append(prompt)
+        # footers show the known page count
+        self.embeds.clear()
+
+    async def get(self, page_i):
+        while page_i >= len(self.prompts) and not self.exhausted:
+            await self.fetch_more()
+        return self.prompts[page_i] if page_i < len(self.prompts) else None
+
+    async def last_index(self):
+        while not self.exhausted:
+            await self.fetch_more()
+        return len(self.prompts) - 1
+
+    def replace(self, page_i, prompt: Prompt):
+        self.prompts[page_i] = prompt
+
+    def page_count_text(self):
+        return "{}".format(len(self.prompts)) if self.exhausted else "{}+".format(len(self.prompts))
+
+    def embed(self, page_i) -> discord.Embed:
+        if page_i in self.embeds:
+            self.embeds.move_to_end(page_i)
+        else:
+            self.embeds[page_i] = self.render(self.prompts[page_i], page_i, self)
+            if len(self.embeds) > self.cache_size:
+                self.embeds.popitem(last=False)
+        return self.embeds[page_i]
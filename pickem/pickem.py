@@ -1,20 +1,251 @@
 import asyncio
 import logging
+from collections import OrderedDict
 
+import aiohttp
 import discord
-from redbot.core import commands
+from redbot.core import commands, Config
+from redbot.core.data_manager import cog_data_path
 
 from .api import IdleUserAPI
 from .entities import User, Prompt, Choice, Pick
-from .errors import ResourceNotFound, IdleUserAPIError, ConflictError
+from .errors import ResourceNotFound, IdleUserAPIError
+from .feed import PickFeed, LivePromptMessage
+from .leaderboard import Leaderboard
+from .pages import PromptPages
+from .scheduler import ExpiryScheduler
+from .tally import PromptTally
 from .utils import quickembed
+from .utils.metrics import DiscordTimer
 
 log = logging.getLogger("red.idleuser-cogs.pickem")
 
+TALLY_RECONCILE_SECONDS = 60
+LEADERBOARD_REFRESH_SECONDS = 300
+# closed prompts remembered so a repeated close event is not credited twice
+CLOSED_PROMPTS_REMEMBERED = 1024
+# live tallies kept for prompts being picked on, least recently used dropped first
+PROMPT_TALLIES_SIZE = 256
+
+
+def log_warm_up_failure(task):
+    # commands only wait for the warm-up, so nothing else would see it fail
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Startup work failed", exc_info=task.exception())
+
 
 class Pickem(IdleUserAPI, commands.Cog):
     def __init__(self, bot):
-        self.bot = bot
+        super().__init__(bot)
+        self.config = Config.get_conf(self, identifier=2791504001, force_registration=True)
+        self.config.register_guild(pick_ack_mode="each")
+        self.config.register_user(pick_dm=False)
+        # (channel_id, prompt_id) -> PickFeed
+        self.pick_feeds = {}
+        # prompt_id -> PromptTally, least recently used first
+        self.prompt_tallies = OrderedDict()
+        # prompt_id -> task refreshing that prompt's tally
+        self.tally_reconcile_tasks = {}
+        # guild_id -> Leaderboard
+        self.leaderboards = {}
+        # prompt_id -> None, closed prompts already credited to the leaderboards
+        self.credited_prompt_ids = OrderedDict()
+        self.expiry_scheduler = ExpiryScheduler(self.on_prompt_expired)
+        self.background_tasks = []
+        self.warm_up_task = None
+        self.discord_timer = DiscordTimer(bot.http)
+
+    async def cog_load(self):
+        self.discord_timer.install()
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+        self.warm_up_task.add_done_callback(log_warm_up_failure)
+        self.background_tasks = [
+            self.warm_up_task,
+            asyncio.create_task(self.refresh_leaderboards()),
+            asyncio.create_task(self.expiry_scheduler.run()),
+            asyncio.create_task(self.schedule_open_prompt_expirations()),
+        ]
+
+    async def cog_unload(self):
+        self.discord_timer.uninstall()
+        for task in self.background_tasks:
+            task.cancel()
+        self.event_stream.stop()
+        self.close_journal()
+        self.close_disk_cache()
+
+    async def warm_up(self):
+        """Startup work that does not need to hold up loading the cog.
+
+        Commands invoked before it is done wait for it in `cog_before_invoke`.
+        """
+        await self.update_api_timezone()
+        data_path = cog_data_path(self)
+        await self.open_disk_cache(data_path / "cache.sqlite3")
+        await self.open_journal(data_path / "journal.sqlite3")
+        await self.update_event_stream()
+
+    async def cog_before_invoke(self, ctx):
+        self.metrics.command_started(ctx)
+        if self.warm_up_task and not self.warm_up_task.done():
+            # a command right after loading waits for the disk cache and journal instead of skipping them
+            await asyncio.wait({self.warm_up_task})
+
+    async def cog_after_invoke(self, ctx):
+        self.metrics.command_finished(ctx)
+
+    async def red_delete_data_for_user(self, *, requester, user_id):
+        await self.config.user_from_id(user_id).clear()
+        if self.warm_up_task and not self.warm_up_task.done():
+            await asyncio.wait({self.warm_up_task})
+        await self.delete_user_data(user_id)
+
+    @commands.Cog.listener()
+    async def on_red_api_tokens_update(self, service_name, api_tokens):
+        if service_name == "idleuser":
+            await self.update_api_timezone()
+            await self.update_disk_cache_scope()
+            await self.update_event_stream()
+
+    def on_api_event(self, event, data):
+        super().on_api_event(event, data)
+        if event == "pickem.pick":
+            pick = data["pick"]
+            tally = self.prompt_tallies.get(pick["prompt_id"])
+            if tally is not None and self.event_stream.covers(tally.reconciled_at):
+                if "previous_choice_id" not in data:
+                    # the replaced choice is unknown; count the new one and let the backend settle it
+                    tally.invalidate()
+                tally.apply(data.get("previous_choice_id"), pick["choice_id"])
+        elif event == "pickem.prompt":
+            guild_id = data["prompt"]["group_id"]
+            prompt = Prompt(data)
+            if prompt.open:
+                self.expiry_scheduler.schedule(guild_id, prompt)
+                return
+            self.expiry_scheduler.unschedule(prompt.id)
+            self.forget_prompt_tally(prompt.id)
+            leaderboard = self.leaderboards.get(guild_id)
+            if leaderboard is not None and self.event_stream.covers(leaderboard.refreshed_at):
+                for choice in prompt.choices:
+                    if choice.id == prompt.choice_result:
+                        asyncio.create_task(self.update_leaderboard_for_closed_prompt(guild_id, prompt, choice))
+
+    def after_mutation(self, method, route, payload, replayed=False):
+        super().after_mutation(method, route, payload, replayed)
+        if replayed and route == "pickem/pick":
+            tally = self.prompt_tallies.get(payload["prompt_id"])
+            if tally is not None:
+                # the replayed pick was never counted here; let the backend settle the counts
+                tally.invalidate()
+
+    async def guild_leaderboard(self, guild_id) -> Leaderboard:
+        if guild_id not in self.leaderboards:
+            self.leaderboards[guild_id] = Leaderboard(await self.get_pickem_stats(group_id=guild_id))
+        return self.leaderboards[guild_id]
+
+    async def refresh_leaderboards(self):
+        """Rebuild stale guild leaderboards in the background."""
+        while True:
+            await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+            for guild_id, leaderboard in list(self.leaderboards.items()):
+                if leaderboard.age() < LEADERBOARD_REFRESH_SECONDS:
+                    continue
+                if self.event_stream.covers(leaderboard.refreshed_at):
+                    # kept current by the event stream
+                    continue
+                try:
+                    self.leaderboards[guild_id] = Leaderboard(await self.get_pickem_stats(group_id=guild_id))
+                except IdleUserAPIError as e:
+                    log.warning("Unable to refresh pickem leaderboard for {}: {}".format(guild_id, e))
+                except Exception:
+                    # undecodable responses and connection errors must not end the loop
+                    log.exception("Error refreshing pickem leaderboard for {}".format(guild_id))
+
+    async def update_leaderboard_for_closed_prompt(self, guild_id, prompt: Prompt, choice: Choice):
+        leaderboard = self.leaderboards.get(guild_id)
+        if leaderboard is None or prompt.id in self.credited_prompt_ids:
+            return
+        # claimed before fetching the picks so a close event arriving meanwhile is skipped
+        self.credited_prompt_ids[prompt.id] = None
+        while len(self.credited_prompt_ids) > CLOSED_PROMPTS_REMEMBERED:
+            self.credited_prompt_ids.popitem(last=False)
+        try:
+            picks = await self.get_pickem_picks(prompt_id=prompt.id)
+        except ResourceNotFound:
+            return
+        except IdleUserAPIError as e:
+            self.credited_prompt_ids.pop(prompt.id, None)
+            log.warning("Unable to update pickem leaderboard for {}: {}".format(guild_id, e))
+            return
+        # listing the picks re-learns them; the prompt is closed so they are no longer needed
+        self.forget_known_picks(prompt.id)
+        leaderboard.apply_closed_prompt(prompt.user_id, choice.id, picks)
+
+    async def schedule_open_prompt_expirations(self):
+        await self.bot.wait_until_red_ready()
+        open_prompt_ids = set()
+        complete = True
+        for guild in self.bot.guilds:
+            try:
+                open_prompts_data = await self.get_pickem_prompts(guild.id, prompt_open=1)
+            except ResourceNotFound:
+                continue
+            except IdleUserAPIError as e:
+                log.warning("Unable to schedule pickem expirations for {}: {}".format(guild.id, e))
+                complete = False
+                continue
+            for prompt_data in open_prompts_data:
+                prompt = Prompt(prompt_data)
+                open_prompt_ids.add(prompt.id)
+                self.expiry_scheduler.schedule(guild.id, prompt)
+        if complete:
+            # picks and expirations of prompts closed while the cog was not listening are no longer needed
+            self.prune_known_picks(open_prompt_ids)
+            self.prune_prompt_tallies(open_prompt_ids)
+            self.expiry_scheduler.prune(open_prompt_ids)
+
+    async def on_prompt_expired(self, guild_id, prompt: Prompt, channel=None):
+        """Picks are locked once a prompt expires; let its creator know it is ready to close."""
+        self.forget_prompt_tally(prompt.id)
+        embed = quickembed.notice(
+            desc="**{}**".format(prompt.subject),
+            footer="Picks are locked. Use `close` to add the result. [pickem {}]".format(prompt.id),
+        )
+        embed.set_author(name="Pickem Expired")
+        creator = await self.prompt_creator_discord(prompt)
+        if creator is not None:
+            try:
+                await creator.send(embed=embed)
+                return
+            except discord.HTTPException:
+                pass
+        if channel is not None:
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException:
+                pass
+
+    async def prompt_creator_discord(self, prompt: Prompt):
+        """Discord user who created `prompt`, looked up by their account for prompts loaded from listings."""
+        discord_user = getattr(prompt.user, "discord", None)
+        if discord_user is not None:
+            return discord_user
+        try:
+            user_data = await self.get_user_by_id(prompt.user_id)
+        except (IdleUserAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.warning("Unable to look up the creator of pickem {}: {}".format(prompt.id, e))
+            return None
+        if not user_data.get("discord_id"):
+            return None
+        discord_id = int(user_data["discord_id"])
+        discord_user = self.bot.get_user(discord_id)
+        if discord_user is None:
+            try:
+                discord_user = await self.bot.fetch_user(discord_id)
+            except discord.HTTPException:
+                return None
+        return discord_user
 
     async def grab_user(self, ctx: commands.Context, author=None, registration_required_message=False) -> User:
         author = author if author is not None else ctx.author
@@ -38,10 +269,17 @@ class Pickem(IdleUserAPI, commands.Cog):
         if user.is_registered:
             try:
                 user_stats_data = await self.get_pickem_stats_by_id(user.id)
+                rank, ranked = None, None
+                if ctx.guild:
+                    try:
+                        leaderboard = await self.guild_leaderboard(ctx.guild.id)
+                        rank, ranked = leaderboard.rank(user.id), len(leaderboard)
+                    except ResourceNotFound:
+                        pass
                 if show_more:
-                    embed = user.stats_full_embed(user_stats_data)
+                    embed = user.stats_full_embed(user_stats_data, rank=rank, ranked=ranked)
                 else:
-                    embed = user.stats_embed(user_stats_data)
+                    embed = user.stats_embed(user_stats_data, rank=rank, ranked=ranked)
                 await ctx.send(embed=embed)
             except IdleUserAPIError as e:
                 await ctx.send(embed=quickembed.error(str(e), user=user))
@@ -56,6 +294,9 @@ class Pickem(IdleUserAPI, commands.Cog):
             open_prompts = await self.get_pickem_prompts(group_id=ctx.guild.id, prompt_open=1)
             for open_prompt in open_prompts:
                 prompt = Prompt(open_prompt)
+                self.expiry_scheduler.schedule(ctx.guild.id, prompt)
+                if self.expiry_scheduler.is_expired(prompt):
+                    continue
                 try:
                     user_picks_data = await self.get_pickem_picks(prompt_id=prompt.id, user_id=user.id)
                     user_prompt_pick = Pick(user_picks_data[0])
@@ -87,10 +328,84 @@ class Pickem(IdleUserAPI, commands.Cog):
         except ResourceNotFound as e:
             await ctx.send(embed=quickembed.error(str(e), user=user))
 
-    @commands.command(name="top-picks", aliases=["toppicks", "picks-leaderboard", "ptop"], enabled=False)
-    async def leaderboard(self, ctx: commands.Context):
-        # TODO
-        pass
+    @commands.command(name="pickem-ack", aliases=["pickack"])
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
+    async def set_pick_ack_mode(self, ctx: commands.Context, mode: str):
+        """Set how picks are acknowledged in this server.
+
+        **Arguments:**
+
+        - `<mode>` `each` sends a message for every pick. `feed` keeps one live "Recent Picks" message per pickem.
+        """
+        mode = mode.lower()
+        if mode not in ["each", "feed"]:
+            await ctx.send(embed=quickembed.error(desc="Mode must be `each` or `feed`."))
+            return
+        await self.config.guild(ctx.guild).pick_ack_mode.set(mode)
+        await ctx.send(embed=quickembed.success(desc="Pick acknowledgements set to `{}`.".format(mode)))
+
+    @commands.command(name="pickem-dm", aliases=["pickdm"])
+    async def toggle_pick_dm(self, ctx: commands.Context):
+        """Toggle receiving your pick confirmations by DM instead of in the channel."""
+        pick_dm = not await self.config.user(ctx.author).pick_dm()
+        await self.config.user(ctx.author).pick_dm.set(pick_dm)
+        await ctx.send(
+            embed=quickembed.success(desc="Pick confirmations by DM are now `{}`.".format("ON" if pick_dm else "OFF"))
+        )
+
+    @commands.command(name="top-picks", aliases=["toppicks", "picks-leaderboard", "ptop"])
+    @commands.guild_only()
+    async def leaderboard(self, ctx: commands.Context, page: int = 1):
+        try:
+            leaderboard = await self.guild_leaderboard(ctx.guild.id)
+        except ResourceNotFound:
+            await ctx.send(embed=quickembed.error(desc="No Pickem stats found."))
+            return
+
+        page_i = min(max(page, 1), leaderboard.page_count()) - 1
+        active_message = await ctx.send(embed=self.leaderboard_embed(ctx, leaderboard, page_i))
+        if leaderboard.page_count() == 1:
+            return
+        valid_reactions = ["⬅️", "➡️"]
+        for valid_reaction in valid_reactions:
+            await active_message.add_reaction(valid_reaction)
+        while True:
+            try:
+                reaction, author = await self.bot.wait_for(
+                    "reaction_add",
+                    check=lambda reaction, author: author == ctx.author
+                                                   and reaction.message.id == active_message.id
+                                                   and str(reaction.emoji) in valid_reactions,
+                    timeout=30.0,
+                )
+            except asyncio.TimeoutError:
+                await active_message.clear_reactions()
+                return
+            if str(reaction.emoji) == "⬅️":
+                page_i = page_i - 1 if page_i > 0 else leaderboard.page_count() - 1
+            else:
+                page_i = page_i + 1 if page_i < leaderboard.page_count() - 1 else 0
+            await active_message.edit(embed=self.leaderboard_embed(ctx, leaderboard, page_i))
+            try:
+                await active_message.remove_reaction(reaction.emoji, author)
+            except discord.HTTPException:
+                pass
+
+    def leaderboard_embed(self, ctx: commands.Context, leaderboard: Leaderboard, page_i, per_page=10):
+        lines = []
+        for i, data in enumerate(leaderboard.page(page_i, per_page), start=page_i * per_page + 1):
+            combined_picks_closed = int(data["picks_correct"]) + int(data["picks_wrong"])
+            lines.append("{}. {} - {} correct ({:.2f}%)".format(
+                i,
+                data["username"],
+                data["picks_correct"],
+                (int(data["picks_correct"]) / (1 if combined_picks_closed == 0 else combined_picks_closed)) * 100,
+            ))
+        embed = quickembed.info(desc="\n".join(lines) if lines else "Nothing found")
+        embed.set_author(name="Pickem Leaderboard", icon_url=self.bot.user.display_avatar)
+        embed.set_footer(text="Page [{}/{}]".format(page_i + 1, leaderboard.page_count(per_page)))
+        return embed
 
     @commands.command(name="pickem", aliases=["pickems", "open"])
     async def add_pickem_prompt(self, ctx: commands.Context, subject: str, *choice_subjects: str):
@@ -158,6 +473,7 @@ class Pickem(IdleUserAPI, commands.Cog):
 
                 prompt = Prompt(prompt_data)
                 prompt.user = user
+                self.expiry_scheduler.schedule(ctx.guild.id, prompt, channel=ctx.channel)
                 active_message = await self.start_pick(ctx, prompt=prompt, user=user, active_message=confirm_message)
                 if active_message:
                     await active_message.clear_reactions()
@@ -173,34 +489,22 @@ class Pickem(IdleUserAPI, commands.Cog):
         if not user.is_registered:
             return
 
-        try:
-            open_prompts_data = await self.get_pickem_prompts(ctx.guild.id, prompt_open=1)
-        except ResourceNotFound:
+        def include(prompt: Prompt):
+            self.expiry_scheduler.schedule(ctx.guild.id, prompt)
+            return not self.expiry_scheduler.is_expired(prompt)
+
+        pages = PromptPages(
+            self.iter_pickem_prompt_pages(ctx.guild.id, prompt_open=1),
+            render=lambda prompt, page_i, pages: self.prompt_page_embed(ctx, "Open Pickems", prompt, page_i, pages),
+            include=include,
+        )
+        if await pages.get(0) is None:
             await ctx.send(
                 embed=quickembed.error(desc=f"No open Pickems available.\nCreate one with: `{ctx.prefix}pickem`",
                                        user=user))
             return
 
-        open_prompts = []
-        open_prompts_len = len(open_prompts_data)
-        for i, prompt_data in enumerate(open_prompts_data):
-            prompt = Prompt(prompt_data)
-
-            embed = quickembed.info(desc="")
-            embed.set_author(
-                name="Open Pickems",
-                icon_url=ctx.author.display_avatar
-            )
-            embed.set_footer(text="☑️ to Pick - Page [{}/{}]".format(i + 1, open_prompts_len))
-            embed.add_field(
-                name="{}".format(prompt.subject),
-                value="",
-                inline=True,
-            )
-            prompt.page_prompt_embed = embed
-            open_prompts.append(prompt)
-
-        await self.start_pick_pages(ctx, open_prompts, user)
+        await self.start_pick_pages(ctx, pages, user)
 
     @commands.command(name="close", aliases=["mypickems", "close-pickems", "close-picks"])
     async def user_pickem_prompts(self, ctx: commands.Context):
@@ -208,47 +512,49 @@ class Pickem(IdleUserAPI, commands.Cog):
         if not user.is_registered:
             return
 
-        try:
-            open_prompts_data = await self.get_pickem_prompts(ctx.guild.id, prompt_open=1, user_id=user.id)
-        except ResourceNotFound:
+        def include(prompt: Prompt):
+            self.expiry_scheduler.schedule(ctx.guild.id, prompt)
+            return True
+
+        pages = PromptPages(
+            self.iter_pickem_prompt_pages(ctx.guild.id, prompt_open=1, user_id=user.id),
+            render=lambda prompt, page_i, pages: self.prompt_page_embed(ctx, "Close Your Pickem?", prompt, page_i,
+                                                                        pages),
+            include=include,
+        )
+        if await pages.get(0) is None:
             await ctx.send(
                 embed=quickembed.error(
                     desc=f"You don't have any Pickems available.\nCreate one with: `{ctx.prefix}pickem`",
                     user=user))
             return
 
-        open_prompts = []
-        open_prompts_len = len(open_prompts_data)
-        for i, prompt_data in enumerate(open_prompts_data):
-            prompt = Prompt(prompt_data)
+        await self.start_pick_pages(ctx, pages, user, is_closing_prompt=True)
 
-            embed = quickembed.info(desc="")
-            embed.set_author(
-                name="Close Your Pickem?",
-                icon_url=ctx.author.display_avatar
-            )
-            embed.set_footer(text="☑️ to Pick - Page [{}/{}]".format(i + 1, open_prompts_len))
-            embed.add_field(
-                name="{}".format(prompt.subject),
-                value="",
-                inline=True,
-            )
-            prompt.page_prompt_embed = embed
-            open_prompts.append(prompt)
-
-        await self.start_pick_pages(ctx, open_prompts, user, is_closing_prompt=True)
+    def prompt_page_embed(self, ctx: commands.Context, title, prompt: Prompt, page_i, pages: PromptPages):
+        embed = quickembed.info(desc="")
+        embed.set_author(
+            name=title,
+            icon_url=ctx.author.display_avatar
+        )
+        embed.set_footer(text="☑️ to Pick - Page [{}/{}]".format(page_i + 1, pages.page_count_text()))
+        embed.add_field(
+            name="{}".format(prompt.subject),
+            value="",
+            inline=True,
+        )
+        return embed
 
     async def start_pick_pages(self, ctx: commands.Context,
-                               open_prompts: list[Prompt],
+                               pages: PromptPages,
                                user: User,
                                is_closing_prompt=False):
         page_i = None
-        page_i_max = len(open_prompts) - 1
-        valid_reactions = ["⬅️", "☑️", "➡️"] if len(open_prompts) > 1 else ["☑️"]
-        active_message = await ctx.send(embed=open_prompts[0].page_prompt_embed)
+        valid_reactions = ["⬅️", "☑️", "➡️"] if len(pages) > 1 or not pages.exhausted else ["☑️"]
+        active_message = await ctx.send(embed=pages.embed(0))
         while True:
             if page_i is not None:
-                embed = open_prompts[page_i].page_prompt_embed
+                embed = pages.embed(page_i)
                 await active_message.edit(embed=embed)
                 await active_message.clear_reactions()
             else:
@@ -272,26 +578,25 @@ class Pickem(IdleUserAPI, commands.Cog):
                 if str(reaction.emoji) == "⬅️":
                     # previous page
                     if page_i == 0:
-                        page_i = page_i_max
+                        page_i = await pages.last_index()
                     else:
                         page_i -= 1
                     continue
                 elif str(reaction.emoji) == "➡️":
                     # next page
-                    if page_i >= page_i_max:
+                    if await pages.get(page_i + 1) is None:
                         page_i = 0
                     else:
                         page_i += 1
                     continue
                 elif str(reaction.emoji) == "☑️":
-                    selected_prompt = open_prompts[page_i]
+                    selected_prompt = pages.prompts[page_i]
                     if not selected_prompt.choices:
-                        selected_prompt_data = await self.get_pickem_prompt_by_id(open_prompts[page_i].id)
+                        selected_prompt_data = await self.get_pickem_prompt_by_id(selected_prompt.id)
                         selected_prompt = Prompt(selected_prompt_data)
-                        selected_prompt.page_prompt_embed = open_prompts[page_i].page_prompt_embed
                         user_data = await self.get_user_by_id(selected_prompt.user_id)
                         selected_prompt.user = User(user_data)
-                        open_prompts[page_i] = selected_prompt
+                        pages.replace(page_i, selected_prompt)
 
                     if is_closing_prompt:
                         return await self.start_close_pickem_prompt(ctx,
@@ -332,10 +637,55 @@ class Pickem(IdleUserAPI, commands.Cog):
                 await active_message.clear_reactions()
                 return
 
+    def prompt_tally(self, prompt: Prompt) -> PromptTally:
+        if prompt.id not in self.prompt_tallies:
+            self.prompt_tallies[prompt.id] = PromptTally(prompt)
+            if len(self.prompt_tallies) > PROMPT_TALLIES_SIZE:
+                self.forget_prompt_tally(next(iter(self.prompt_tallies)))
+        self.prompt_tallies.move_to_end(prompt.id)
+        return self.prompt_tallies[prompt.id]
+
+    def forget_prompt_tally(self, prompt_id):
+        self.prompt_tallies.pop(prompt_id, None)
+        self.tally_reconcile_tasks.pop(prompt_id, None)
+
+    def prune_prompt_tallies(self, open_prompt_ids):
+        """Drop tallies of prompts that are no longer open."""
+        for prompt_id in [prompt_id for prompt_id in self.prompt_tallies if prompt_id not in open_prompt_ids]:
+            self.forget_prompt_tally(prompt_id)
+
+    def reconcile_prompt_tally(self, prompt_id, on_done=None):
+        """Refresh a tally from the backend in the background if it is due."""
+        tally = self.prompt_tallies.get(prompt_id)
+        if tally is None or not tally.is_stale(TALLY_RECONCILE_SECONDS):
+            return
+        if self.event_stream.covers(tally.reconciled_at):
+            # kept current by the event stream
+            return
+        task = self.tally_reconcile_tasks.get(prompt_id)
+        if task is not None and not task.done():
+            return
+
+        async def reconcile():
+            try:
+                prompt = Prompt(await self.get_pickem_prompt_by_id(prompt_id))
+            except IdleUserAPIError as e:
+                log.warning("Unable to reconcile pickem {} tally: {}".format(prompt_id, e))
+                return
+            finally:
+                if self.tally_reconcile_tasks.get(prompt_id) is asyncio.current_task():
+                    del self.tally_reconcile_tasks[prompt_id]
+            tally.reconcile(prompt)
+            if on_done is not None:
+                on_done()
+
+        self.tally_reconcile_tasks[prompt_id] = asyncio.create_task(reconcile())
+
     async def start_pick(self, ctx: commands.Context, prompt: Prompt, user: User,
                          active_message: discord.Message = None,
                          allow_back=False):
-        prompt_embed = prompt.info_embed(caller=user, custom_title="Picks Started (everyone can pick)")
+        tally = self.prompt_tally(prompt)
+        prompt_embed = prompt.info_embed(caller=user, custom_title="Picks Started (everyone can pick)", tally=tally)
         if active_message is None:
             active_message = await ctx.send(embed=prompt_embed)
         else:
@@ -353,6 +703,8 @@ class Pickem(IdleUserAPI, commands.Cog):
         if allow_back:
             await active_message.add_reaction("❌")
 
+        live_message = LivePromptMessage(active_message, prompt, tally, caller=user,
+                                         custom_title="Picks Started (everyone can pick)")
         try:
             while True:
                 reaction, author = await self.bot.wait_for(
@@ -366,45 +718,80 @@ class Pickem(IdleUserAPI, commands.Cog):
                 elif str(reaction.emoji) != "❌" and str(reaction.emoji) in Choice.choice_emojis:
                     pick_choice_i = Choice.choice_emojis.index(str(reaction.emoji))
                     pick_choice = prompt.choices[pick_choice_i]
-                    await self.start_pick_submit(ctx, author, prompt, pick_choice)
+                    if await self.start_pick_submit(ctx, author, prompt, pick_choice):
+                        live_message.touch()
+                        self.reconcile_prompt_tally(prompt.id, on_done=live_message.touch)
         except asyncio.TimeoutError:
+            live_message.close()
             prompt_embed = prompt.info_embed(caller=user,
                                              custom_title=f"Picks Closed - `{ctx.prefix}picks` to start again",
-                                             red=True)
+                                             red=True,
+                                             tally=tally)
             await active_message.edit(embed=prompt_embed)
             await active_message.clear_reactions()
             return False
+        finally:
+            live_message.close()
+            self.pick_feeds.pop((ctx.channel.id, prompt.id), None)
 
     async def start_pick_submit(self, ctx: commands.Context, author, prompt: Prompt, choice: Choice):
         user = await self.grab_user(ctx, author, registration_required_message=True)
         if not user.is_registered:
-            return
+            return False
 
-        put_title = None
+        if self.expiry_scheduler.is_expired(prompt):
+            await ctx.send(embed=quickembed.error(desc="This Pickem has expired. Picks are locked.", user=user),
+                           delete_after=10)
+            return False
+
+        previous_choice_id = self.known_picks.get((user.id, prompt.id))
         try:
-            try:
-                await self.post_pickem_pick(user.id, prompt.id, choice.id)
-                put_title = "Pick Added"
-            except ConflictError as e:
-                await self.patch_pickem_pick(user.id, prompt.id, choice.id)
-                put_title = "Pick Updated"
+            updated = await self.submit_pickem_pick(user.id, prompt.id, choice.id)
         except IdleUserAPIError as e:
-            embed = quickembed.error(desc=str(e), user=user)
+            await ctx.send(embed=quickembed.error(desc=str(e), user=user))
+            return False
 
-        if put_title:
-            embed = quickembed.success(desc="{}".format(prompt.subject))
-            embed.set_author(
-                name="{} - {}".format(user.username, put_title),
-                icon_url=user.discord.display_avatar
-            )
-            embed.set_footer(text="You are allowed update existing picks. [pickem {}]".format(prompt.id))
-            embed.add_field(
-                name="{}".format(choice.subject),
-                value="",
-                inline=True,
-            )
+        tally = self.prompt_tally(prompt)
+        # while the event stream covers the tally, the pick's own event counts it
+        if not self.event_stream.covers(tally.reconciled_at):
+            if updated is not False and previous_choice_id is None:
+                # the replaced choice is unknown; count the new one and let the backend settle it
+                tally.invalidate()
+            tally.apply(previous_choice_id, choice.id)
+
+        put_title = {True: "Pick Updated", False: "Pick Added", None: "Pick Saved"}[updated]
+        embed = quickembed.success(desc="{}".format(prompt.subject))
+        embed.set_author(
+            name="{} - {}".format(user.username, put_title),
+            icon_url=user.discord.display_avatar
+        )
+        embed.set_footer(text="You are allowed update existing picks. [pickem {}]".format(prompt.id))
+        embed.add_field(
+            name="{}".format(choice.subject),
+            value="",
+            inline=True,
+        )
 
-        await ctx.send(embed=embed)
+        if await self.config.guild(ctx.guild).pick_ack_mode() == "feed":
+            feed_key = (ctx.channel.id, prompt.id)
+            if feed_key not in self.pick_feeds:
+                self.pick_feeds[feed_key] = PickFeed(ctx.channel, prompt, tally)
+            self.pick_feeds[feed_key].add(user, choice, updated=updated)
+            if await self.config.user(author).pick_dm():
+                await self.send_pick_dm(user, embed)
+        elif await self.config.user(author).pick_dm():
+            if not await self.send_pick_dm(user, embed):
+                await ctx.send(embed=embed)
+        else:
+            await ctx.send(embed=embed)
+        return True
+
+    async def send_pick_dm(self, user: User, embed: discord.Embed):
+        try:
+            await user.discord.send(embed=embed)
+            return True
+        except discord.HTTPException:
+            return False
 
     async def start_close_pickem_prompt(self, ctx: commands.Context, prompt: Prompt, user: User,
                                         active_message: discord.Message = None):
@@ -451,6 +838,12 @@ class Pickem(IdleUserAPI, commands.Cog):
 
         try:
             await self.patch_pickem_prompt(user_id=user.id, prompt_id=prompt.id, prompt_open=0, choice_result=choice.id)
+            self.expiry_scheduler.unschedule(prompt.id)
+            self.forget_prompt_tally(prompt.id)
+            leaderboard = self.leaderboards.get(ctx.guild.id)
+            # while the event stream covers the leaderboard, the prompt's close event updates it
+            if leaderboard is not None and not self.event_stream.covers(leaderboard.refreshed_at):
+                asyncio.create_task(self.update_leaderboard_for_closed_prompt(ctx.guild.id, prompt, choice))
             embed = quickembed.success(desc="{}".format(prompt.subject))
             embed.set_author(
                 name="Pickem Closed - Result Added",
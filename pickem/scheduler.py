@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import OrderedDict
+
+from .entities import Prompt
+
+log = logging.getLogger("red.idleuser-cogs.pickem")
+
+# ids of handled expirations kept so later sightings of the prompt are not handled again
+EXPIRED_PROMPTS_REMEMBERED = 1024
+
+
+class ExpiryScheduler:
+    """Tracks open prompt expirations and acts on them as they pass.
+
+    Expirations are kept in a min-heap per guild. The scheduler sleeps until the
+    earliest deadline (or until an earlier one is scheduled), marks the prompts
+    that passed as expired and hands them to `on_expired`. A prompt is forgotten
+    once its expiration has been handled, and its id once it is no longer listed
+    as open or more than `EXPIRED_PROMPTS_REMEMBERED` others expired after it.
+    """
+
+    def __init__(self, on_expired):
+        self.on_expired = on_expired
+        # guild_id -> heap of (expires_at_epoch, prompt_id)
+        self.heaps = {}
+        # prompt_id -> (guild_id, prompt, channel)
+        self.prompts = {}
+        # prompt_id -> None, most recently expired last
+        self.expired = OrderedDict()
+        self.wakeup = asyncio.Event()
+
+    def schedule(self, guild_id, prompt: Prompt, channel=None):
+        if prompt.id in self.expired:
+            return
+        known = self.prompts.get(prompt.id)
+        if known is not None:
+            # keep what was learned from an earlier sighting, e.g. the creator's discord user
+            if prompt.user is None:
+                prompt.user = known[1].user
+            channel = channel or known[2]
+        self.prompts[prompt.id] = (guild_id, prompt, channel)
+        if known is not None and known[1].expires_at_epoch == prompt.expires_at_epoch:
+            return
+        heap = self.heaps.setdefault(guild_id, [])
+        heapq.heappush(heap, (prompt.expires_at_epoch, prompt.id))
+        next_deadline = self.next_deadline()
+        if next_deadline is None or prompt.expires_at_epoch <= next_deadline:
+            self.wakeup.set()
+
+    def unschedule(self, prompt_id):
+        # heap entries are dropped lazily once they reach the top
+        self.prompts.pop(prompt_id, None)
+        self.expired.pop(prompt_id, None)
+
+    def prune(self, open_prompt_ids):
+        """Forget prompts that are no longer open, e.g. closed while the cog was not listening."""
+        for prompt_id in [prompt_id for prompt_id in self.prompts if prompt_id not in open_prompt_ids]:
+            del self.prompts[prompt_id]
+        for prompt_id in [prompt_id for prompt_id in self.expired if prompt_id not in open_prompt_ids]:
+            del self.expired[prompt_id]
+
+    def is_expired(self, prompt: Prompt):
+        return prompt.id in self.expired or prompt.expires_at_epoch <= time.time()
+
+    def is_current(self, prompt_id, expires_at_epoch):
+        known = self.prompts.get(prompt_id)
+        return known is not None and known[1].expires_at_epoch == expires_at_epoch and prompt_id not in self.expired
+
+    def next_deadline(self):
+        next_deadline = None
+        for guild_id in list(self.heaps):
+            heap = self.heaps[guild_id]
+            while heap and not self.is_current(heap[0][1], heap[0][0]):
+                heapq.heappop(heap)
+            if not heap:
+                del self.heaps[guild_id]
+            elif next_deadline is None or heap[0][0] < next_deadline:
+                next_deadline = heap[0][0]
+        return next_deadline
+
+    def pop_expired(self, now):
+        expired = []
+        for heap in self.heaps.values():
+            while heap and heap[0][0] <= now:
+                expires_at_epoch, prompt_id = heapq.heappop(heap)
+                if self.is_current(prompt_id, expires_at_epoch):
+                    self.expired[prompt_id] = None
+                    if len(self.expired) > EXPIRED_PROMPTS_REMEMBERED:
+                        self.expired.popitem(last=False)
+                    expired.append(self.prompts.pop(prompt_id))
+        return expired
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            next_deadline = self.next_deadline()
+            timeout = None if next_deadline is None else max(0.0, next_deadline - time.time())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            for guild_id, prompt, channel in self.pop_expired(time.time()):
+                try:
+                    await self.on_expired(guild_id, prompt, channel)
+                except Exception:
+                    log.exception("Error handling expired pickem {}".format(prompt.id))
@@ -0,0 +1,46 @@
+import time
+
+from .entities import Prompt
+
+
+class PromptTally:
+    """In-memory per-choice pick counts for a prompt.
+
+    Counts start from what the API returned and are updated incrementally on
+    every pick made through this cog. `reconcile` resets them from a fresh
+    prompt so picks made elsewhere are eventually reflected.
+    """
+
+    def __init__(self, prompt: Prompt):
+        self.prompt_id = prompt.id
+        self.counts = {}
+        self.reconciled_at = 0.0
+        self.reconcile(prompt)
+
+    def reconcile(self, prompt: Prompt):
+        self.counts = {choice.id: int(choice.picks or 0) for choice in prompt.choices}
+        self.reconciled_at = time.monotonic()
+
+    def invalidate(self):
+        self.reconciled_at = 0.0
+
+    def is_stale(self, max_age):
+        return time.monotonic() - self.reconciled_at > max_age
+
+    def apply(self, previous_choice_id, choice_id):
+        if previous_choice_id == choice_id:
+            return
+        if previous_choice_id in self.counts and self.counts[previous_choice_id] > 0:
+            self.counts[previous_choice_id] -= 1
+        self.counts[choice_id] = self.counts.get(choice_id, 0) + 1
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def count(self, choice_id):
+        return self.counts.get(choice_id, 0)
+
+    def percent(self, choice_id):
+        total = self.total
+        return (self.count(choice_id) / total) * 100 if total else 0.0
@@ -0,0 +1,256 @@
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# upper bounds in seconds, the last bucket catches everything slower
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+ROUTE_ID = re.compile(r"(?<=/)\d+(?=/|$)")
+
+# timing of the command running in the current task, if any
+current_command = ContextVar("pickem_current_command", default=None)
+
+
+def route_template(route):
+    """Collapse ids and query strings so one route is one series, e.g. `pickem/prompts/{id}`."""
+    return ROUTE_ID.sub("{id}", route.split("?", 1)[0])
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = Counter()
+        self.bytes = 0
+        self.decode_seconds = 0.0
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.failures = 0
+        self.api_seconds = 0.0
+        self.discord_seconds = 0.0
+
+
+class RouteSample:
+    __slots__ = ("bytes", "decode_seconds")
+
+    def __init__(self):
+        self.bytes = 0
+        self.decode_seconds = 0.0
+
+
+class CommandTiming:
+    __slots__ = ("started", "api", "discord")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.api = 0.0
+        self.discord = 0.0
+
+
+class Metrics:
+    """Request and command timings for one cog.
+
+    Routes are keyed by `(method, route template)` and commands by qualified name.
+    API and Discord time of a command are summed over its requests, so concurrent
+    requests can add up to more than the command took. Commands timed from outside
+    their own task, such as from listeners, cannot see those requests, so they are
+    kept with `call_timing` off and only their latency and failures are reported.
+    """
+
+    def __init__(self, call_timing=True):
+        self.call_timing = call_timing
+        self.routes = defaultdict(RouteStats)
+        self.commands = defaultdict(CommandStats)
+        self.since = time.time()
+
+    @contextmanager
+    def time_route(self, method, route):
+        sample = RouteSample()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield sample
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = self.routes[(method, route_template(route))]
+            stats.latency.observe(elapsed)
+            stats.bytes += sample.bytes
+            stats.decode_seconds += sample.decode_seconds
+            if error is not None:
+                stats.errors[type(error).__name__] += 1
+            timing = current_command.get()
+            if timing is not None:
+                timing.api += elapsed
+
+    def command_started(self, ctx):
+        ctx.command_timing = CommandTiming()
+        if self.call_timing:
+            current_command.set(ctx.command_timing)
+
+    def command_finished(self, ctx):
+        timing = getattr(ctx, "command_timing", None)
+        if timing is None:
+            return
+        if self.call_timing:
+            current_command.set(None)
+        stats = self.commands[ctx.command.qualified_name]
+        stats.latency.observe(time.perf_counter() - timing.started)
+        stats.api_seconds += timing.api
+        stats.discord_seconds += timing.discord
+        if ctx.command_failed:
+            stats.failures += 1
+
+    def reset(self):
+        self.routes.clear()
+        self.commands.clear()
+        self.since = time.time()
+
+
+class DiscordTimer:
+    """Adds time spent in Discord REST calls to the command running in the calling task.
+
+    Installed over the bot's HTTP client `request` method. When removed while another
+    wrapper sits on top of it, it is unlinked from under that wrapper.
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.original = None
+        self.shadowed = False
+        self.active = False
+
+    def install(self):
+        self.shadowed = "request" in self.http.__dict__
+        self.original = self.http.request
+        self.http.request = self.request
+        self.active = True
+
+    def uninstall(self):
+        self.active = False
+        wrapped = self.http.__dict__.get("request")
+        if wrapped == self.request:
+            if self.shadowed:
+                self.http.request = self.original
+            else:
+                del self.http.request
+            return
+        # timers from other cogs wrap each other through `original`
+        while wrapped is not None:
+            wrapper = getattr(wrapped, "__self__", None)
+            below = getattr(wrapper, "original", None)
+            if below == self.request:
+                wrapper.original = self.original
+                wrapper.shadowed = self.shadowed
+                return
+            wrapped = below
+
+    async def request(self, *args, **kwargs):
+        timing = current_command.get()
+        if timing is None or not self.active:
+            return await self.original(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await self.original(*args, **kwargs)
+        finally:
+            timing.discord += time.perf_counter() - started
+
+
+def label_text(labels):
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        yield "{}_bucket{} {}".format(name, label_text(labels + [("le", le)]), cumulative)
+    yield "{}_sum{} {}".format(name, label_text(labels), histogram.sum)
+    yield "{}_count{} {}".format(name, label_text(labels), histogram.count)
+
+
+def prometheus_text(metrics_by_cog):
+    """Render `{cog name: Metrics}` in the Prometheus text exposition format."""
+    families = {
+        "idleuser_api_request_duration_seconds": ("histogram", "API request latency."),
+        "idleuser_api_request_errors_total": ("counter", "API requests that raised, by error class."),
+        "idleuser_api_response_bytes_total": ("counter", "API response body bytes received."),
+        "idleuser_api_decode_seconds_total": ("counter", "Time spent decoding API response JSON."),
+        "idleuser_command_duration_seconds": ("histogram", "Command latency from invoke to completion."),
+        "idleuser_command_failures_total": ("counter", "Commands that raised."),
+        "idleuser_command_api_seconds_total": ("counter", "Time commands spent awaiting the API."),
+        "idleuser_command_discord_seconds_total": ("counter", "Time commands spent awaiting Discord REST calls."),
+    }
+    samples = {name: [] for name in families}
+    for cog, metrics in sorted(metrics_by_cog.items()):
+        for (method, route), stats in sorted(metrics.routes.items()):
+            labels = [("cog", cog), ("method", method), ("route", route)]
+            samples["idleuser_api_request_duration_seconds"].extend(
+                histogram_lines("idleuser_api_request_duration_seconds", labels, stats.latency)
+            )
+            for error, count in sorted(stats.errors.items()):
+                samples["idleuser_api_request_errors_total"].append(
+                    "idleuser_api_request_errors_total{} {}".format(label_text(labels + [("error", error)]), count)
+                )
+            samples["idleuser_api_response_bytes_total"].append(
+                "idleuser_api_response_bytes_total{} {}".format(label_text(labels), stats.bytes)
+            )
+            samples["idleuser_api_decode_seconds_total"].append(
+                "idleuser_api_decode_seconds_total{} {}".format(label_text(labels), stats.decode_seconds)
+            )
+        for command, stats in sorted(metrics.commands.items()):
+            labels = [("cog", cog), ("command", command)]
+            samples["idleuser_command_duration_seconds"].extend(
+                histogram_lines("idleuser_command_duration_seconds", labels, stats.latency)
+            )
+            values = [("idleuser_command_failures_total", stats.failures)]
+            if metrics.call_timing:
+                values += [
+                    ("idleuser_command_api_seconds_total", stats.api_seconds),
+                    ("idleuser_command_discord_seconds_total", stats.discord_seconds),
+                ]
+            for name, value in values:
+                samples[name].append("{}{} {}".format(name, label_text(labels), value))
+    lines = []
+    for name, (kind, description) in families.items():
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} {}".format(name, kind))
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
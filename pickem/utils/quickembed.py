@@ -12,60 +12,73 @@ color = {
 }
 
 
-def filler(embed, desc, footer, user):
-    if user:
+# Colour objects built once rather than converted on every embed
+colours = {name: discord.Colour(value) for name, value in color.items()}
+
+
+def user_template(user):
+    """Return the author and default footer for a user's embeds, built once per user object.
+
+    Returns `(author, footer_text, author_name_is_desc)`.
+    """
+    template = getattr(user, "embed_template", None)
+    if template is None:
         if user.discord.bot:
-            embed.set_author(name=desc, icon_url=user.display_avatar)
+            template = ({"icon_url": user.discord.display_avatar}, None, True)
         elif user.is_registered:
-            embed.set_author(
-                name="{0.discord.display_name} ({0.username})".format(user),
-                icon_url=user.discord.display_avatar,
-                url=user.url,
+            template = (
+                {
+                    "name": "{0.discord.display_name} ({0.username})".format(user),
+                    "icon_url": user.discord.display_avatar,
+                    "url": user.url,
+                },
+                None,
+                False,
             )
         else:
-            embed.set_author(name=user.discord, icon_url=user.discord.display_avatar)
-            embed.set_footer(text="User not registered.")
-        embed.description = desc
-        if footer:
-            embed.set_footer(text=footer)
+            template = (
+                {"name": user.discord, "icon_url": user.discord.display_avatar},
+                "User not registered.",
+                False,
+            )
+        user.embed_template = template
+    return template
+
+
+def build(colour, desc, footer, user):
+    embed = discord.Embed(colour=colour, description=desc)
+    if user:
+        author, default_footer, author_name_is_desc = user_template(user)
+        if author_name_is_desc:
+            embed.set_author(name=desc, **author)
+        else:
+            embed.set_author(**author)
+        if footer or default_footer:
+            embed.set_footer(text=footer or default_footer)
     else:
         embed.set_author(name="Notification")
-
-    embed.description = desc
     return embed
 
 
 def general(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["blue"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["blue"], desc, footer, user)
 
 
 def info(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["white"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["white"], desc, footer, user)
 
 
 def error(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["red"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["red"], desc, footer, user)
 
 
 def success(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["green"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["green"], desc, footer, user)
 
 
 def question(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["yellow"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["yellow"], desc, footer, user)
 
 
 def notice(desc, footer=None, user=None):
-    embed = discord.Embed(color=color["orange"])
-    embed = filler(embed=embed, desc=desc, footer=footer, user=user)
-    return embed
+    return build(colours["orange"], desc, footer, user)
@@ -0,0 +1,63 @@
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+# timestamps from api.idleuser.com are in Pacific time without an offset,
+# overridable with the `timezone` shared API token of the `idleuser` service
+DEFAULT_API_TIMEZONE_NAME = "America/Los_Angeles"
+
+API_TIMEZONE_NAME = None
+API_TIMEZONE = None
+
+
+def set_api_timezone(name=None) -> bool:
+    """Interpret API timestamps in the IANA time zone `name`, or the default if not given.
+
+    Returns False if the zone is unavailable and local time is used instead.
+    """
+    global API_TIMEZONE_NAME, API_TIMEZONE
+    name = name or DEFAULT_API_TIMEZONE_NAME
+    if name == API_TIMEZONE_NAME:
+        return API_TIMEZONE is not None
+    timezone = None
+    if ZoneInfo is not None:
+        try:
+            timezone = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    API_TIMEZONE_NAME, API_TIMEZONE = name, timezone
+    parse_timestamp.cache_clear()
+    timestamp_epoch.cache_clear()
+    return timezone is not None
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> datetime:
+    """Parse an API `YYYY-MM-DD HH:MM:SS` timestamp into an aware datetime."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None and API_TIMEZONE is not None:
+        dt = dt.replace(tzinfo=API_TIMEZONE)
+    return dt
+
+
+@lru_cache(maxsize=4096)
+def timestamp_epoch(value: str) -> int:
+    return int(parse_timestamp(value).timestamp())
+
+
+set_api_timezone()
+
+
+def format_age(seconds) -> str:
+    """Describe how old cached data is, e.g. `just now` or `3m ago`."""
+    if seconds is None or seconds < 5:
+        return "just now"
+    if seconds < 60:
+        return "{}s ago".format(int(seconds))
+    if seconds < 3600:
+        return "{}m ago".format(int(seconds // 60))
+    return "{}h ago".format(int(seconds // 3600))
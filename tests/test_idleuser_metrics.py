@@ -0,0 +1,41 @@
+from idleuser.utils.metrics import DiscordTimer, Metrics, prometheus_text
+
+
+class HTTP:
+    async def request(self, *args, **kwargs):
+        return args
+
+
+def chain_depth(http):
+    depth, request = 0, http.request
+    while request.__self__ is not http:
+        depth += 1
+        request = request.__self__.original
+    return depth
+
+
+def test_reinstalled_timer_under_another_is_unlinked():
+    http = HTTP()
+    below, above = DiscordTimer(http), DiscordTimer(http)
+    below.install()
+    above.install()
+    for _ in range(3):
+        below.uninstall()
+        below = DiscordTimer(http)
+        below.install()
+    assert chain_depth(http) == 2
+
+    above.uninstall()
+    below.uninstall()
+    assert "request" not in http.__dict__
+
+
+def test_listener_timed_metrics_leave_out_call_time():
+    metrics = Metrics(call_timing=False)
+    metrics.commands["userlist"].latency.observe(0.1)
+
+    text = prometheus_text({"UserList": metrics})
+
+    assert 'idleuser_command_failures_total{cog="UserList",command="userlist"} 0' in text
+    assert "idleuser_command_api_seconds_total{" not in text
+    assert "idleuser_command_discord_seconds_total{" not in text
@@ -0,0 +1,156 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from pickem import api as pickem_api
+from pickem.api import IdleUserAPI
+from pickem.errors import ResourceNotFound
+
+
+def make_prompts(count):
+    return [{"id": prompt_id, "subject": "Prompt {}".format(prompt_id)} for prompt_id in range(1, count + 1)]
+
+
+class PagedAPI(IdleUserAPI):
+    def __init__(self, prompts, honour_paging=True):
+        super().__init__(bot=None)
+        self.prompts = prompts
+        self.honour_paging = honour_paging
+        self.calls = 0
+
+    async def get_pickem_prompts(self, group_id, prompt_open=None, user_id=None, limit=None, offset=None):
+        self.calls += 1
+        prompts = self.prompts
+        if self.honour_paging:
+            prompts = prompts[offset:offset + limit]
+        if not prompts:
+            raise ResourceNotFound("No pickems found.")
+        return prompts
+
+
+def collect_pages(api, page_size=10):
+    async def collect():
+        return [page async for page in api.iter_pickem_prompt_pages(1, page_size=page_size)]
+
+    return asyncio.run(collect())
+
+
+def page_ids(pages):
+    return [[prompt["id"] for prompt in page] for page in pages]
+
+
+def test_pages_follow_offset():
+    pages = collect_pages(PagedAPI(make_prompts(25)))
+    assert page_ids(pages) == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+
+
+def test_exact_multiple_of_page_size_stops_at_not_found():
+    pages = collect_pages(PagedAPI(make_prompts(20)))
+    assert page_ids(pages) == [list(range(1, 11)), list(range(11, 21))]
+
+
+def test_unpaged_backend_is_split_into_pages():
+    api = PagedAPI(make_prompts(25), honour_paging=False)
+    pages = collect_pages(api)
+    assert page_ids(pages) == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    assert api.calls == 1
+
+
+def test_unpaged_backend_with_exactly_one_page_stops():
+    api = PagedAPI(make_prompts(10), honour_paging=False)
+    pages = collect_pages(api)
+    assert page_ids(pages) == [list(range(1, 11))]
+    assert api.calls == 2
+
+
+def test_nested_prompt_payloads_are_compared_by_id():
+    prompts = [{"prompt": prompt, "choices": []} for prompt in make_prompts(10)]
+    pages = collect_pages(PagedAPI(prompts, honour_paging=False))
+    assert len(pages) == 1
+
+
+def test_known_picks_are_bounded(monkeypatch):
+    monkeypatch.setattr(pickem_api, "KNOWN_PICKS_SIZE", 3)
+    api = IdleUserAPI(bot=None)
+    for prompt_id in range(1, 5):
+        api.remember_known_pick(1, prompt_id, 10)
+    api.remember_known_pick(1, 2, 20)
+    api.remember_known_pick(1, 5, 10)
+
+    assert list(api.known_picks) == [(1, 4), (1, 2), (1, 5)]
+    assert api.known_picks[(1, 2)] == 20
+
+
+def test_prune_known_picks_keeps_open_prompts():
+    api = IdleUserAPI(bot=None)
+    for prompt_id in (1, 2, 3):
+        api.remember_known_pick(7, prompt_id, 10)
+
+    api.prune_known_picks({2})
+
+    assert list(api.known_picks) == [(7, 2)]
+
+
+class UnreachableOptionsAPI(IdleUserAPI):
+    def __init__(self):
+        super().__init__(bot=None)
+        self.checks = 0
+
+    async def options_idleusercom_response(self, route):
+        self.checks += 1
+        raise aiohttp.ClientConnectionError()
+
+
+def test_failed_upsert_check_is_remembered():
+    api = UnreachableOptionsAPI()
+
+    async def check_twice():
+        return [await api.pickem_pick_upsert_available() for _ in range(2)]
+
+    assert asyncio.run(check_twice()) == [False, False]
+    assert api.checks == 1
+
+    api.pick_upsert_recheck_at = 0
+    asyncio.run(api.pickem_pick_upsert_available())
+    assert api.checks == 2
+
+
+class LocalAPI(IdleUserAPI):
+    def __init__(self, api_url):
+        super().__init__(bot=None)
+        self.api_url = api_url
+
+    async def stored_auth_token(self):
+        return {"api_url": self.api_url}
+
+
+def test_conditional_get_results_are_not_shared():
+    async def prompts(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({"data": [{"id": 1, "picks": 0}]}, headers={"ETag": '"v1"'})
+
+    async def fetch_twice():
+        app = web.Application()
+        app.router.add_get("/pickem/prompts", prompts)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            api = LocalAPI("http://127.0.0.1:{}/".format(port))
+            first = await api.get_idleusercom_response("pickem/prompts")
+            first[0]["picks"] = 99
+            second = await api.get_idleusercom_response("pickem/prompts")
+            other = LocalAPI("http://localhost:{}/".format(port))
+            other.conditional_cache = api.conditional_cache
+            await other.get_idleusercom_response("pickem/prompts")
+            return second, list(api.conditional_cache)
+        finally:
+            await runner.cleanup()
+
+    second, keys = asyncio.run(fetch_twice())
+    assert second == [{"id": 1, "picks": 0}]
+    assert [key[0] for key in keys] == [keys[0][0], keys[0][0].replace("127.0.0.1", "localhost")]
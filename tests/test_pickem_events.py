@@ -0,0 +1,39 @@
+import asyncio
+
+from pickem.utils.events import iter_server_sent_events
+
+
+async def stream(*lines):
+    for line in lines:
+        yield line
+
+
+def collect(*lines):
+    async def run():
+        return [event async for event in iter_server_sent_events(stream(*lines))]
+
+    return asyncio.run(run())
+
+
+def test_events_are_split_on_blank_lines():
+    events = collect(
+        b"event: pickem.pick\n",
+        b'data: {"pick": 1}\n',
+        b"\n",
+        b'data: {"pick": 2}\r\n',
+        b"\r\n",
+    )
+    assert events == [("pickem.pick", '{"pick": 1}'), ("message", '{"pick": 2}')]
+
+
+def test_multiline_data_is_joined():
+    assert collect(b"data: first\n", b"data:second\n", b"\n") == [("message", "first\nsecond")]
+
+
+def test_comments_and_empty_events_are_skipped():
+    events = collect(b": heartbeat\n", b"\n", b"event: pickem.prompt\n", b"\n", b"id: 3\n", b"data: x\n", b"\n")
+    assert events == [("message", "x")]
+
+
+def test_unterminated_event_is_dropped():
+    assert collect(b"event: pickem.pick\n", b"data: partial\n") == []
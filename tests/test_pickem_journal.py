@@ -0,0 +1,116 @@
+import sqlite3
+import time
+
+from pickem.utils import journal
+from pickem.utils.journal import MutationJournal
+
+
+def test_pending_lists_unanswered_mutations_oldest_first(tmp_path):
+    mutations = MutationJournal(tmp_path / "journal.sqlite3")
+    first = mutations.begin("POST", "pickem/pick", {"choice_id": 1})
+    answered = mutations.begin("PATCH", "pickem/pick", {"choice_id": 2})
+    rejected = mutations.begin("PUT", "pickem/pick", {"choice_id": 3})
+    last = mutations.begin("PATCH", "pickem/prompt", {"open": 0})
+    mutations.finish(answered)
+    mutations.finish(rejected, "rejected")
+
+    pending = mutations.pending()
+    assert [(key, method, route, payload) for key, method, route, payload, _ in pending] == [
+        (first, "POST", "pickem/pick", {"choice_id": 1}),
+        (last, "PATCH", "pickem/prompt", {"open": 0}),
+    ]
+    mutations.close()
+
+
+def test_pending_survives_reopening(tmp_path):
+    path = tmp_path / "journal.sqlite3"
+    mutations = MutationJournal(path)
+    key = mutations.begin("POST", "pickem/prompt", {"subject": "Who wins?"})
+    mutations.close()
+
+    reopened = MutationJournal(path)
+    assert [entry[0] for entry in reopened.pending()] == [key]
+    reopened.close()
+
+
+def test_compact_drops_answered_mutations_past_retention(tmp_path, monkeypatch):
+    mutations = MutationJournal(tmp_path / "journal.sqlite3")
+    old = mutations.begin("POST", "pickem/pick", {})
+    mutations.finish(old)
+    unanswered = mutations.begin("POST", "pickem/pick", {})
+    monkeypatch.setattr(journal, "RETENTION_SECONDS", -1)
+    mutations.compact()
+
+    keys = {key for (key,) in mutations.db.execute("SELECT key FROM journal")}
+    assert keys == {unanswered}
+    mutations.close()
+
+
+def test_keys_are_unique():
+    assert len({journal.idempotency_key() for _ in range(100)}) == 100
+
+
+def test_recorded_at_is_wall_clock(tmp_path):
+    mutations = MutationJournal(tmp_path / "journal.sqlite3")
+    mutations.begin("POST", "pickem/pick", {})
+    (_, _, _, _, recorded_at), = mutations.pending()
+    assert abs(recorded_at - time.time()) < 60
+    mutations.close()
+
+
+def test_answered_mutation_supersedes_older_ones_of_its_target(tmp_path):
+    mutations = MutationJournal(tmp_path / "journal.sqlite3")
+    older = mutations.begin("PATCH", "pickem/pick", {"choice_id": 1}, target="pick 1 2")
+    other = mutations.begin("PATCH", "pickem/pick", {"choice_id": 1}, target="pick 1 3")
+    newer = mutations.begin("PATCH", "pickem/pick", {"choice_id": 2}, target="pick 1 2")
+    mutations.finish(newer)
+
+    assert [entry[0] for entry in mutations.pending()] == [other]
+    mutations.close()
+
+
+def test_only_the_newest_pending_mutation_of_a_target_is_kept_on_open(tmp_path):
+    path = tmp_path / "journal.sqlite3"
+    mutations = MutationJournal(path)
+    mutations.begin("POST", "pickem/pick", {"choice_id": 1}, target="pick 1 2")
+    newest = mutations.begin("PATCH", "pickem/pick", {"choice_id": 2}, target="pick 1 2")
+    untargeted = mutations.begin("POST", "pickem/pick", {"choice_id": 3})
+    mutations.close()
+
+    reopened = MutationJournal(path)
+    assert [entry[0] for entry in reopened.pending()] == [newest, untargeted]
+    reopened.close()
+
+
+def test_journals_without_targets_are_migrated(tmp_path):
+    path = tmp_path / "journal.sqlite3"
+    db = sqlite3.connect(str(path))
+    db.execute(
+        "CREATE TABLE journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, state TEXT NOT NULL, "
+        "method TEXT, route TEXT, payload TEXT, recorded_at REAL NOT NULL)"
+    )
+    db.execute(
+        "INSERT INTO journal (key, state, method, route, payload, recorded_at) VALUES ('old', 'pending', 'POST', 'pickem/pick', '{}', ?)",
+        (time.time(),),
+    )
+    db.commit()
+    db.close()
+
+    mutations = MutationJournal(path)
+    mutations.begin("POST", "pickem/pick", {}, target="pick 1 2")
+    assert [entry[0] for entry in mutations.pending()][0] == "old"
+    mutations.close()
+
+
+def test_forget_deletes_every_row_of_matching_mutations(tmp_path):
+    mutations = MutationJournal(tmp_path / "journal.sqlite3")
+    answered = mutations.begin("POST", "pickem/pick", {"user_id": 5})
+    mutations.finish(answered)
+    mutations.begin("POST", "pickem/pick", {"user_id": 5})
+    kept = mutations.begin("POST", "pickem/pick", {"user_id": 6})
+
+    mutations.forget(lambda payload: payload.get("user_id") == 5)
+
+    keys = {key for (key,) in mutations.db.execute("SELECT key FROM journal")}
+    assert keys == {kept}
+    mutations.close()
@@ -0,0 +1,55 @@
+from pickem.leaderboard import Leaderboard
+
+
+def stats(user_id, correct, wrong):
+    return {
+        "user_id": user_id,
+        "username": "user{}".format(user_id),
+        "picks_made": correct + wrong,
+        "picks_correct": correct,
+        "picks_wrong": wrong,
+        "picks_correct_others": 0,
+    }
+
+
+def ranked_ids(leaderboard):
+    return [data["user_id"] for data in leaderboard.page(0, per_page=len(leaderboard))]
+
+
+def test_ranks_by_correct_then_fewest_wrong():
+    leaderboard = Leaderboard([stats(1, 3, 1), stats(2, 5, 4), stats(3, 5, 2)])
+    assert ranked_ids(leaderboard) == [3, 2, 1]
+    assert [leaderboard.rank(user_id) for user_id in (1, 2, 3)] == [3, 2, 1]
+    assert leaderboard.rank(99) is None
+
+
+def test_update_moves_user_to_new_rank():
+    leaderboard = Leaderboard([stats(1, 3, 1), stats(2, 5, 4), stats(3, 5, 2)])
+    leaderboard.update(1, picks_correct=3)
+    assert ranked_ids(leaderboard) == [1, 3, 2]
+    assert leaderboard.entries[1]["picks_correct"] == 6
+    assert len(leaderboard.keys) == 3
+
+
+def test_update_adds_unknown_user():
+    leaderboard = Leaderboard([stats(1, 1, 0)])
+    leaderboard.update(2, username="newcomer", picks_correct=2)
+    assert ranked_ids(leaderboard) == [2, 1]
+    assert leaderboard.entries[2]["username"] == "newcomer"
+
+
+def test_apply_closed_prompt_credits_correct_and_wrong_picks():
+    leaderboard = Leaderboard([stats(1, 0, 0), stats(2, 0, 0)])
+    picks = [{"user_id": 1, "choice_id": 10}, {"user_id": 2, "choice_id": 11}]
+    leaderboard.apply_closed_prompt(prompt_user_id=2, choice_result=10, picks=picks)
+    assert leaderboard.entries[1]["picks_correct"] == 1
+    assert leaderboard.entries[1]["picks_correct_others"] == 1
+    assert leaderboard.entries[2]["picks_wrong"] == 1
+    assert ranked_ids(leaderboard) == [1, 2]
+
+
+def test_update_leaves_source_stats_untouched():
+    source = [stats(1, 1, 0)]
+    leaderboard = Leaderboard(source)
+    leaderboard.update(1, picks_correct=1)
+    assert source[0]["picks_correct"] == 1
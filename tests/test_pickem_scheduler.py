@@ -0,0 +1,39 @@
+from pickem import scheduler
+from pickem.entities import Prompt
+from pickem.scheduler import ExpiryScheduler
+
+
+def make_prompt(prompt_id, expires_at="2000-01-01 00:00:00"):
+    return Prompt({
+        "id": prompt_id, "user_id": 1, "subject": "Prompt {}".format(prompt_id), "open": 1,
+        "choice_result": None, "picks": 0, "expires_at": expires_at,
+        "created_at": "2000-01-01 00:00:00", "updated_at": "2000-01-01 00:00:00",
+    })
+
+
+def test_handled_expirations_are_forgotten(monkeypatch):
+    monkeypatch.setattr(scheduler, "EXPIRED_PROMPTS_REMEMBERED", 2)
+    expiries = ExpiryScheduler(on_expired=None)
+    for prompt_id in range(1, 4):
+        expiries.schedule(1, make_prompt(prompt_id))
+
+    handled = expiries.pop_expired(now=10 ** 10)
+
+    assert [prompt.id for _, prompt, _ in handled] == [1, 2, 3]
+    assert expiries.prompts == {}
+    assert list(expiries.expired) == [2, 3]
+    expiries.schedule(1, make_prompt(3))
+    assert expiries.prompts == {}
+
+
+def test_prune_keeps_only_open_prompts():
+    expiries = ExpiryScheduler(on_expired=None)
+    expiries.schedule(1, make_prompt(1, "2999-01-01 00:00:00"))
+    expiries.schedule(1, make_prompt(2, "2999-01-01 00:00:00"))
+    expiries.schedule(1, make_prompt(3))
+    expiries.pop_expired(now=10 ** 10 - 1)
+
+    expiries.prune({2})
+
+    assert list(expiries.prompts) == [2]
+    assert list(expiries.expired) == []
@@ -0,0 +1,25 @@
+import pytest
+
+from pickem.utils import timestamps
+
+
+@pytest.fixture(autouse=True)
+def restore_default_timezone():
+    yield
+    timestamps.set_api_timezone()
+
+
+def test_api_timezone_can_be_overridden():
+    pacific = timestamps.timestamp_epoch("2024-01-01 00:00:00")
+
+    assert timestamps.set_api_timezone("UTC")
+    assert timestamps.API_TIMEZONE_NAME == "UTC"
+    assert timestamps.timestamp_epoch("2024-01-01 00:00:00") == 1704067200
+    assert pacific - 1704067200 == 8 * 3600
+
+
+def test_unknown_timezone_falls_back_to_local_time():
+    assert not timestamps.set_api_timezone("Not/AZone")
+    assert not timestamps.set_api_timezone("Not/AZone")
+    assert timestamps.API_TIMEZONE is None
+    assert timestamps.parse_timestamp("2024-01-01 00:00:00").tzinfo is None
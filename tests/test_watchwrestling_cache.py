@@ -0,0 +1,206 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from watchwrestling.errors import ResourceNotFound
+from watchwrestling.utils.cache import DiskCache, cached
+
+
+class Source:
+    def __init__(self):
+        self.calls = 0
+        self.version = 1
+
+    @cached(ttl=60, maxsize=8)
+    async def get_match(self, match_id):
+        self.calls += 1
+        return {"id": int(match_id), "version": self.version}
+
+    @cached(ttl=0.05)
+    async def get_short(self, match_id):
+        self.calls += 1
+        return self.version
+
+    @cached(ttl=0.05, stale_ttl=60)
+    async def get_stale(self, match_id):
+        self.calls += 1
+        return self.version
+
+    @cached(ttl=60, negative_ttl=60)
+    async def get_missing(self, match_id):
+        self.calls += 1
+        raise ResourceNotFound("No match found.")
+
+    @cached(ttl=60)
+    async def get_slow(self, match_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.version
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_results_are_cached_per_arguments():
+    async def scenario():
+        source = Source()
+        await source.get_match(1)
+        await source.get_match(1)
+        await source.get_match(2)
+        return source.calls
+
+    assert run(scenario()) == 2
+
+
+def test_digit_strings_share_the_int_key():
+    async def scenario():
+        source = Source()
+        await source.get_match("5")
+        await source.get_match(5)
+        assert source.calls == 1
+        Source.get_match.invalidate(source, 5)
+        source.version = 2
+        return await source.get_match("5"), source.calls
+
+    assert run(scenario()) == ({"id": 5, "version": 2}, 2)
+
+
+def test_expired_results_are_fetched_again():
+    async def scenario():
+        source = Source()
+        await source.get_short(1)
+        source.version = 2
+        await asyncio.sleep(0.06)
+        return await source.get_short(1), source.calls
+
+    assert run(scenario()) == (2, 2)
+
+
+def test_stale_results_are_served_while_refreshing():
+    async def scenario():
+        source = Source()
+        await source.get_stale(1)
+        source.version = 2
+        await asyncio.sleep(0.06)
+        stale = await source.get_stale(1)
+        # let the background refresh finish
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return stale, await source.get_stale(1), source.calls
+
+    assert run(scenario()) == (1, 2, 2)
+
+
+def test_not_found_is_remembered():
+    async def scenario():
+        source = Source()
+        for _ in range(2):
+            with pytest.raises(ResourceNotFound):
+                await source.get_missing(1)
+        return source.calls
+
+    assert run(scenario()) == 1
+
+
+def test_concurrent_calls_share_one_request():
+    async def scenario():
+        source = Source()
+        results = await asyncio.gather(*(source.get_slow(1) for _ in range(5)))
+        return results, source.calls
+
+    assert run(scenario()) == ([1] * 5, 1)
+
+
+def test_invalidate_where_and_all():
+    async def scenario():
+        source = Source()
+        for match_id in (1, 2, 3):
+            await source.get_match(match_id)
+        Source.get_match.invalidate_where(source, lambda key: key[0] >= 2)
+        assert Source.get_match.peek(source, 1) is not None
+        assert Source.get_match.peek(source, 2) is None
+        Source.get_match.invalidate_all(source)
+        return Source.get_match.peek(source, 1)
+
+    assert run(scenario()) is None
+
+
+def test_prime_stores_without_a_request():
+    async def scenario():
+        source = Source()
+        Source.get_match.prime(source, {"id": 7, "version": 9}, 7)
+        return await source.get_match("7"), source.calls
+
+    assert run(scenario()) == ({"id": 7, "version": 9}, 0)
+
+
+def test_disk_cache_round_trip_and_expiry(tmp_path):
+    disk = DiskCache(tmp_path / "cache.sqlite3")
+    disk.put("get_match", (5,), {"id": 5}, ttl=60)
+    disk.put("get_match", (6,), {"id": 6}, ttl=-1)
+    assert disk.get("get_match", (5,)) == {"id": 5}
+    assert disk.get("get_match", (6,)) is None
+    assert disk.get("get_superstar", (5,)) is None
+    disk.close()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    value = {"text": "x" * 90}
+    size = len(json.dumps(value))
+    disk = DiskCache(tmp_path / "cache.sqlite3", max_bytes=size * 4)
+    for match_id in range(4):
+        disk.put("get_match", (match_id,), value, ttl=60)
+        time.sleep(0.001)
+    # touching the oldest makes matches 1 and 2 the least recently used
+    disk.get("get_match", (0,))
+    disk.put("get_match", (4,), value, ttl=60)
+
+    # eviction goes down to 90% of the limit, so two entries make room
+    kept = [match_id for match_id in range(5) if disk.get("get_match", (match_id,)) is not None]
+    assert kept == [0, 3, 4]
+    assert disk.size <= disk.max_bytes
+    disk.close()
+
+
+def test_disk_cache_invalidation(tmp_path):
+    disk = DiskCache(tmp_path / "cache.sqlite3")
+    for match_id in range(3):
+        disk.put("get_match", (match_id,), {"id": match_id}, ttl=60)
+    disk.put("get_user", (1,), {"id": 1}, ttl=60)
+    disk.delete("get_match", (0,))
+    disk.delete_where("get_match", lambda key: key[0] == 1)
+    assert disk.get("get_match", (0,)) is None
+    assert disk.get("get_match", (1,)) is None
+    assert disk.get("get_match", (2,)) == {"id": 2}
+    disk.clear("get_match")
+    assert disk.get("get_match", (2,)) is None
+    assert disk.get("get_user", (1,)) == {"id": 1}
+    disk.close()
+
+
+def test_disk_cache_errors_do_not_raise(tmp_path):
+    disk = DiskCache(tmp_path / "cache.sqlite3")
+    disk.close()
+    disk.put("get_match", (1,), {"id": 1}, ttl=60)
+    assert disk.get("get_match", (1,)) is None
+    disk.delete("get_match", (1,))
+    disk.delete_where("get_match", lambda key: True)
+    disk.clear("get_match")
+    disk.evict()
+
+
+def test_disk_cache_is_cleared_when_the_scope_changes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    disk = DiskCache(path, scope="https://staging.example/")
+    disk.put("get_match", (1,), {"id": 1}, ttl=60)
+    disk.close()
+
+    disk = DiskCache(path, scope="https://staging.example/")
+    assert disk.get("get_match", (1,)) == {"id": 1}
+    disk.set_scope("https://api.example/")
+    assert disk.get("get_match", (1,)) is None
+    assert disk.size == 0
+    disk.close()
@@ -0,0 +1,42 @@
+from watchwrestling.entities import Match
+
+
+def make_match(**fields):
+    data = {
+        "id": 1,
+        "event": "Raw",
+        "date": "2026-10-19",
+        "match_type": "Singles",
+        "title": None,
+        "match_note": None,
+        "winner_note": None,
+        "bet_open": 1,
+        "completed": 0,
+        "team_won": None,
+        "user_rating_avg": None,
+        "base_pot": 100,
+        "total_pot": None,
+        "bet_multiplier": None,
+        "calc_last_updated": "2026-10-19 12:00:00",
+        "info_last_updated": "2026-10-19 12:00:00",
+        "team_list": [
+            {"team": 1, "bet_multiplier": 2, "members": "Alpha"},
+            {"team": 2, "bet_multiplier": 2, "members": "Bravo"},
+        ],
+    }
+    data.update(fields)
+    return Match(data)
+
+
+def test_render_cache_follows_edits_without_a_timestamp_change():
+    assert "Raw" in make_match().info_text()
+    assert "Smackdown" in make_match(event="Smackdown").info_text()
+    assert "(Intercontinental)" in make_match(title="Intercontinental").info_text()
+
+    renamed = make_match()
+    renamed.team_list[1]["members"] = "Charlie"
+    assert "Charlie" in renamed.info_text_short()
+
+
+def test_unrendered_fields_share_the_cached_render():
+    assert make_match().version() == make_match(info_last_updated="2026-10-20 09:00:00").version()
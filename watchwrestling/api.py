@@ -1,4 +1,11 @@
+import asyncio
+import json
 import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from importlib.util import find_spec
+from urllib.parse import urljoin
 
 import aiohttp
 
@@ -12,52 +19,366 @@ from .errors import (
     ConflictError,
     ValidationError,
 )
+from .utils.cache import cached, DiskCache
+from .utils.events import EventStream
+from .utils.jsonstream import iter_data_items
+from .utils.journal import MutationJournal, idempotency_key
+from .utils.metrics import Metrics
+from .utils.timestamps import DEFAULT_API_TIMEZONE_NAME, set_api_timezone
+
+# aiohttp decodes brotli responses when one of these is installed
+if find_spec("brotlicffi") or find_spec("brotli"):
+    ACCEPT_ENCODING = "br, gzip, deflate"
+else:
+    ACCEPT_ENCODING = "gzip, deflate"
 
 API_URL = "https://api.idleuser.com/"
 WEB_URL = "https://idleuser.com/"
+# raw GET response bodies kept with their ETag/Last-Modified for conditional requests
+CONDITIONAL_CACHE_SIZE = 256
+# unanswered mutations in the journal are replayed on load if they are newer than this
+JOURNAL_REPLAY_MAX_AGE = 3600
+# answers that show the API handled a mutation and turned it down
+REJECTED_ERRORS = (
+    BadRequest,
+    Unauthenticated,
+    InsufficientPrivileges,
+    ResourceNotFound,
+    MethodNotAllowed,
+    ConflictError,
+    ValidationError,
+)
+# payload fields naming what each mutation changes; a newer mutation of the same target supersedes older ones
+MUTATION_TARGETS = {
+    ("POST", "watchwrestling/rate"): ("user_id", "match_id"),
+    ("POST", "watchwrestling/bet"): ("user_id", "match_id"),
+    ("PATCH", "watchwrestling/bet"): ("user_id", "match_id"),
+}
+# leaderboard and user stats are served from cache and refreshed in the background
+# once older than their TTL, but never served older than the max staleness
+STATS_TTL = 60
+STATS_MAX_STALENESS = 900
+# a user's current bets are kept up to date locally as they bet, so they are refetched rarely
+CURRENT_BETS_TTL = 300
+CURRENT_BETS_MAX_STALENESS = 1800
+# seconds slow-changing results are also kept on disk, so a reloaded cog starts warm
+USER_PERSIST = 86400
+SUPERSTAR_PERSIST = 7 * 86400
+EVENTS_PERSIST = 6 * 3600
+FINISHED_MATCH_PERSIST = 6 * 3600
 
 log = logging.getLogger("red.idleuser-cogs.WatchWrestling")
 
 
+def close_when_opened(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+async def open_off_loop(opener, *args, **kwargs):
+    """Call a blocking `opener` in a worker thread.
+
+    If the caller is cancelled meanwhile, whatever the thread goes on to open is closed.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(opener, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(close_when_opened)
+        raise
+
+
+def decode_cached_body(body):
+    try:
+        return json.loads(body)
+    except UnicodeDecodeError:
+        return json.loads(body.decode("latin-1"))
+
+
 class IdleUserAPI:
     def __init__(self, bot):
         self.bot = bot
+        # (route, params) -> (etag, last_modified, data)
+        self.conditional_cache = OrderedDict()
+        self.metrics = Metrics()
+        self.disk_cache = None
+        self.journal = None
+        self.journal_replay_task = None
+        self.event_stream = EventStream(
+            self.get_event_stream_request, self.on_api_event, params={"topics": "watchwrestling"}
+        )
+        # match_id -> open bet match, kept current by the event stream once loaded
+        self.openbet_matches = None
+        self.openbet_matches_loaded_at = 0.0
 
     async def stored_auth_token(self):
         auth = await self.bot.get_shared_api_tokens("idleuser")
         return auth
 
+    async def get_api_url(self):
+        """Base URL of the API, overridable with the `api_url` shared API token."""
+        auth = await self.stored_auth_token()
+        api_url = auth.get("api_url") or API_URL
+        return api_url if api_url.endswith("/") else api_url + "/"
+
+    async def update_api_timezone(self):
+        """Time zone of API timestamps, overridable with the `timezone` shared API token."""
+        auth = await self.stored_auth_token()
+        name = auth.get("timezone") or DEFAULT_API_TIMEZONE_NAME
+        if not set_api_timezone(name):
+            log.warning("Time zone {} unavailable. API timestamps will use local time.".format(name))
+
+    async def get_event_stream_request(self):
+        """URL and headers of the API's event stream, routed by the `event_stream` shared API token."""
+        auth = await self.stored_auth_token()
+        route = auth.get("event_stream")
+        if not route:
+            return None
+        return urljoin(await self.get_api_url(), route), await self.get_headers()
+
+    async def update_event_stream(self):
+        """Subscribe to the API's event stream if it is configured, otherwise rely on polling alone."""
+        auth = await self.stored_auth_token()
+        if auth.get("event_stream"):
+            self.event_stream.start()
+        else:
+            self.event_stream.stop()
+
+    def on_api_event(self, event, data):
+        """Apply a match, bet or leaderboard change pushed by the API to the local caches."""
+        if event == "watchwrestling.match":
+            match = data["match"]
+            type(self).get_match_by_id.prime(self, match, match["id"])
+            if self.openbet_matches is not None:
+                if match["bet_open"]:
+                    self.openbet_matches[match["id"]] = match
+                else:
+                    self.openbet_matches.pop(match["id"], None)
+            if match["completed"]:
+                self.forget_current_bets_for_match(match["id"])
+        elif event == "watchwrestling.bet":
+            bet = data["bet"]
+            self.remember_current_bet(bet["user_id"], bet["match_id"], bet["points"], data.get("bet_on"))
+            self.invalidate_user_stats(bet["user_id"])
+        elif event == "watchwrestling.leaderboard":
+            season_id = data["season_id"]
+            self.invalidate_cached("get_leaderboard_by_season_id", season_id)
+            type(self).get_leaderboard_top_by_season_id.invalidate_where(self, lambda key: key[0] == season_id)
+            type(self).get_user_stats_by_season_id.invalidate_where(self, lambda key: key[1] == season_id)
+
     async def get_headers(self):
         auth = await self.stored_auth_token()
         auth_token = auth.get("auth_token", "")
-        headers = {"Authorization": "Bearer {}".format(auth_token)}
+        headers = {
+            "Authorization": "Bearer {}".format(auth_token),
+            "Accept-Encoding": ACCEPT_ENCODING,
+        }
         return headers
 
     async def get_idleusercom_response(self, route, params={}):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(API_URL + route, params=params) as resp:
-                return await self.handle_response(resp)
+        api_url = await self.get_api_url()
+        cache_key = (api_url, route, tuple(sorted(params.items())))
+        cached = self.conditional_cache.get(cache_key)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        with self.metrics.time_route("GET", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.get(api_url + route, params=params) as resp:
+                    if resp.status == 304 and cached is not None:
+                        self.conditional_cache.move_to_end(cache_key)
+                        # decode the stored body again so callers never share the cached objects
+                        return decode_cached_body(cached[2])["data"]
+                    data = await self.handle_response(resp, sample)
+                    self.store_conditional_response(cache_key, resp, await resp.read())
+                    return data
+
+    def store_conditional_response(self, cache_key, response, body):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.conditional_cache.pop(cache_key, None)
+            return
+        self.conditional_cache[cache_key] = (etag, last_modified, body)
+        self.conditional_cache.move_to_end(cache_key)
+        while len(self.conditional_cache) > CONDITIONAL_CACHE_SIZE:
+            self.conditional_cache.popitem(last=False)
+
+    async def post_idleusercom_response(self, route, payload={}, idempotency_key=None):
+        headers = await self.get_headers()
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("POST", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.post(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
 
-    async def post_idleusercom_response(self, route, payload={}):
+    async def patch_idleusercom_response(self, route, payload={}, idempotency_key=None):
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("PATCH", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.patch(api_url + route, json=payload) as resp:
+                    return await self.handle_response(resp, sample)
 
-    async def patch_idleusercom_response(self, route, payload={}):
+    async def iter_idleusercom_items(self, route, params={}):
+        """Yield the items of a list response one at a time while the body streams in."""
         headers = await self.get_headers()
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.patch(API_URL + route, json=payload) as resp:
-                return await self.handle_response(resp)
+        api_url = await self.get_api_url()
+        with self.metrics.time_route("GET", route) as sample:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.get(api_url + route, params=params) as resp:
+                    if resp.status != 200:
+                        await self.handle_response(resp, sample)
+                        return
+                    sample.bytes = resp.content_length or 0
+                    try:
+                        async for item in iter_data_items(resp.content):
+                            yield item
+                    except ValueError:
+                        raise Exception("Error decoding response.")
+
+    def mutation_sender(self, method):
+        return getattr(self, "{}_idleusercom_response".format(method.lower()))
+
+    def mutation_target(self, method, route, payload):
+        fields = MUTATION_TARGETS.get((method, route))
+        if fields is None:
+            return None
+        return "{} {}".format(route, json.dumps([payload.get(field) for field in fields]))
+
+    async def send_journaled(self, method, route, payload={}):
+        """Send a mutation with an idempotency key, recording it in the journal while it is unanswered.
 
-    async def handle_response(self, response):
+        Only a mutation whose answer was lost in transit stays pending. One the API
+        answered with an error was reported as failed, so it is never replayed.
+        """
+        send = self.mutation_sender(method)
+        if self.journal is None:
+            data = await send(route, payload, idempotency_key=idempotency_key())
+        else:
+            key = self.journal.begin(method, route, payload, self.mutation_target(method, route, payload))
+            try:
+                data = await send(route, payload, idempotency_key=key)
+            except REJECTED_ERRORS:
+                self.journal.finish(key, "rejected")
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # may or may not have been applied, so it is left pending for replay
+                raise
+            except Exception:
+                self.journal.finish(key, "failed")
+                raise
+            self.journal.finish(key)
+        self.after_mutation(method, route, payload)
+        return data
+
+    def after_mutation(self, method, route, payload, replayed=False):
+        """Update local state for a mutation the API accepted, just sent or `replayed` from the journal."""
+        if route == "watchwrestling/rate":
+            self.invalidate_cached("get_match_by_id", payload["match_id"])
+        elif route == "watchwrestling/bet":
+            self.invalidate_cached("get_match_by_id", payload["match_id"])
+            self.invalidate_user_stats(payload["user_id"])
+            if replayed:
+                # who the bet is on is not journaled, so the map is refetched rather than patched
+                self.invalidate_cached("get_user_current_bets_by_match", payload["user_id"])
+
+    async def delete_user_data(self, discord_id):
+        """Remove a Discord user's cached account and journaled mutations."""
+        try:
+            user_id = (await self.get_user_by_discord_id(discord_id))["id"]
+        except (IdleUserAPIError, aiohttp.ClientError, asyncio.TimeoutError):
+            user_id = None
+        self.invalidate_cached("get_user_by_discord_id", discord_id)
+        if user_id is not None and self.journal is not None:
+            self.journal.forget(lambda payload: str(payload.get("user_id")) == str(user_id))
+
+    async def open_disk_cache(self, path):
+        # scoped to the API base so results from another backend are not served after a switch
+        scope = await self.get_api_url()
+        try:
+            self.disk_cache = await open_off_loop(DiskCache, path, scope=scope)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Unable to open disk cache {}, caching in memory only: {}".format(path, e))
+
+    async def update_disk_cache_scope(self):
+        if self.disk_cache is not None:
+            self.disk_cache.set_scope(await self.get_api_url())
+
+    def close_disk_cache(self):
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+            self.disk_cache = None
+
+    async def open_journal(self, path):
+        """Open the mutation journal and replay what it has pending in the background."""
+        # creating the schema and compacting are disk-bound, so they run off the event loop
         try:
+            self.journal = await open_off_loop(MutationJournal, path)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Unable to open mutation journal {}, sending without it: {}".format(path, e))
+            return
+        # taken now so mutations sent after loading are not mistaken for lost ones
+        pending = self.journal.pending()
+        if pending:
+            self.journal_replay_task = asyncio.create_task(self.replay_journal(pending))
+
+    def close_journal(self):
+        if self.journal_replay_task is not None:
+            self.journal_replay_task.cancel()
+            self.journal_replay_task = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    async def replay_journal(self, pending):
+        """Resend mutations whose answer was lost, with their original idempotency keys."""
+        for key, method, route, payload, recorded_at in pending:
+            age = time.time() - recorded_at
+            if age > JOURNAL_REPLAY_MAX_AGE:
+                log.warning("Not replaying {} {} from {:.0f}s ago".format(method, route, age))
+                self.journal.finish(key, "expired")
+                continue
+            try:
+                await self.mutation_sender(method)(route, payload, idempotency_key=key)
+            except ConflictError:
+                # applied before the answer was lost
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+            except REJECTED_ERRORS as e:
+                log.info("Replayed {} {} was rejected: {}".format(method, route, e))
+                self.journal.finish(key, "rejected")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning("Unable to replay {} {}, leaving it for the next load: {}".format(method, route, e))
+            except Exception as e:
+                log.warning("Replayed {} {} failed: {}".format(method, route, e))
+                self.journal.finish(key, "failed")
+            else:
+                log.info("Replayed {} {}".format(method, route))
+                self.journal.finish(key)
+                self.after_mutation(method, route, payload, replayed=True)
+
+    async def handle_response(self, response, sample=None):
+        try:
+            # read first so decode time is measured apart from the transfer
+            body = await response.read()
+            started = time.perf_counter()
             data = await response.json()
         except UnicodeDecodeError:
             data = await response.json(encoding="latin-1")
         except Exception:
             raise Exception("Error decoding response.")
+        if sample is not None:
+            sample.bytes = len(body)
+            sample.decode_seconds = time.perf_counter() - started
         if response.status == 200:
             return data["data"]
         else:
@@ -80,6 +401,15 @@ class IdleUserAPI:
                 log.error(data)
                 raise IdleUserAPIError("{} - {}".format(response.status, error_msg))
 
+    def invalidate_cached(self, method_name, *args, **kwargs):
+        getattr(type(self), method_name).invalidate(self, *args, **kwargs)
+
+    def cached_age(self, method_name, *args, **kwargs):
+        return getattr(type(self), method_name).age(self, *args, **kwargs)
+
+    def invalidate_user_stats(self, user_id):
+        type(self).get_user_stats_by_season_id.invalidate_where(self, lambda key: key[0] == user_id)
+
     async def get_user_by_id(self, user_id):
         return await self.get_idleusercom_response(route="users/{}".format(user_id))
 
@@ -88,11 +418,13 @@ class IdleUserAPI:
             route="users/username/{}".format(username)
         )
 
+    @cached(ttl=600, maxsize=1024, stale_ttl=3000, persist=USER_PERSIST)
     async def get_user_by_discord_id(self, discord_id):
         return await self.get_idleusercom_response(
             route="users/discord/{}".format(discord_id)
         )
 
+    @cached(ttl=STATS_TTL, maxsize=1024, stale_ttl=STATS_MAX_STALENESS - STATS_TTL)
     async def get_user_stats_by_season_id(self, user_id, season_id):
         return await self.get_idleusercom_response(
             route="watchwrestling/stats/user/{}/season/{}".format(user_id, season_id)
@@ -108,20 +440,110 @@ class IdleUserAPI:
             route="watchwrestling/bets/user/{}/current/detail".format(user_id)
         )
 
+    @cached(ttl=CURRENT_BETS_TTL, maxsize=1024, stale_ttl=CURRENT_BETS_MAX_STALENESS - CURRENT_BETS_TTL)
+    async def get_user_current_bets_by_match(self, user_id):
+        """A user's current bets keyed by match id, updated in place by bets placed through the cog."""
+        try:
+            bets = await self.get_user_current_bets(user_id)
+        except ResourceNotFound:
+            bets = []
+        return {bet["match_id"]: bet for bet in bets}
+
+    async def submit_match_bet(self, user_id, match_id, team_id, points, bet_on=None, increase=False):
+        """Place a bet, or increase the existing one if `increase` or the API already has one.
+
+        Returns True if an existing bet was increased.
+        """
+        if not increase:
+            try:
+                await self.post_match_bet(user_id, match_id, team_id, points, bet_on=bet_on)
+                return False
+            except ConflictError:
+                # bet placed outside the cog since the current bets were fetched
+                pass
+        await self.patch_match_bet(user_id, match_id, team_id, points, bet_on=bet_on)
+        return True
+
+    def remember_current_bet(self, user_id, match_id, points, bet_on):
+        current_bets = type(self).get_user_current_bets_by_match.peek(self, user_id)
+        if current_bets is None:
+            return
+        bet = current_bets.setdefault(
+            match_id, {"match_id": match_id, "bet_on": bet_on, "potential_cut_points": None, "potential_cut_pct": None}
+        )
+        if bet.get("bet_amount") != points:
+            # the cut depends on the amount, so the cached one is stale until refetched
+            bet["potential_cut_points"] = None
+            bet["potential_cut_pct"] = None
+        bet["bet_amount"] = points
+        if bet_on:
+            bet["bet_on"] = bet_on
+
+    def forget_current_bets_for_match(self, match_id):
+        for entry in type(self).get_user_current_bets_by_match.cache_for(self).entries.values():
+            if entry.error is None:
+                entry.value.pop(match_id, None)
+
+    @cached(ttl=60, maxsize=16, stale_ttl=300)
     async def get_leaderboard_by_season_id(self, season_id):
         return await self.get_idleusercom_response(
             route="watchwrestling/stats/leaderboard/season/{}".format(season_id)
         )
 
+    def iter_leaderboard_by_season_id(self, season_id):
+        return self.iter_idleusercom_items(
+            route="watchwrestling/stats/leaderboard/season/{}".format(season_id)
+        )
+
+    @cached(ttl=STATS_TTL, maxsize=16, stale_ttl=STATS_MAX_STALENESS - STATS_TTL, negative_ttl=60)
+    async def get_leaderboard_top_by_season_id(self, season_id, limit=10):
+        top = []
+        stats_items = self.iter_leaderboard_by_season_id(season_id)
+        try:
+            async for stats in stats_items:
+                top.append(stats)
+                if len(top) >= limit:
+                    break
+        finally:
+            await stats_items.aclose()
+        return top
+
+    @cached(ttl=30, maxsize=256, stale_ttl=60, negative_ttl=60, persist=FINISHED_MATCH_PERSIST,
+            persist_if=lambda match: bool(match["completed"]))
     async def get_match_by_id(self, match_id):
         return await self.get_idleusercom_response(
             route="watchwrestling/matches/{}/detail".format(match_id)
         )
 
     async def get_openbet_matches(self):
-        return await self.get_idleusercom_response(
-            route="watchwrestling/matches/betopen/detail"
-        )
+        if self.openbet_matches is not None and self.event_stream.covers(self.openbet_matches_loaded_at):
+            if not self.openbet_matches:
+                raise ResourceNotFound("No open bet matches found.")
+            return list(self.openbet_matches.values())
+        loaded_at = time.monotonic()
+        try:
+            matches = await self.get_idleusercom_response(
+                route="watchwrestling/matches/betopen/detail"
+            )
+        except ResourceNotFound:
+            self.store_openbet_matches([], loaded_at)
+            raise
+        self.store_openbet_matches(matches, loaded_at)
+        return matches
+
+    def store_openbet_matches(self, matches, loaded_at):
+        if self.event_stream.connected:
+            self.openbet_matches = {match["id"]: match for match in matches}
+            self.openbet_matches_loaded_at = loaded_at
+
+    async def iter_openbet_matches(self):
+        if self.event_stream.connected:
+            # a full listing is kept and updated by match events instead of streamed every time
+            for match in await self.get_openbet_matches():
+                yield match
+            return
+        async for match in self.iter_idleusercom_items(route="watchwrestling/matches/betopen/detail"):
+            yield match
 
     async def get_current_match(self):
         return await self.get_idleusercom_response(
@@ -133,16 +555,19 @@ class IdleUserAPI:
             route="watchwrestling/matches/recent/detail"
         )
 
+    @cached(ttl=3600, maxsize=256, stale_ttl=86400, negative_ttl=300, persist=SUPERSTAR_PERSIST)
     async def get_superstar_search(self, keyword):
         return await self.get_idleusercom_response(
             route="watchwrestling/superstars/search/{}".format(keyword)
         )
 
+    @cached(ttl=3600, maxsize=512, stale_ttl=86400, negative_ttl=300, persist=SUPERSTAR_PERSIST)
     async def get_superstar_by_id(self, superstar_id):
         return await self.get_idleusercom_response(
             route="watchwrestling/superstars/{}".format(superstar_id)
         )
 
+    @cached(ttl=600, maxsize=1, stale_ttl=3600, negative_ttl=300, persist=EVENTS_PERSIST)
     async def get_future_events(self):
         return await self.get_idleusercom_response("watchwrestling/events/future")
 
@@ -152,28 +577,32 @@ class IdleUserAPI:
             "match_id": match_id,
             "rating": rating,
         }
-        return await self.post_idleusercom_response(
-            route="watchwrestling/rate", payload=payload
+        return await self.send_journaled(
+            "POST", route="watchwrestling/rate", payload=payload
         )
 
-    async def post_match_bet(self, user_id, match_id, team_id, points):
+    async def post_match_bet(self, user_id, match_id, team_id, points, bet_on=None):
         payload = {
             "user_id": user_id,
             "match_id": match_id,
             "team": team_id,
             "points": points,
         }
-        return await self.post_idleusercom_response(
-            route="watchwrestling/bet", payload=payload
+        data = await self.send_journaled(
+            "POST", route="watchwrestling/bet", payload=payload
         )
+        self.remember_current_bet(user_id, match_id, points, bet_on)
+        return data
 
-    async def patch_match_bet(self, user_id, match_id, team_id, points):
+    async def patch_match_bet(self, user_id, match_id, team_id, points, bet_on=None):
         payload = {
             "user_id": user_id,
             "match_id": match_id,
             "team": team_id,
             "points": points,
         }
-        return await self.patch_idleusercom_response(
-            route="watchwrestling/bet", payload=payload
+        data = await self.send_journaled(
+            "PATCH", route="watchwrestling/bet", payload=payload
         )
+        self.remember_current_bet(user_id, match_id, points, bet_on)
+        return data
@@ -1,9 +1,32 @@
 from datetime import datetime
+from functools import cached_property
 
 import discord
 
 from .api import WEB_URL
 from .utils import quickembed
+from .utils.cache import RenderCache
+
+# rendered match and superstar text/embeds, keyed by entity version
+render_cache = RenderCache()
+# match payload fields shown by Match.info_text_short, info_text and info_embed, besides team_list
+MATCH_RENDERED_FIELDS = (
+    "id",
+    "event",
+    "date",
+    "match_type",
+    "title",
+    "match_note",
+    "winner_note",
+    "bet_open",
+    "completed",
+    "team_won",
+    "user_rating_avg",
+    "base_pot",
+    "total_pot",
+    "bet_multiplier",
+    "calc_last_updated",
+)
 
 
 class User:
@@ -26,7 +49,7 @@ class User:
             }
         )
 
-    def stats_embed(self, data):
+    def stats_embed(self, data, data_age=None):
         embed = quickembed.general(desc="Season {}".format(data["season"]), user=self)
         embed.add_field(name="Wins", value=data["wins"], inline=True)
         embed.add_field(name="Losses", value=data["losses"], inline=True)
@@ -47,26 +70,39 @@ class User:
             value="{:,}".format(int(data["available_points"])),
             inline=True,
         )
+        footer = []
         if self.date_created:
-            embed.set_footer(
-                text="Member since: {}".format(self.date_created.split()[0])
-            )
+            footer.append("Member since: {}".format(self.date_created.split()[0]))
+        if data_age:
+            footer.append("Updated {}".format(data_age))
+        if footer:
+            embed.set_footer(text=" | ".join(footer))
         return embed
 
-    def bets_embed(self, data):
+    def bets_embed(self, data, data_age=None):
         embed = quickembed.general(desc="Current Bets", user=self)
         for bet in data:
-            bet_text = "`{:,}` points on `{}`\n**Potential Winnings:** `{:,}` ({:.3f}%)".format(
+            if bet["potential_cut_points"] is None:
+                # placed since the bets were last fetched
+                potential = "TBD"
+            else:
+                potential = "`{:,}` ({:.3f}%)".format(
+                    int(bet["potential_cut_points"]),
+                    float(bet["potential_cut_pct"]) * 100,
+                )
+            bet_text = "`{:,}` points on `{}`\n**Potential Winnings:** {}".format(
                 int(bet["bet_amount"]),
                 bet["bet_on"],
-                int(bet["potential_cut_points"]),
-                float(bet["potential_cut_pct"]) * 100,
+                potential,
             )
             embed.add_field(
                 name="[{}]".format(bet["match_id"]), value=bet_text, inline=False
             )
         if self.date_created:
-            embed.set_footer(text="All bets are final.")
+            footer = "All bets are final."
+            if data_age:
+                footer += " | Updated {}".format(data_age)
+            embed.set_footer(text=footer)
         return embed
 
 
@@ -93,6 +129,11 @@ class Superstar:
         return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
 
     def info_embed(self):
+        # age in the embed changes daily
+        key = ("superstar", self.id, self.last_updated, datetime.now().date())
+        return render_cache.get(key, self.render_info_embed)
+
+    def render_info_embed(self):
         embed = discord.Embed(color=quickembed.color["blue"])
         embed.set_author(
             name=self.name,
@@ -127,43 +168,32 @@ class Superstar:
 
 
 class Match:
+    """A view over a match payload from the API.
+
+    Fields are read from the payload on access and derived fields are computed on
+    first use, so wrapping a match to filter on a few fields costs one small object.
+    """
+
+    __slots__ = ("data", "__dict__")
+
     def __init__(self, data):
-        self.id = data["id"]
-        self.event_id = data["event_id"]
-        self.title_id = data["title_id"]
-        self.match_type_id = data["match_type_id"]
-        self.match_note = data["match_note"]
-        self.team_won = data["team_won"]
-        self.winner_note = data["winner_note"]
-        self.bet_open = data["bet_open"]
-        self.info_last_updated_by_id = data["info_last_updated_by_id"]
-        self.info_last_updated = data["info_last_updated"]
-        self.completed = data["completed"]
-        self.pot_valid = data["pot_valid"]
-        self.contestants = data["contestants"]
-        self.contestants_won = data["contestants_won"]
-        self.contestants_lost = data["contestants_lost"]
-        self.bet_multiplier = data["bet_multiplier"]
-        self.base_pot = data["base_pot"]
-        self.total_pot = data["total_pot"]
-        self.base_winner_pot = data["base_winner_pot"]
-        self.base_loser_pot = data["base_loser_pot"]
-        self.user_bet_cnt = data["user_bet_cnt"]
-        self.user_bet_winner_cnt = data["user_bet_winner_cnt"]
-        self.user_bet_loser_cnt = data["user_bet_loser_cnt"]
-        self.user_rating_avg = data["user_rating_avg"]
-        self.user_rating_cnt = data["user_rating_cnt"]
-        self.calc_last_updated = data["calc_last_updated"]
-        self.event = data["event"]
-        self.date = data["date"]
-        self.title = data["title"]
-        self.match_type = data["match_type"]
-        self.last_updated_by_username = data["last_updated_by_username"]
-        self.star_rating = "".join(
+        self.data = data
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @cached_property
+    def star_rating(self):
+        return "".join(
             ["★" if self.user_rating_avg and self.user_rating_avg >= i else "☆" for i in range(1, 6)]
         )
-        self.url = WEB_URL + "projects/matches/matches?match_id={}".format(self.id)
-        self.team_list = data["team_list"]
+
+    @cached_property
+    def url(self):
+        return WEB_URL + "projects/matches/matches?match_id={}".format(self.id)
 
     def team_id_by_member_name(self, name):
         name = name.lower()
@@ -178,7 +208,27 @@ class Match:
                 return team
         return False
 
+    def version(self):
+        """Key of the rendered text and embeds: every payload field they show.
+
+        The API's last-updated timestamps are not relied on, since edits such as a
+        corrected title or team line-up do not always move them.
+        """
+        return tuple(self.data.get(field) for field in MATCH_RENDERED_FIELDS) + tuple(
+            (team.get("team"), team.get("bet_multiplier"), team.get("members"))
+            for team in self.team_list
+        )
+
     def info_text_short(self):
+        return render_cache.get(("match_text_short",) + self.version(), self.render_info_text_short)
+
+    def info_text(self):
+        return render_cache.get(("match_text",) + self.version(), self.render_info_text)
+
+    def info_embed(self):
+        return render_cache.get(("match_embed",) + self.version(), self.render_info_embed)
+
+    def render_info_text_short(self):
         if self.title:
             return "{} | {} | {}".format(
                 self.match_type,
@@ -191,7 +241,7 @@ class Match:
                 " vs ".join([team["members"] for team in self.team_list]),
             )
 
-    def info_text(self):
+    def render_info_text(self):
         if self.completed:
             rating = "{0.star_rating} ({0.user_rating_avg})".format(self)
             pot = "{:,} ({}x) -> {:,}".format(
@@ -229,7 +279,7 @@ class Match:
             )
         )
 
-    def info_embed(self):
+    def render_info_embed(self):
         if self.completed:
             header = "[Match {0.id}] {0.star_rating} ({0.user_rating_avg:.3f})".format(
                 self
@@ -1,21 +1,84 @@
 import asyncio
 import logging
+import re
 from datetime import datetime
 
 import discord
 from redbot.core import commands
+from redbot.core.data_manager import cog_data_path
 
 from .api import IdleUserAPI, WEB_URL
 from .entities import User, Superstar, Match
-from .errors import ResourceNotFound, ValidationError
+from .errors import ResourceNotFound, ValidationError, IdleUserAPIError
 from .utils import quickembed
+from .utils.metrics import DiscordTimer
+from .utils.timestamps import parse_timestamp, format_age
 
 log = logging.getLogger("red.idleuser-cogs.WatchWrestling")
 
+# "points:superstar" pairs, e.g. "500:Roman Reigns 1,000:Becky Lynch"
+MULTIBET_PAIR = re.compile(r"(\d[\d,]*)\s*:\s*(.+?)(?=\s+\d[\d,]*\s*:|$)")
+MULTIBET_MAX = 10
+# bets submitted at once by a multibet
+MULTIBET_CONCURRENCY = 3
+
+
+def log_warm_up_failure(task):
+    # commands only wait for the warm-up, so nothing else would see it fail
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Startup work failed", exc_info=task.exception())
+
 
 class Matches(IdleUserAPI, commands.Cog):
     def __init__(self, bot):
-        self.bot = bot
+        super().__init__(bot)
+        self.discord_timer = DiscordTimer(bot.http)
+        self.warm_up_task = None
+
+    async def cog_load(self):
+        self.discord_timer.install()
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+        self.warm_up_task.add_done_callback(log_warm_up_failure)
+
+    async def cog_unload(self):
+        self.discord_timer.uninstall()
+        if self.warm_up_task:
+            self.warm_up_task.cancel()
+        self.event_stream.stop()
+        self.close_journal()
+        self.close_disk_cache()
+
+    async def warm_up(self):
+        """Startup work that does not need to hold up loading the cog.
+
+        Commands invoked before it is done wait for it in `cog_before_invoke`.
+        """
+        await self.update_api_timezone()
+        data_path = cog_data_path(self)
+        await self.open_disk_cache(data_path / "cache.sqlite3")
+        await self.open_journal(data_path / "journal.sqlite3")
+        await self.update_event_stream()
+
+    async def red_delete_data_for_user(self, *, requester, user_id):
+        if self.warm_up_task and not self.warm_up_task.done():
+            await asyncio.wait({self.warm_up_task})
+        await self.delete_user_data(user_id)
+
+    @commands.Cog.listener()
+    async def on_red_api_tokens_update(self, service_name, api_tokens):
+        if service_name == "idleuser":
+            await self.update_api_timezone()
+            await self.update_disk_cache_scope()
+            await self.update_event_stream()
+
+    async def cog_before_invoke(self, ctx):
+        self.metrics.command_started(ctx)
+        if self.warm_up_task and not self.warm_up_task.done():
+            # a command right after loading waits for the disk cache and journal instead of skipping them
+            await asyncio.wait({self.warm_up_task})
+
+    async def cog_after_invoke(self, ctx):
+        self.metrics.command_finished(ctx)
 
     async def grab_user(self, ctx, registration_required_message=False) -> User:
         try:
@@ -37,7 +100,8 @@ class Matches(IdleUserAPI, commands.Cog):
         user = await self.grab_user(ctx, True)
         if user.is_registered:
             user_stats_data = await self.get_user_stats_by_season_id(user.id, season)
-            await ctx.send(embed=user.stats_embed(user_stats_data))
+            data_age = self.cached_age("get_user_stats_by_season_id", user.id, season)
+            await ctx.send(embed=user.stats_embed(user_stats_data, data_age=format_age(data_age)))
 
     @commands.command(name="rumble", aliases=["royalrumble"])
     async def royalrumble_info(self, ctx):
@@ -56,10 +120,10 @@ class Matches(IdleUserAPI, commands.Cog):
             embed = quickembed.error(desc="No future events found", user=user)
             await ctx.send(embed=embed)
             return
-        current_date = datetime.now().date()
         embed_field_strings = []
         for event in event_list:
-            event_dt_object = datetime.strptime(event["date_time"], "%Y-%m-%d %H:%M:%S")
+            event_dt_object = parse_timestamp(event["date_time"])
+            current_date = datetime.now(event_dt_object.tzinfo).date()
             event_time_format = "R" if event_dt_object.date() == current_date else "f"
             epoch_time = int(event_dt_object.timestamp())
             embed_field_strings.append("<t:{}:{}> - **{}**".format(epoch_time, event_time_format, event["name"]))
@@ -106,7 +170,7 @@ class Matches(IdleUserAPI, commands.Cog):
     @commands.command(name="leaderboard", aliases=["top"])
     async def leaderboard(self, ctx, season=7):
         try:
-            stat_list = await self.get_leaderboard_by_season_id(season)
+            stat_list = await self.get_leaderboard_top_by_season_id(season, limit=10)
         except ResourceNotFound:
             embed = quickembed.error("Unable to retrieve leaderboard for season `{}`".format(season))
             await ctx.send(embed=embed)
@@ -120,11 +184,13 @@ class Matches(IdleUserAPI, commands.Cog):
         )
         lb = [
             "{}. {} ({:,})".format(i + 1, v["username"], int(v["total_points"]))
-            for i, v in enumerate(stat_list[:10])
+            for i, v in enumerate(stat_list)
         ]
         embed.add_field(
             name="\u200b", value="\n".join(lb) if lb else "Nothing found", inline=True
         )
+        data_age = self.cached_age("get_leaderboard_top_by_season_id", season, limit=10)
+        embed.set_footer(text="Updated {}".format(format_age(data_age)))
         await ctx.send(embed=embed)
 
     @commands.command(name="match", aliases=["match-info"])
@@ -139,30 +205,31 @@ class Matches(IdleUserAPI, commands.Cog):
 
     @commands.command(name="matches", aliases=["open-matches"])
     async def open_matches(self, ctx):
+        # matches are summarized as they stream in; only the first is kept in case it is the only one
+        first_match = None
+        match_fields = []
         try:
-            openbet_match_data = await self.get_openbet_matches()
+            async for match_data in self.iter_openbet_matches():
+                temp_match = Match(match_data)
+                if temp_match.match_type_id == 0:
+                    continue
+                if first_match is None:
+                    first_match = temp_match
+                match_fields.append(("[Match {}]".format(temp_match.id), temp_match.info_text_short()))
         except ResourceNotFound:
             embed = quickembed.error("Unable to retrieve any open matches")
             await ctx.send(embed=embed)
             return
 
-        openbet_matches = []
-        for match_data in openbet_match_data:
-            temp_match = Match(match_data)
-            if temp_match.match_type_id == 0:
-                continue
-            openbet_matches.append(temp_match)
-        if len(openbet_matches) == 1:
-            embed = openbet_matches[0].info_embed()
+        if len(match_fields) == 1:
+            embed = first_match.info_embed()
         else:
             embed = quickembed.info(desc="Short View - Use `!match [id]` for full view")
             embed.set_author(name="Open Bet Matches")
-            for match in openbet_matches:
-                if match.match_type_id == 0:
-                    continue
+            for name, value in match_fields:
                 embed.add_field(
-                    name="[Match {}]".format(match.id),
-                    value="{}".format(match.info_text_short()),
+                    name=name,
+                    value="{}".format(value),
                     inline=True,
                 )
         await ctx.send(embed=embed)
@@ -220,10 +287,10 @@ class Matches(IdleUserAPI, commands.Cog):
         bet = int(bet.replace(",", ""))
         match = None
         increase_bet_attempt = False
-        # find open matches matching superstar name
+        # find open matches matching superstar name, reading no further than the first hit
+        openbet_matches = self.iter_openbet_matches()
         try:
-            openbet_match_data = await self.get_openbet_matches()
-            for match_data in openbet_match_data:
+            async for match_data in openbet_matches:
                 temp_match = Match(match_data)
                 if temp_match.match_type_id == 0:
                     continue
@@ -233,6 +300,8 @@ class Matches(IdleUserAPI, commands.Cog):
         except ResourceNotFound:
             embed = quickembed.error(desc="No open bet matches available", user=user)
             await ctx.send(embed=embed)
+        finally:
+            await openbet_matches.aclose()
         # if match not found, prepare error message
         if not match:
             error_msg = "Unable to find an open match for contestant `{}`".format(
@@ -243,11 +312,7 @@ class Matches(IdleUserAPI, commands.Cog):
         # if match found, gather info and confirm bet
         else:
             # check if already bet
-            try:
-                await self.get_bet_by_id(match.id, user.id)
-                increase_bet_attempt = True
-            except ResourceNotFound:
-                pass
+            increase_bet_attempt = match.id in await self.get_user_current_bets_by_match(user.id)
             # gather team info by superstar name
             team_id = match.team_id_by_member_name(superstar_name)
             team = match.team_by_id(team_id)
@@ -291,15 +356,16 @@ class Matches(IdleUserAPI, commands.Cog):
                 if str(reaction.emoji) == "✅":
                     # process bet
                     try:
-                        if increase_bet_attempt:
-                            await self.patch_match_bet(user.id, match.id, team_id, bet)
+                        increased = await self.submit_match_bet(
+                            user.id, match.id, team_id, bet, bet_on=team["members"], increase=increase_bet_attempt
+                        )
+                        if increased:
                             embed = quickembed.success(
                                 desc="Increased bet to `{:,}` on `{}`".format(bet, team["members"]),
                                 footer="All bets are final. You can only increase existing bets.",
                                 user=user,
                             )
                         else:
-                            await self.post_match_bet(user.id, match.id, team_id, bet)
                             embed = quickembed.success(
                                 desc="Placed `{:,}` point bet on `{}`".format(bet, team["members"]),
                                 footer="All bets are final. You can only increase existing bets.",
@@ -312,13 +378,133 @@ class Matches(IdleUserAPI, commands.Cog):
             await confirm_message.edit(embed=embed)
             await confirm_message.clear_reactions()
 
+    @commands.command(name="multibet", aliases=["multi-bet", "bet-card"])
+    async def multi_bet_match(self, ctx, *, bets: str):
+        """Bet on several open matches with one confirmation.
+
+        Example:
+            - `[p]multibet 500:Roman Reigns 1,000:Becky Lynch 250:Cody`
+
+        **Arguments:**
+
+        - `<bets>` Up to 10 `points:superstar` pairs.
+        """
+        user = await self.grab_user(ctx, True)
+        if not user.is_registered:
+            return
+        pairs = MULTIBET_PAIR.findall(bets)
+        if not pairs or len(pairs) > MULTIBET_MAX:
+            embed = quickembed.error(
+                desc="Use up to {} `points:superstar` pairs, e.g. `500:Roman 250:Becky`".format(MULTIBET_MAX),
+                user=user,
+            )
+            await ctx.send(embed=embed)
+            return
+        # resolve every pair against one snapshot of the open matches
+        try:
+            openbet_matches = [Match(match_data) for match_data in await self.get_openbet_matches()]
+        except ResourceNotFound:
+            embed = quickembed.error(desc="No open bet matches available", user=user)
+            await ctx.send(embed=embed)
+            return
+        openbet_matches = [match for match in openbet_matches if match.match_type_id != 0]
+        current_bet_match_ids = set(await self.get_user_current_bets_by_match(user.id))
+
+        planned = []
+        unresolved = []
+        for points, superstar_name in pairs:
+            bet = int(points.replace(",", ""))
+            superstar_name = superstar_name.strip()
+            match = next(
+                (match for match in openbet_matches if superstar_name.lower() in match.contestants.lower()), None
+            )
+            if not match:
+                unresolved.append("`{}` - no open match found".format(superstar_name))
+            elif any(match.id == planned_match.id for planned_match, *_ in planned):
+                unresolved.append("`{}` - already betting on Match {} above".format(superstar_name, match.id))
+            else:
+                team_id = match.team_id_by_member_name(superstar_name)
+                increase = match.id in current_bet_match_ids
+                planned.append((match, team_id, match.team_by_id(team_id), bet, increase))
+        if not planned:
+            embed = quickembed.error(desc="\n".join(unresolved), user=user)
+            await ctx.send(embed=embed)
+            return
+
+        confirm_embed = quickembed.question(
+            desc="**Place these {} bets?**".format(len(planned)),
+            footer="All bets are final. You can only increase existing bets.",
+            user=user,
+        )
+        for match, team_id, team, bet, increase in planned:
+            confirm_embed.add_field(
+                name="Match {}{}".format(match.id, " (increase)" if increase else ""),
+                value="`{:,}` on `{}`\n{}".format(bet, team["members"], match.info_text_short()),
+                inline=False,
+            )
+        if unresolved:
+            confirm_embed.add_field(name="Skipped", value="\n".join(unresolved), inline=False)
+        confirm_message = await ctx.send(embed=confirm_embed)
+        await confirm_message.add_reaction("✅")
+        await confirm_message.add_reaction("❎")
+        try:
+            reaction, author = await self.bot.wait_for(
+                "reaction_add",
+                check=lambda reaction, author: author == ctx.author
+                                               and reaction.message.id == confirm_message.id
+                                               and str(reaction.emoji) in ["✅", "❎"],
+                timeout=30.0,
+            )
+        except asyncio.TimeoutError:
+            reaction = False
+            embed = quickembed.error(
+                desc="Bets cancelled.",
+                footer="Took too long to confirm. Try again.",
+                user=user,
+            )
+        if reaction:
+            if str(reaction.emoji) == "✅":
+                semaphore = asyncio.Semaphore(MULTIBET_CONCURRENCY)
+
+                async def submit(match, team_id, team, bet, increase):
+                    async with semaphore:
+                        try:
+                            increased = await self.submit_match_bet(
+                                user.id, match.id, team_id, bet, bet_on=team["members"], increase=increase
+                            )
+                        except IdleUserAPIError as e:
+                            return "❎ Match {}: {}".format(match.id, e)
+                        except Exception:
+                            # reported as this bet's failure so the others placed are still listed
+                            log.exception("Error submitting bet on match {}".format(match.id))
+                            return "❎ Match {}: Unexpected error, check `!bets`".format(match.id)
+                    verb = "Increased bet to" if increased else "Placed"
+                    return "✅ Match {}: {} `{:,}` on `{}`".format(match.id, verb, bet, team["members"])
+
+                results = await asyncio.gather(*(submit(*planned_bet) for planned_bet in planned))
+                failed = sum(result.startswith("❎") for result in results)
+                if failed:
+                    desc = "**{} of {} bets placed**\n".format(len(results) - failed, len(results))
+                    embed = quickembed.notice(desc=desc + "\n".join(results), user=user)
+                else:
+                    desc = "**{} bets placed**\n".format(len(results))
+                    embed = quickembed.success(desc=desc + "\n".join(results), user=user)
+                if unresolved:
+                    embed.add_field(name="Skipped", value="\n".join(unresolved), inline=False)
+                embed.set_footer(text="All bets are final. You can only increase existing bets.")
+            else:
+                embed = quickembed.error(desc="Bets cancelled.", footer="Requested by user.", user=user)
+        await confirm_message.edit(embed=embed)
+        await confirm_message.clear_reactions()
+
     @commands.command(name="bets")
     async def user_current_bets(self, ctx):
         user = await self.grab_user(ctx, True)
         if user.is_registered:
-            try:
-                bets_info = await self.get_user_current_bets(user.id)
-                embed = user.bets_embed(bets_info)
-            except ResourceNotFound:
+            current_bets = await self.get_user_current_bets_by_match(user.id)
+            if current_bets:
+                data_age = self.cached_age("get_user_current_bets_by_match", user.id)
+                embed = user.bets_embed(list(current_bets.values()), data_age=format_age(data_age))
+            else:
                 embed = quickembed.error(desc="No current bets found", user=user)
             await ctx.send(embed=embed)
@@ -0,0 +1,354 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+import discord
+
+from ..errors import ResourceNotFound
+
+log = logging.getLogger("red.idleuser-cogs.WatchWrestling")
+
+
+class CacheEntry:
+    __slots__ = ("value", "error", "stored_at", "expires_at", "stale_until")
+
+    def __init__(self, value=None, error=None, ttl=0, stale_ttl=0):
+        self.value = value
+        self.error = error
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.stale_until = self.expires_at + stale_ttl
+
+    def result(self):
+        if self.error is not None:
+            raise type(self.error)(*self.error.args)
+        return self.value
+
+
+class RouteCache:
+    """Size-bounded LRU of results for one API method, plus its in-flight requests."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.pending = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+
+# total size of the values a DiskCache keeps before evicting the least recently used
+DISK_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+class DiskCache:
+    """SQLite store under the in-memory caches for results that are slow to change.
+
+    Lets a reloaded cog start warm instead of refetching everything. Values are
+    kept as JSON with their own TTL, and the least recently used are evicted once
+    their total size passes `max_bytes`. Everything stored belongs to one `scope`,
+    the API base URL, and is dropped when the scope changes.
+    """
+
+    def __init__(self, path, max_bytes=DISK_CACHE_MAX_BYTES, scope=None):
+        self.max_bytes = max_bytes
+        # opened in a worker thread, then only used from the event loop
+        self.db = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+        try:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL, PRIMARY KEY (name, key))"
+            )
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if scope is not None:
+                self.set_scope(scope)
+        except sqlite3.Error:
+            # e.g. not a database; the caller carries on without it
+            self.db.close()
+            raise
+
+    def close(self):
+        self.db.close()
+
+    def set_scope(self, scope):
+        """Clear the cache if it was filled under a different scope."""
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'scope'").fetchone()
+            if row is not None and row[0] == scope:
+                return
+            self.db.execute("DELETE FROM cache")
+            self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('scope', ?)", (scope,))
+            self.size = 0
+        except sqlite3.Error as e:
+            log.warning("Unable to set disk cache scope: {}".format(e))
+
+    def get(self, name, key):
+        """The stored value, or None if there is none or it expired."""
+        now = time.time()
+        key = json.dumps(key)
+        try:
+            row = self.db.execute(
+                "SELECT value, expires_at FROM cache WHERE name = ? AND key = ?", (name, key)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            self.db.execute("UPDATE cache SET used_at = ? WHERE name = ? AND key = ?", (now, name, key))
+        except sqlite3.Error as e:
+            log.warning("Unable to read disk cache: {}".format(e))
+            return None
+        return json.loads(row[0])
+
+    def put(self, name, key, value, ttl):
+        now = time.time()
+        value = json.dumps(value)
+        try:
+            self.delete(name, key)
+            self.db.execute(
+                "INSERT INTO cache (name, key, value, size, expires_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, json.dumps(key), value, len(value), now + ttl, now),
+            )
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self.evict()
+        except sqlite3.Error as e:
+            log.warning("Unable to write disk cache: {}".format(e))
+
+    def evict(self):
+        try:
+            self.db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            # down to 90% so every put after the limit does not evict again
+            excess = self.size - self.max_bytes * 0.9
+            if excess <= 0:
+                return
+            rows = self.db.execute("SELECT name, key, size FROM cache ORDER BY used_at").fetchall()
+            evicted = []
+            for name, key, size in rows:
+                if excess <= 0:
+                    break
+                evicted.append((name, key))
+                excess -= size
+            self.db.executemany("DELETE FROM cache WHERE name = ? AND key = ?", evicted)
+            self.size -= sum(size for _, _, size in rows[:len(evicted)])
+        except sqlite3.Error as e:
+            log.warning("Unable to evict from disk cache: {}".format(e))
+
+    # invalidations run right after mutations the API accepted, so a failure here
+    # is logged rather than raised into the command
+
+    def delete(self, name, key):
+        key = json.dumps(key)
+        try:
+            row = self.db.execute("SELECT size FROM cache WHERE name = ? AND key = ?", (name, key)).fetchone()
+            if row is not None:
+                self.db.execute("DELETE FROM cache WHERE name = ? AND key = ?", (name, key))
+                self.size -= row[0]
+        except sqlite3.Error as e:
+            log.warning("Unable to delete from disk cache: {}".format(e))
+
+    def delete_where(self, name, predicate):
+        try:
+            rows = self.db.execute("SELECT key FROM cache WHERE name = ?", (name,)).fetchall()
+        except sqlite3.Error as e:
+            log.warning("Unable to delete from disk cache: {}".format(e))
+            return
+        for (key,) in rows:
+            if predicate(tuple(json.loads(key))):
+                self.delete(name, json.loads(key))
+
+    def clear(self, name):
+        try:
+            self.db.execute("DELETE FROM cache WHERE name = ?", (name,))
+            self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        except sqlite3.Error as e:
+            log.warning("Unable to clear disk cache: {}".format(e))
+
+
+def key_part(value):
+    """Ids typed in commands arrive as digit strings; cache them under the int the API uses."""
+    if isinstance(value, str) and value.isascii() and value.isdecimal():
+        return int(value)
+    return value
+
+
+def cached(ttl, maxsize=128, stale_ttl=0, negative_ttl=0, persist=0, persist_if=None):
+    """Cache the results of an async API method on the instance it is called on.
+
+    - `ttl` seconds a result is served without asking the API.
+    - `stale_ttl` further seconds an expired result is still served while a single
+      background request refreshes it. A failed refresh keeps the last good result,
+      so `ttl + stale_ttl` is the most out of date a result can be.
+    - `negative_ttl` seconds a `ResourceNotFound` is remembered and re-raised.
+    - `persist` seconds a result is also kept in the instance's `disk_cache`, if
+      it has one open and `persist_if(result)` allows it. The disk is only read
+      when a result is not in memory at all, e.g. after a reload.
+
+    Digit-string arguments are keyed as ints, so an id typed in a command and the
+    same id from the API share one entry. Concurrent calls for the same arguments
+    share one request. The wrapper has
+    `invalidate(instance, *args, **kwargs)`, `invalidate_where(instance, predicate)`
+    and `invalidate_all(instance)` for methods that change the cached data,
+    `age(instance, *args, **kwargs)` for how old the cached result is,
+    `peek(instance, *args, **kwargs)` for the cached result without a request, and
+    `prime(instance, value, *args, **kwargs)` to store a result learned elsewhere.
+    """
+
+    def decorator(func):
+        name = func.__name__
+        signature = inspect.signature(func)
+
+        def cache_for(instance) -> RouteCache:
+            caches = instance.__dict__.setdefault("route_caches", {})
+            if name not in caches:
+                caches[name] = RouteCache(maxsize)
+            return caches[name]
+
+        def make_key(instance, args, kwargs):
+            bound = signature.bind(instance, *args, **kwargs)
+            bound.apply_defaults()
+            return tuple(key_part(value) for value in bound.arguments.values())[1:]
+
+        def disk_for(instance):
+            return getattr(instance, "disk_cache", None) if persist else None
+
+        def store_value(instance, store, key, value):
+            store.put(key, CacheEntry(value=value, ttl=ttl, stale_ttl=stale_ttl))
+            disk = disk_for(instance)
+            if disk is not None and value is not None and (persist_if is None or persist_if(value)):
+                disk.put(name, key, value, persist)
+
+        async def fetch(instance, store, key, args, kwargs):
+            try:
+                value = await func(instance, *args, **kwargs)
+            except ResourceNotFound as e:
+                if negative_ttl:
+                    store.put(key, CacheEntry(error=e, ttl=negative_ttl))
+                raise
+            else:
+                store_value(instance, store, key, value)
+                return value
+            finally:
+                store.pending.pop(key, None)
+
+        def load(instance, store, key, args, kwargs):
+            task = store.pending.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fetch(instance, store, key, args, kwargs))
+                task.add_done_callback(log_refresh_error)
+                store.pending[key] = task
+            return task
+
+        def log_refresh_error(task):
+            if not task.cancelled() and task.exception() is not None:
+                if not isinstance(task.exception(), ResourceNotFound):
+                    log.debug("{} request failed: {}".format(name, task.exception()))
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            store = cache_for(self)
+            key = make_key(self, args, kwargs)
+            entry = store.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                if now < entry.expires_at:
+                    return entry.result()
+                if now < entry.stale_until:
+                    load(self, store, key, args, kwargs)
+                    return entry.result()
+                store.discard(key)
+            elif disk_for(self) is not None:
+                value = disk_for(self).get(name, key)
+                if value is not None:
+                    store.put(key, CacheEntry(value=value, ttl=ttl, stale_ttl=stale_ttl))
+                    return value
+            # shielded so a cancelled caller does not cancel a request others are waiting on
+            return await asyncio.shield(load(self, store, key, args, kwargs))
+
+        def invalidate(instance, *args, **kwargs):
+            key = make_key(instance, args, kwargs)
+            cache_for(instance).discard(key)
+            if disk_for(instance) is not None:
+                disk_for(instance).delete(name, key)
+
+        def invalidate_where(instance, predicate):
+            cache_for(instance).discard_where(predicate)
+            if disk_for(instance) is not None:
+                disk_for(instance).delete_where(name, predicate)
+
+        def invalidate_all(instance):
+            cache_for(instance).clear()
+            if disk_for(instance) is not None:
+                disk_for(instance).clear(name)
+
+        def age(instance, *args, **kwargs):
+            entry = cache_for(instance).entries.get(make_key(instance, args, kwargs))
+            return None if entry is None else time.monotonic() - entry.stored_at
+
+        def peek(instance, *args, **kwargs):
+            entry = cache_for(instance).entries.get(make_key(instance, args, kwargs))
+            return None if entry is None or entry.error is not None else entry.value
+
+        def prime(instance, value, *args, **kwargs):
+            store_value(instance, cache_for(instance), make_key(instance, args, kwargs), value)
+
+        wrapper.invalidate = invalidate
+        wrapper.invalidate_where = invalidate_where
+        wrapper.invalidate_all = invalidate_all
+        wrapper.age = age
+        wrapper.peek = peek
+        wrapper.prime = prime
+        wrapper.cache_for = cache_for
+        return wrapper
+
+    return decorator
+
+
+class RenderCache:
+    """Size-bounded LRU of rendered text and embeds, keyed by what they were rendered from.
+
+    Embeds are handed out as copies so callers can add to them freely.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key, render):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            rendered = self.entries[key]
+        else:
+            rendered = render()
+            self.entries[key] = rendered
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return rendered.copy() if isinstance(rendered, discord.Embed) else rendered
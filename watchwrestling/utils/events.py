@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+log = logging.getLogger("red.idleuser-cogs.WatchWrestling")
+
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 60
+# the server sends a comment at least this often, so a quieter connection is dead
+READ_TIMEOUT_SECONDS = 90
+
+
+async def iter_server_sent_events(content):
+    """Yield `(event, data)` pairs from a text/event-stream body."""
+    event, data = "message", []
+    async for line in content:
+        line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            # heartbeat comment
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+
+class EventStream:
+    """Keeps a server-sent events subscription to the API open.
+
+    Each event's JSON data is handed to `on_event(event, data)`. Dropped
+    connections are retried with backoff. Events are not replayed across
+    reconnects, so `covers(since)` only holds for data loaded while the current
+    connection was already up; anything older is still refreshed by polling.
+    """
+
+    def __init__(self, connect, on_event, params=None):
+        # async callable returning the stream's (url, headers), or None when it is not configured
+        self.connect = connect
+        self.on_event = on_event
+        self.params = params or {}
+        self.task = None
+        self.connected_at = None
+        self.received = 0
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    @property
+    def connected(self):
+        return self.connected_at is not None
+
+    def covers(self, since):
+        """Whether data loaded at monotonic time `since` has been kept current by events."""
+        return self.connected_at is not None and self.connected_at <= since
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.connected_at = None
+
+    async def run(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                if await self.listen():
+                    delay = RECONNECT_MIN_SECONDS
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                log.debug("Event stream disconnected: {}".format(e))
+            finally:
+                self.connected_at = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def listen(self):
+        """Read the stream until it closes. Returns True if it connected."""
+        request = await self.connect()
+        if request is None:
+            return False
+        url, headers = request
+        headers = dict(headers, Accept="text/event-stream")
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=READ_TIMEOUT_SECONDS)
+        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+            async with session.get(url, params=self.params) as resp:
+                if resp.status != 200:
+                    log.warning("Event stream unavailable: {} {}".format(resp.status, resp.reason))
+                    return False
+                self.connected_at = time.monotonic()
+                log.debug("Event stream connected")
+                async for event, data in iter_server_sent_events(resp.content):
+                    self.received += 1
+                    try:
+                        self.on_event(event, json.loads(data))
+                    except Exception:
+                        log.exception("Error applying {} event".format(event))
+        return True
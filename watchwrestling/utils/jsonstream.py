@@ -0,0 +1,85 @@
+import codecs
+import json
+
+WHITESPACE = " \t\n\r"
+
+
+class _StreamBuffer:
+    """Text buffer over an aiohttp StreamReader that only holds unparsed input."""
+
+    def __init__(self, content, chunk_size):
+        self.chunks = content.iter_chunked(chunk_size)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.json_decoder = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+
+    async def fill(self):
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            return False
+        self.text = self.text[self.pos:] + self.text_decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    async def peek(self):
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not await self.fill():
+                raise ValueError("Unexpected end of JSON document.")
+
+    async def expect(self, characters):
+        character = await self.peek()
+        if character not in characters:
+            raise ValueError("Expected one of {!r} but found {!r}.".format(characters, character))
+        self.pos += 1
+        return character
+
+    async def value(self):
+        await self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.text, self.pos)
+                # numbers and literals that touch the end of the buffer may continue in the next chunk
+                if end < len(self.text) or isinstance(value, (dict, list, str)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                value, end = None, None
+            if not await self.fill():
+                if end is None:
+                    raise ValueError("Unable to decode JSON value.")
+                self.pos = end
+                return value
+
+
+async def iter_data_items(content, chunk_size=16384):
+    """Yield the items of the top-level `data` array of an API response as they arrive.
+
+    Only the item being decoded and the current chunk are held in memory.
+    """
+    stream = _StreamBuffer(content, chunk_size)
+    await stream.expect("{")
+    if await stream.peek() == "}":
+        return
+    while True:
+        key = await stream.value()
+        await stream.expect(":")
+        if key == "data" and await stream.peek() == "[":
+            await stream.expect("[")
+            if await stream.peek() == "]":
+                stream.pos += 1
+            else:
+                while True:
+                    yield await stream.value()
+                    if await stream.expect(",]") == "]":
+                        break
+        else:
+            await stream.value()
+        if await stream.expect(",}") == "}":
+            return